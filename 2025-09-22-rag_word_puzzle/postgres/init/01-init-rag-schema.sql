@@ -7,6 +7,20 @@ CREATE EXTENSION IF NOT EXISTS vector;
 -- Create a schema for RAG-related tables
 CREATE SCHEMA IF NOT EXISTS rag;
 
+-- Collection registry: each collection is a corpus embedded with one model
+-- at one dimension. The default collection uses rag.embeddings; others get
+-- their own rag.embeddings_<name> table (see `rag-magic collection create`).
+CREATE TABLE IF NOT EXISTS rag.collections (
+    name TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    normalize BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO rag.collections (name, model, dimension)
+    VALUES ('default', 'models/text-embedding-004', 768)
+    ON CONFLICT (name) DO NOTHING;
+
 -- Create documents table to store original documents
 CREATE TABLE IF NOT EXISTS rag.documents (
     id SERIAL PRIMARY KEY,
@@ -15,10 +29,12 @@ CREATE TABLE IF NOT EXISTS rag.documents (
     source VARCHAR(255),
     metadata JSONB DEFAULT '{}',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    collection TEXT NOT NULL DEFAULT 'default'
+        REFERENCES rag.collections(name) ON DELETE CASCADE
 );
 
--- Create embeddings table to store vector embeddings
+-- Create embeddings table to store vector embeddings (default collection)
 CREATE TABLE IF NOT EXISTS rag.embeddings (
     id SERIAL PRIMARY KEY,
     document_id INTEGER REFERENCES rag.documents(id) ON DELETE CASCADE,
@@ -26,16 +42,47 @@ CREATE TABLE IF NOT EXISTS rag.embeddings (
     content TEXT NOT NULL,
     embedding vector(768), -- Gemini text-embedding-004 dimension
     metadata JSONB DEFAULT '{}',
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- Lexical search; 'simple' keeps rare tokens exactly (no stemming or stop words)
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
 );
 
 -- Create index for faster similarity search
+-- HNSW needs no training data, so it is valid on an empty table. Tune recall
+-- per query with hnsw.ef_search, or rebuild with `rag-magic index build`
+-- (e.g. ivfflat with lists derived from the row count).
 CREATE INDEX IF NOT EXISTS embeddings_embedding_idx ON rag.embeddings 
-USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 
 -- Create index for document lookups
 CREATE INDEX IF NOT EXISTS embeddings_document_id_idx ON rag.embeddings(document_id);
 CREATE INDEX IF NOT EXISTS documents_source_idx ON rag.documents(source);
+CREATE INDEX IF NOT EXISTS documents_collection_source_idx ON rag.documents(collection, source);
+
+-- Create indexes for filtered search (query --source-glob / --meta): prefix
+-- LIKE on source within a collection, and jsonb containment (@>) on metadata
+CREATE INDEX IF NOT EXISTS documents_collection_source_pattern_idx
+    ON rag.documents(collection, source varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS documents_metadata_idx
+    ON rag.documents USING gin (metadata jsonb_path_ops);
+
+-- Create index for lexical (full-text) search
+CREATE INDEX IF NOT EXISTS embeddings_content_tsv_idx ON rag.embeddings USING gin (content_tsv);
+
+-- Track schema migrations (see rag_magic/src/rag_magic/migrations.py). This
+-- script already includes every migration listed here; older databases are
+-- upgraded with `rag-magic migrate`.
+CREATE TABLE IF NOT EXISTS rag.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO rag.schema_migrations (version, name) VALUES
+    (1, 'index_friendly_similarity_search'),
+    (2, 'content_tsvector'),
+    (3, 'collections'),
+    (4, 'document_filter_indexes')
+ON CONFLICT (version) DO NOTHING;
 
 -- Create a function to update the updated_at timestamp
 CREATE OR REPLACE FUNCTION rag.update_updated_at_column()
@@ -64,17 +111,24 @@ RETURNS TABLE (
     metadata jsonb
 ) AS $$
 BEGIN
+    -- Index-ordered top-k first, threshold second: a WHERE on the distance
+    -- would stop the ANN index from serving ORDER BY ... LIMIT directly,
+    -- and the distance is computed once per row.
     RETURN QUERY
-    SELECT 
-        e.id,
-        e.document_id,
-        e.content,
-        1 - (e.embedding <=> query_embedding) AS similarity,
-        e.metadata
-    FROM rag.embeddings e
-    WHERE 1 - (e.embedding <=> query_embedding) > similarity_threshold
-    ORDER BY e.embedding <=> query_embedding
-    LIMIT match_count;
+    SELECT top_k.id, top_k.document_id, top_k.content, 1 - top_k.distance, top_k.metadata
+    FROM (
+        SELECT
+            e.id,
+            e.document_id,
+            e.content,
+            e.metadata,
+            e.embedding <=> query_embedding AS distance
+        FROM rag.embeddings e
+        ORDER BY e.embedding <=> query_embedding
+        LIMIT match_count
+    ) AS top_k
+    WHERE 1 - top_k.distance > similarity_threshold
+    ORDER BY top_k.distance;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -102,6 +156,7 @@ GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA rag TO PUBLIC;
 -- Print confirmation
 \echo 'RAG database schema initialized successfully!'
 \echo 'Available tables:'
+\echo '- rag.collections: Registry of embedding collections'
 \echo '- rag.documents: Store original documents'
 \echo '- rag.embeddings: Store vector embeddings'
 \echo 'Available functions:'
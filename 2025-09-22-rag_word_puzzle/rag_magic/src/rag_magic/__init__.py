@@ -4,6 +4,14 @@ __version__ = "0.1.0"
 __author__ = "RAG Magic Team"
 __email__ = "contact@ragmagic.com"
 
-from .main import app
-
 __all__ = ["app"]
+
+
+def __getattr__(name: str):
+    # Importing a submodule (e.g. in ingest worker processes) should not load
+    # the whole CLI
+    if name == "app":
+        from .main import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
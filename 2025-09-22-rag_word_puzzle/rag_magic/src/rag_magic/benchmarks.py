@@ -0,0 +1,912 @@
+"""Offline performance benchmarks for RAG Magic components."""
+
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rich.console import Console
+
+from . import quantization
+from .chunking import Tokenizer, get_chunker, get_tokenizer, split_sentences
+from .embedding_engine import EmbeddingEngine, FakeEmbeddingBackend
+from .indexing import IndexSpec, build_index
+from .local_store import LocalVectorStore
+from .registry import Collection
+from .storage import NewDocument, StorageBackend, storage_from_env
+
+console = Console()
+
+WORDS = (
+    "vector index chunk query answer document embedding search recall latency "
+    "puzzle hidden word corpus token context retrieval cosine neighbour batch"
+).split()
+
+
+def synthetic_texts(count: int, words_per_text: int = 150, seed: int = 0) -> List[str]:
+    """Generate ``count`` deterministic pseudo-random texts."""
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words_per_text)) for _ in range(count)
+    ]
+
+
+def benchmark_embedding_engine(
+    num_texts: int = 2000,
+    batch_size: int = 100,
+    concurrency_levels: Optional[List[int]] = None,
+    latency: float = 0.05,
+    failure_rate: float = 0.0,
+    requests_per_second: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Embed a synthetic corpus with the fake backend at several concurrencies."""
+    texts = synthetic_texts(num_texts)
+    results = []
+    for concurrency in concurrency_levels or [1, 2, 4, 8]:
+        backend = FakeEmbeddingBackend(latency=latency, failure_rate=failure_rate)
+        engine = EmbeddingEngine(
+            backend,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            requests_per_second=requests_per_second,
+            backoff_base=0.01,
+        )
+        engine.embed(texts)
+        results.append(
+            {
+                "concurrency": concurrency,
+                "batches": engine.stats.batches,
+                "retries": engine.stats.retries,
+                "elapsed": engine.stats.elapsed,
+                "texts_per_second": engine.stats.texts_per_second,
+            }
+        )
+    return results
+
+
+def _timed_ms(call: Callable[[], Any]):
+    started = time.perf_counter()
+    result = call()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": _percentile(ordered, 0.5),
+        "p95_ms": _percentile(ordered, 0.95),
+        "p99_ms": _percentile(ordered, 0.99),
+    }
+
+
+def benchmark_ann_recall(
+    db: StorageBackend,
+    queries: Sequence[Sequence[float]],
+    settings: List[Dict[str, Any]],
+    k: int = 10,
+) -> List[Dict[str, Any]]:
+    """Measure recall@k and latency of ANN search settings against exact search.
+
+    ``settings`` are keyword arguments for ``nearest_neighbours`` such as
+    ``{"ef_search": 40}`` or ``{"probes": 10}``. The first row is the exact
+    (index-free) baseline.
+    """
+    truth = []
+    exact_latency = []
+    for query in queries:
+        ids, ms = _timed_ms(lambda: db.nearest_neighbours(query, k, exact=True))
+        truth.append(set(ids))
+        exact_latency.append(ms)
+
+    results = [{"setting": "exact", "recall": 1.0, **_latency_summary(exact_latency)}]
+    for setting in settings:
+        recalls = []
+        latency = []
+        for query, expected in zip(queries, truth):
+            ids, ms = _timed_ms(lambda: db.nearest_neighbours(query, k, **setting))
+            recalls.append(
+                len(expected & set(ids)) / len(expected) if expected else 1.0
+            )
+            latency.append(ms)
+        label = ", ".join(f"{name}={value}" for name, value in setting.items())
+        results.append(
+            {
+                "setting": label or "index defaults",
+                "recall": statistics.fmean(recalls),
+                **_latency_summary(latency),
+            }
+        )
+    return results
+
+
+def _normalized(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def benchmark_quantization(
+    corpus: Sequence[Sequence[float]],
+    queries: Sequence[Sequence[float]],
+    modes: Sequence[str] = quantization.QUANTIZATION_MODES,
+    k: int = 10,
+    rerank_factor: int = quantization.DEFAULT_RERANK_FACTOR,
+    total_rows: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Measure memory, recall@k and latency of each quantization mode in-process.
+
+    ``corpus`` is a sample of stored embeddings, searched by brute force the
+    way the local store scans its codes. Recall is against exact float32
+    search over the sample, both for the quantized ranking alone and after
+    re-ranking ``rerank_factor`` x k candidates at full precision. Memory
+    is projected to ``total_rows`` (default: the sample size).
+    """
+    vectors = _normalized(corpus)
+    queries = _normalized(queries)
+    total_rows = total_rows or len(vectors)
+    truth = [set(quantization.top_indices(vectors @ query, k)) for query in queries]
+
+    results = []
+    for mode in modes:
+        scales = quantization.int8_scales(vectors) if mode == "int8" else None
+        codes = quantization.encode(mode, vectors, scales)
+        raw_recalls, recalls, latency = [], [], []
+        for query, expected in zip(queries, truth):
+
+            def search():
+                scores = quantization.scores(mode, codes, query, scales)
+                candidates = quantization.top_indices(scores, k * rerank_factor)
+                exact = vectors[candidates] @ query
+                return scores, candidates[quantization.top_indices(exact, k)]
+
+            (scores, ids), ms = _timed_ms(search)
+            raw = quantization.top_indices(scores, k)
+            raw_recalls.append(len(expected & set(raw)) / len(expected))
+            recalls.append(len(expected & set(ids)) / len(expected))
+            latency.append(ms)
+
+        per_vector = quantization.bytes_per_vector(mode, vectors.shape[1])
+        results.append(
+            {
+                "mode": mode,
+                "bytes_per_vector": per_vector,
+                "memory_bytes": per_vector * total_rows,
+                "raw_recall": statistics.fmean(raw_recalls),
+                "recall": statistics.fmean(recalls),
+                **_latency_summary(latency),
+            }
+        )
+    return results
+
+
+def benchmark_quantized_indexes(
+    db: StorageBackend,
+    queries: Sequence[Sequence[float]],
+    modes: Sequence[str] = quantization.POSTGRES_QUANTIZATION_MODES,
+    k: int = 10,
+    m: int = 16,
+    ef_construction: int = 64,
+) -> List[Dict[str, Any]]:
+    """Build a temporary HNSW index per mode and measure its size, recall and latency.
+
+    Each index is built over the quantized expression of the collection's
+    embeddings table, queried through the same re-ranking SQL as similarity
+    search, and dropped afterwards. Recall is against exact search. A mode whose index
+    fails to build is reported and skipped. Needs the postgres backend; other
+    backends get no results.
+    """
+    import psycopg2
+
+    from .database import DatabaseConnection, create_index_sql, to_vector_literal
+
+    if not isinstance(db, DatabaseConnection):
+        return []
+
+    truth = [set(db.nearest_neighbours(query, k, exact=True)) for query in queries]
+    rerank = k * db.rerank_factor
+    results = []
+    for mode in modes:
+        name = f"{db.table_name}_bench_{mode}_idx"
+        spec = IndexSpec(
+            "hnsw", m=m, ef_construction=ef_construction, quantization=mode
+        )
+        try:
+            with db.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', '0', true)")
+                started = time.perf_counter()
+                cursor.execute(f"DROP INDEX IF EXISTS rag.{name}")
+                db.index_quantization(cursor)
+                cursor.execute(
+                    create_index_sql(spec, name, db.embeddings_table, db.dimension)
+                )
+                build_seconds = time.perf_counter() - started
+                cursor.execute(
+                    "SELECT pg_relation_size(%s::regclass) AS size", (f"rag.{name}",)
+                )
+                size = cursor.fetchone()["size"]
+                conn.commit()
+
+                recalls, latency = [], []
+                for query, expected in zip(queries, truth):
+                    db.set_search_params(cursor, max(rerank, 40))
+
+                    def search():
+                        cursor.execute(
+                            db.top_k_sql(mode),
+                            {
+                                "embedding": to_vector_literal(query),
+                                "candidates": k,
+                                "rerank": rerank,
+                            },
+                        )
+                        return [row["id"] for row in cursor.fetchall()]
+
+                    ids, ms = _timed_ms(search)
+                    recalls.append(
+                        len(expected & set(ids)) / len(expected) if expected else 1.0
+                    )
+                    latency.append(ms)
+                conn.rollback()
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to benchmark the {mode} index: {e}[/red]")
+            continue
+        finally:
+            with db.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"DROP INDEX IF EXISTS rag.{name}")
+                conn.commit()
+
+        results.append(
+            {
+                "mode": mode,
+                "index_bytes": size,
+                "build_seconds": build_seconds,
+                "recall": statistics.fmean(recalls),
+                **_latency_summary(latency),
+            }
+        )
+    return results
+
+
+def _squash(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def sentence_queries(
+    documents: Dict[str, str], per_document: int = 5, min_words: int = 8, seed: int = 0
+) -> List[Dict[str, str]]:
+    """Sample sentences of each document as retrieval queries.
+
+    Each query's question and answer are the sentence itself, so a hit
+    needs a retrieved chunk that holds the whole sentence.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for content in documents.values():
+        sentences = [
+            sentence.strip()
+            for sentence in split_sentences(content)
+            if len(sentence.split()) >= min_words
+        ]
+        for sentence in rng.sample(sentences, min(per_document, len(sentences))):
+            queries.append({"question": sentence, "answer": sentence})
+    return queries
+
+
+def benchmark_chunking(
+    documents: Dict[str, str],
+    settings: Dict[str, Tuple[int, int]],
+    embed: Callable[[List[str]], List[List[float]]],
+    queries: List[Dict[str, str]],
+    tokenizer: Tokenizer,
+    k: int = 3,
+) -> List[Dict[str, Any]]:
+    """Compare chunking strategies on a corpus.
+
+    ``documents`` maps sources to their text and ``settings`` maps each
+    strategy to its (chunk_size, chunk_overlap). For every strategy the
+    corpus is chunked and embedded with ``embed``, reporting chunk counts,
+    token statistics and the hit rate: the share of ``queries`` (dicts with
+    ``question`` and ``answer``) whose answer appears whole, ignoring case
+    and whitespace, in one of the top ``k`` chunks by cosine similarity.
+    """
+    questions = _normalized(embed([query["question"] for query in queries]))
+    answers = [_squash(query["answer"]) for query in queries]
+
+    results = []
+    for strategy, (chunk_size, chunk_overlap) in settings.items():
+        started = time.perf_counter()
+        chunks = [
+            chunk
+            for source, content in documents.items()
+            for chunk in get_chunker(
+                strategy, chunk_size, chunk_overlap, source, tokenizer
+            ).split(content)
+        ]
+        elapsed = time.perf_counter() - started
+        if not chunks:
+            continue
+        tokens = [tokenizer.count(chunk) for chunk in chunks]
+
+        vectors = _normalized(embed(chunks))
+        texts = [_squash(chunk) for chunk in chunks]
+        hits = sum(
+            any(answer in texts[i] for i in quantization.top_indices(vectors @ q, k))
+            for q, answer in zip(questions, answers)
+        )
+        budget = chunk_size if strategy != "characters" else None
+        results.append(
+            {
+                "strategy": strategy,
+                "chunks": len(chunks),
+                "tokens": sum(tokens),
+                "mean_tokens": statistics.fmean(tokens),
+                "stdev_tokens": statistics.pstdev(tokens),
+                "min_tokens": min(tokens),
+                "max_tokens": max(tokens),
+                "over_budget": (
+                    sum(count > budget for count in tokens) if budget else None
+                ),
+                "hit_rate": hits / len(queries) if queries else 0.0,
+                "chunk_seconds": elapsed,
+            }
+        )
+    return results
+
+
+# Modules that cheap commands must leave to the commands that need them
+LAZY_MODULES = ("asyncio", "numpy", "psycopg2", "langchain_google_genai")
+
+
+@dataclass
+class StartupCheck:
+    """A CLI invocation, its import-time budget and modules it must not load."""
+
+    args: Tuple[str, ...]
+    budget_ms: float
+    forbidden: Tuple[str, ...] = LAZY_MODULES
+
+
+STARTUP_CHECKS = (
+    StartupCheck(("--help",), 200),
+    StartupCheck(("config",), 150),
+    StartupCheck(("collection", "list"), 200, ("langchain_google_genai", "asyncio")),
+    StartupCheck(("list-documents",), 200, ("langchain_google_genai", "asyncio")),
+)
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Self import time in ms of each module imported by the CLI.
+
+    Modules imported before the ``rag_magic`` package (interpreter startup,
+    ``site``) are not counted.
+    """
+    modules: Dict[str, float] = {}
+    started = False
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, _, name = match.groups()
+        if started:
+            modules[name] = modules.get(name, 0.0) + int(self_us) / 1000
+        elif name == "rag_magic":
+            started = True
+    return modules
+
+
+def measure_startup(args: Sequence[str], runs: int = 3) -> Tuple[float, List[str]]:
+    """Import time (best of ``runs``, ms) of ``rag-magic *args`` and the
+    top-level packages it imported.
+
+    The command really runs, with output discarded; imports are measured
+    even if it fails (e.g. without a database).
+    """
+    best = float("inf")
+    packages: List[str] = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "rag_magic.main", *args],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            env={**os.environ, "COLUMNS": "100"},
+            timeout=120,
+        )
+        modules = parse_importtime(completed.stderr)
+        total = sum(modules.values())
+        if total < best:
+            best = total
+            packages = sorted({name.split(".")[0] for name in modules})
+    return best, packages
+
+
+def benchmark_startup(
+    checks: Sequence[StartupCheck] = STARTUP_CHECKS,
+    runs: int = 3,
+    scale: float = 1.0,
+) -> List[Dict[str, Any]]:
+    """Measure each check's import time against its budget (times ``scale``)."""
+    results = []
+    for check in checks:
+        import_ms, packages = measure_startup(check.args, runs)
+        loaded = [name for name in check.forbidden if name in packages]
+        budget_ms = check.budget_ms * scale
+        results.append(
+            {
+                "command": " ".join(check.args),
+                "import_ms": import_ms,
+                "budget_ms": budget_ms,
+                "loaded": loaded,
+                "ok": import_ms <= budget_ms and not loaded,
+            }
+        )
+    return results
+
+
+# Benchmark suite: an offline, end-to-end run over a synthetic corpus and the
+# word_puzzles labelled set, recorded in a JSON-lines history file
+
+SUITE_COLLECTION = "bench_suite"
+SUITE_CHUNK_TOKENS = 128
+SUITE_CHUNK_OVERLAP = 16
+SUITE_MODES = ("vector", "hybrid", "lexical")
+
+DEFAULT_HISTORY_PATH = "~/.cache/rag_magic/bench_history.jsonl"
+
+# word_puzzles next to this project, when run from a source checkout
+DEFAULT_PUZZLES_DIR = Path(__file__).resolve().parents[3] / "word_puzzles"
+
+# Puzzle files are named puzzle<N>_<answer>.txt
+_PUZZLE_FILE = re.compile(r"^puzzle(\d+)_([a-z]+)\.txt$")
+
+_SYLLABLES = (
+    "ka ri to mo na le su vi pa de lo mi ra te no fu shi ze ba go "
+    "ul an or ex im en ar is os un"
+).split()
+
+# Metrics compared between runs: (path in the run record, higher is better)
+TRACKED_METRICS = (
+    ("ingest.chunks_per_second", True),
+    ("search.vector.p95_ms", False),
+    ("search.hybrid.p95_ms", False),
+    ("search.lexical.p95_ms", False),
+    ("index.recall", True),
+    ("puzzles.vector.hit_rate", True),
+    ("puzzles.hybrid.hit_rate", True),
+    ("memory.peak_rss_bytes", False),
+)
+
+
+def synthetic_vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    """Deterministic pseudo-words built from syllables, most common first."""
+    rng = random.Random(seed)
+    words: Dict[str, None] = {}
+    while len(words) < size:
+        words["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))] = None
+    return list(words)
+
+
+def synthetic_corpus(
+    documents: int = 2000, words_per_document: int = 300, seed: int = 0
+) -> Dict[str, str]:
+    """Generate a deterministic corpus of ``documents`` texts keyed by source.
+
+    Words follow a Zipf distribution over a pseudo-word vocabulary, and each
+    document favours a few topic words, so documents on a topic cluster
+    like real ones. Texts are split into sentences and paragraphs for the
+    chunkers.
+    """
+    rng = random.Random(seed)
+    vocabulary = synthetic_vocabulary(seed=seed)
+    weights = [1.0 / rank for rank in range(1, len(vocabulary) + 1)]
+    topics = [rng.sample(vocabulary[100:], 12) for _ in range(max(documents // 20, 1))]
+    corpus = {}
+    for number in range(documents):
+        topic = rng.choice(topics)
+        words = [
+            rng.choice(topic) if rng.random() < 0.3 else word
+            for word in rng.choices(vocabulary, weights, k=words_per_document)
+        ]
+        sentences, start = [], 0
+        while start < len(words):
+            end = start + rng.randint(8, 20)
+            sentence = " ".join(words[start:end])
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+            start = end
+        paragraphs = [
+            " ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)
+        ]
+        corpus[f"synthetic/doc{number:05d}.txt"] = "\n\n".join(paragraphs)
+    return corpus
+
+
+def synthetic_questions(
+    corpus: Dict[str, str], count: int = 200, words: int = 6, seed: int = 0
+) -> List[str]:
+    """Keyword questions: runs of ``words`` words from random documents."""
+    rng = random.Random(seed)
+    texts = list(corpus.values())
+    questions = []
+    for _ in range(count):
+        tokens = rng.choice(texts).replace(".", "").split()
+        start = rng.randrange(max(len(tokens) - words, 1))
+        questions.append(" ".join(tokens[start : start + words]).lower())
+    return questions
+
+
+def puzzle_set(directory: str) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+    """Read the word_puzzles files and build one labelled query per puzzle.
+
+    Each file is named ``puzzle<N>_<answer>.txt`` and ends with the word
+    that hides the answer ("dwelling" hides "well"). The query asks for
+    that answer and hiding word rather than quoting the file, so it shares
+    no more text with it than a reader's question would; the labels are
+    the file's source, the answer and the hiding word.
+    """
+    documents: Dict[str, str] = {}
+    queries: List[Dict[str, str]] = []
+    paths = sorted(
+        (path for path in Path(directory).glob("puzzle*.txt")),
+        key=lambda path: (
+            int(_PUZZLE_FILE.match(path.name).group(1))
+            if _PUZZLE_FILE.match(path.name)
+            else 0
+        ),
+    )
+    for path in paths:
+        match = _PUZZLE_FILE.match(path.name)
+        if not match:
+            continue
+        content = path.read_text(encoding="utf-8")
+        source = f"word_puzzles/{path.name}"
+        documents[source] = content
+        sentence = split_sentences(content.strip())[-1].strip()
+        word = sentence.rstrip(".").rpartition(" ")[2].strip(":").lower()
+        answer = match.group(2)
+        queries.append(
+            {
+                "source": source,
+                "question": f"Which word hides {answer}: is it {word}?",
+                "answer": answer,
+                "word": word,
+            }
+        )
+    return documents, queries
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident memory of this process, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def benchmark_ingest(
+    db: StorageBackend,
+    documents: Dict[str, str],
+    embed: Callable[[List[str]], List[List[float]]],
+    tokenizer: Tokenizer,
+    batch_documents: int = 100,
+) -> Dict[str, Any]:
+    """Chunk, embed and insert ``documents`` in batches, timing each step.
+
+    Returns the counts, seconds per step, throughput and the new document
+    IDs keyed by source.
+    """
+    chunker = get_chunker(
+        "sentence", SUITE_CHUNK_TOKENS, SUITE_CHUNK_OVERLAP, tokenizer=tokenizer
+    )
+    sources = list(documents)
+    seconds = {"chunk": 0.0, "embed": 0.0, "write": 0.0}
+    chunks_written = 0
+    document_ids: Dict[str, int] = {}
+    for start in range(0, len(sources), batch_documents):
+        batch = sources[start : start + batch_documents]
+
+        started = time.perf_counter()
+        chunks = {source: chunker.split(documents[source]) for source in batch}
+        seconds["chunk"] += time.perf_counter() - started
+
+        texts = [chunk for source in batch for chunk in chunks[source]]
+        started = time.perf_counter()
+        vectors = iter(embed(texts))
+        seconds["embed"] += time.perf_counter() - started
+
+        new_documents = [
+            NewDocument(
+                title=Path(source).name,
+                content=documents[source],
+                source=source,
+                rows=[(chunk, next(vectors), None) for chunk in chunks[source]],
+            )
+            for source in batch
+        ]
+        started = time.perf_counter()
+        ids = db.insert_documents_with_embeddings(new_documents, report=False)
+        seconds["write"] += time.perf_counter() - started
+        if ids is None:
+            raise RuntimeError("Inserting the benchmark corpus failed")
+        document_ids.update(zip(batch, ids))
+        chunks_written += len(texts)
+
+    total = sum(seconds.values())
+    return {
+        "documents": len(sources),
+        "chunks": chunks_written,
+        "seconds": total,
+        "chunk_seconds": seconds["chunk"],
+        "embed_seconds": seconds["embed"],
+        "write_seconds": seconds["write"],
+        "documents_per_second": len(sources) / total if total else 0.0,
+        "chunks_per_second": chunks_written / total if total else 0.0,
+        "document_ids": document_ids,
+    }
+
+
+def _search(
+    db: StorageBackend, mode: str, question: str, vector: Sequence[float], k: int
+) -> List[Dict[str, Any]]:
+    if mode == "vector":
+        return db.similarity_search(list(vector), threshold=-1.0, limit=k)
+    if mode == "hybrid":
+        return db.hybrid_search(question, vector, k)
+    return db.lexical_search(question, k)
+
+
+def benchmark_search(
+    db: StorageBackend,
+    questions: Sequence[str],
+    vectors: Sequence[Sequence[float]],
+    k: int = 10,
+    modes: Sequence[str] = SUITE_MODES,
+) -> Dict[str, Dict[str, float]]:
+    """Latency percentiles of each search mode over ``questions``.
+
+    Every question is searched once per mode after one warm-up search.
+    """
+    results = {}
+    for mode in modes:
+        _search(db, mode, questions[0], vectors[0], k)
+        latency = [
+            _timed_ms(lambda: _search(db, mode, question, vector, k))[1]
+            for question, vector in zip(questions, vectors)
+        ]
+        results[mode] = {"queries": len(latency), **_latency_summary(latency)}
+    return results
+
+
+def benchmark_labelled(
+    db: StorageBackend,
+    queries: Sequence[Dict[str, str]],
+    vectors: Sequence[Sequence[float]],
+    document_ids: Dict[str, int],
+    k: int = 10,
+    modes: Sequence[str] = SUITE_MODES,
+) -> Dict[str, Dict[str, float]]:
+    """Hit rate@k and MRR of each search mode on labelled puzzle queries.
+
+    A hit is a retrieved chunk of the query's puzzle file holding the word
+    that hides the answer.
+    """
+    results = {}
+    for mode in modes:
+        reciprocal_ranks = []
+        for query, vector in zip(queries, vectors):
+            hits = _search(db, mode, query["question"], vector, k)
+            rank = next(
+                (
+                    rank
+                    for rank, hit in enumerate(hits, 1)
+                    if hit["document_id"] == document_ids[query["source"]]
+                    and query["word"] in hit["content"].lower()
+                ),
+                None,
+            )
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        results[mode] = {
+            "queries": len(queries),
+            "hit_rate": sum(rr > 0 for rr in reciprocal_ranks) / len(queries),
+            "mrr": statistics.fmean(reciprocal_ranks),
+        }
+    return results
+
+
+def _metric(record: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = record
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_runs(
+    current: Dict[str, Any], previous: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Changes of the tracked metrics since ``previous``.
+
+    ``change`` is relative and signed so that positive is better.
+    """
+    rows = []
+    for path, higher_is_better in TRACKED_METRICS:
+        now, before = _metric(current, path), _metric(previous, path)
+        if now is None or before is None:
+            continue
+        change = (now - before) / before if before else 0.0
+        rows.append(
+            {
+                "metric": path,
+                "previous": before,
+                "current": now,
+                "change": change if higher_is_better else -change,
+            }
+        )
+    return rows
+
+
+def read_history(path: str) -> List[Dict[str, Any]]:
+    """Runs recorded in the history file, oldest first (unreadable lines skipped)."""
+    history = Path(path).expanduser()
+    if not history.exists():
+        return []
+    runs = []
+    with open(history, encoding="utf-8") as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def append_history(path: str, record: Dict[str, Any]):
+    """Append a run to the JSON-lines history file."""
+    history = Path(path).expanduser()
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with open(history, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None if completed.returncode == 0 else None
+
+
+def run_metadata() -> Dict[str, Any]:
+    """When and on what a suite run happened, to tell runs apart in the history."""
+    from . import __version__
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "version": __version__,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+@contextmanager
+def suite_store(backend: str, dimension: int) -> Iterator[StorageBackend]:
+    """A throwaway store for the suite, connected.
+
+    The local backend gets a store in a temporary directory. PostgreSQL gets
+    the ``bench_suite`` collection, recreated empty and dropped afterwards.
+    """
+    if backend == "local":
+        with tempfile.TemporaryDirectory(prefix="rag_magic_bench_") as path:
+            store = LocalVectorStore(path, ivf_min_rows=0)
+            if not store.connect():
+                raise RuntimeError("Could not open the temporary local store")
+            try:
+                yield store
+            finally:
+                store.disconnect()
+        return
+
+    admin = storage_from_env(backend)
+    if not admin.connect():
+        raise RuntimeError(f"Could not connect to the {backend} backend")
+    try:
+        if admin.get_collection(SUITE_COLLECTION):
+            admin.drop_collection(SUITE_COLLECTION)
+        if not admin.create_collection(
+            Collection(SUITE_COLLECTION, FakeEmbeddingBackend.name, dimension)
+        ):
+            raise RuntimeError(f"Could not create the {SUITE_COLLECTION} collection")
+        db = storage_from_env(backend, collection=SUITE_COLLECTION)
+        if not db.connect():
+            raise RuntimeError(f"Could not connect to the {backend} backend")
+        try:
+            yield db
+        finally:
+            db.disconnect()
+    finally:
+        admin.drop_collection(SUITE_COLLECTION)
+        admin.disconnect()
+
+
+def run_suite(
+    db: StorageBackend,
+    corpus: Dict[str, str],
+    questions: Sequence[str],
+    puzzles: Optional[Tuple[Dict[str, str], List[Dict[str, str]]]] = None,
+    k: int = 10,
+    dimension: int = 256,
+) -> Dict[str, Any]:
+    """Ingest ``corpus`` (and the puzzles) into the empty ``db`` and measure it.
+
+    Returns the ingest throughput, index build time, per-mode search
+    latency on ``questions``, recall@k of the index against exact search,
+    the labelled puzzle results and memory use.
+    """
+    engine = EmbeddingEngine(FakeEmbeddingBackend(dimension), batch_size=100)
+    documents = {**corpus, **(puzzles[0] if puzzles else {})}
+
+    console.print(f"[blue]Ingesting {len(documents):,} documents...[/blue]")
+    ingest = benchmark_ingest(db, documents, engine.embed, get_tokenizer("estimate"))
+    document_ids = ingest.pop("document_ids")
+
+    console.print("[blue]Building the vector index...[/blue]")
+    method = db.index_methods[0]
+    started = time.perf_counter()
+    if build_index(db, IndexSpec(method)) is None:
+        raise RuntimeError("Building the benchmark index failed")
+    index = {"method": method, "seconds": time.perf_counter() - started}
+
+    console.print(f"[blue]Searching with {len(questions)} questions...[/blue]")
+    vectors = engine.embed(list(questions))
+    search = benchmark_search(db, questions, vectors, k)
+    exact, indexed = benchmark_ann_recall(db, vectors, [{}], k)
+    index.update(
+        recall=indexed["recall"],
+        exact_p95_ms=exact["p95_ms"],
+        p95_ms=indexed["p95_ms"],
+    )
+
+    labelled = {}
+    if puzzles and puzzles[1]:
+        puzzle_vectors = engine.embed([query["question"] for query in puzzles[1]])
+        labelled = benchmark_labelled(db, puzzles[1], puzzle_vectors, document_ids, k)
+
+    return {
+        "ingest": ingest,
+        "index": index,
+        "search": search,
+        "puzzles": labelled,
+        "memory": {
+            "peak_rss_bytes": peak_rss_bytes(),
+            "store_bytes": db.storage_bytes(),
+        },
+    }
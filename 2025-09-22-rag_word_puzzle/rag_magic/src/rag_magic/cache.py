@@ -0,0 +1,534 @@
+"""Persistent caches for RAG Magic: chunk embeddings, query embeddings and answers."""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def content_hash(text: str) -> str:
+    """Return the sha256 hex digest of a chunk's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache keyed by (model, sha256(text)).
+
+    Vectors are stored as float32 blobs. The cache is bounded to
+    ``max_entries`` rows and evicts least-recently-used entries first.
+    Hit/miss counters are kept per session and accumulated on disk.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used_idx
+                ON embeddings(last_used);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """)
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for ``texts``; misses are returned as None."""
+        hashes = [content_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i : i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, digest) for digest in found],
+                )
+
+            results = [found.get(digest) for digest in hashes]
+            hits = sum(1 for vector in results if vector is not None)
+            self._count(hits, len(results) - hits)
+            self._conn.commit()
+
+        return results
+
+    def put_many(
+        self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]
+    ):
+        """Store embeddings for ``texts`` and evict beyond ``max_entries``."""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append(
+                (model, content_hash(text), len(array), array.tobytes(), now, now)
+            )
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(model, hash, dimension, vector, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(self.max_entries)
+            self._conn.commit()
+
+    def _count(self, hits: int, misses: int):
+        self.hits += hits
+        self.misses += misses
+        self._conn.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [("hits", hits), ("misses", misses)],
+        )
+
+    def _evict(self, max_entries: int) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - max_entries
+        if excess <= 0:
+            return 0
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN ("
+            "SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        return excess
+
+    def prune(
+        self,
+        max_entries: Optional[int] = None,
+        older_than_days: Optional[float] = None,
+        model: Optional[str] = None,
+    ) -> int:
+        """Remove entries by model, age (last use) and/or LRU size bound.
+
+        Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            if model is not None:
+                removed += self._conn.execute(
+                    "DELETE FROM embeddings WHERE model = ?", (model,)
+                ).rowcount
+            if older_than_days is not None:
+                cutoff = time.time() - older_than_days * 86400
+                removed += self._conn.execute(
+                    "DELETE FROM embeddings WHERE last_used < ?", (cutoff,)
+                ).rowcount
+            if max_entries is not None:
+                removed += self._evict(max_entries)
+            self._conn.commit()
+            if removed:
+                self._conn.execute("VACUUM")
+        return removed
+
+    def clear(self) -> int:
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM embeddings").rowcount
+            self._conn.execute("DELETE FROM counters")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+        self.hits = self.misses = 0
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry counts, on-disk size and lifetime hit/miss counters."""
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+            models = dict(
+                self._conn.execute(
+                    "SELECT model, COUNT(*) FROM embeddings GROUP BY model"
+                ).fetchall()
+            )
+            counters = dict(
+                self._conn.execute("SELECT name, value FROM counters").fetchall()
+            )
+
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "models": models,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def normalize_question(question: str) -> str:
+    """Collapse whitespace so trivially different spellings share cache entries."""
+    return " ".join(question.split())
+
+
+class QueryCache:
+    """SQLite-backed caches for the query path.
+
+    - Question embeddings are keyed by (model, sha256(question)) and only
+      reused for an exact (whitespace-normalized) match.
+    - Answers are keyed by chat model and the ordered IDs of the retrieved
+      chunks, and matched semantically: a stored answer is reused when its
+      question embedding is within ``max_distance`` cosine distance of the
+      new question's and it was generated against the same corpus version.
+      Answers from an older corpus version are treated as stale. Each
+      answer records its collection, so invalidating one collection's stale
+      answers leaves other collections sharing the cache file alone.
+
+    Both layers expire entries ``ttl_seconds`` after creation and evict the
+    least recently used entries beyond ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 86_400,
+        max_distance: float = 0.05,
+    ):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            );
+            CREATE INDEX IF NOT EXISTS query_embeddings_last_used_idx
+                ON query_embeddings(last_used);
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                model TEXT NOT NULL,
+                chunks_key TEXT NOT NULL,
+                collection TEXT NOT NULL DEFAULT '',
+                corpus_version TEXT NOT NULL,
+                question TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_lookup_idx
+                ON answers(model, chunks_key);
+            CREATE INDEX IF NOT EXISTS answers_last_used_idx
+                ON answers(last_used);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """)
+        # Cache files created before answers were tagged with their collection
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        if "collection" not in columns:
+            self._conn.execute(
+                "ALTER TABLE answers ADD COLUMN collection TEXT NOT NULL DEFAULT ''"
+            )
+        self._conn.commit()
+
+    def _count(self, name: str):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get_embedding(self, model: str, question: str) -> Optional[List[float]]:
+        """Return the cached embedding for an exact question, or None."""
+        digest = content_hash(normalize_question(question))
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings "
+                "WHERE model = ? AND hash = ? AND created_at >= ?",
+                (model, digest, now - self.ttl_seconds),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE query_embeddings SET last_used = ? "
+                    "WHERE model = ? AND hash = ?",
+                    (now, model, digest),
+                )
+            self._count("query_embedding_hits" if row else "query_embedding_misses")
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def put_embedding(self, model: str, question: str, vector: Sequence[float]):
+        """Store a question's embedding."""
+        digest = content_hash(normalize_question(question))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings "
+                "(model, hash, vector, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (model, digest, _to_blob(vector), now, now),
+            )
+            self._evict("query_embeddings", self.max_entries)
+            self._conn.commit()
+
+    def get_answer(
+        self,
+        model: str,
+        chunk_ids: Sequence[int],
+        corpus_version: str,
+        vector: Sequence[float],
+    ) -> Optional[str]:
+        """Return a stored answer for a semantically close question, or None.
+
+        Only answers generated from the same retrieved chunks and corpus
+        version are considered; the closest one within ``max_distance`` wins.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vector, answer FROM answers "
+                "WHERE model = ? AND chunks_key = ? AND corpus_version = ? "
+                "AND created_at >= ?",
+                (model, _chunks_key(chunk_ids), corpus_version, now - self.ttl_seconds),
+            ).fetchall()
+
+            best = None
+            if rows:
+                query = np.asarray(vector, dtype=np.float32)
+                stored = np.stack(
+                    [np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows]
+                )
+                norms = np.linalg.norm(stored, axis=1) * np.linalg.norm(query)
+                distances = 1.0 - (stored @ query) / np.where(norms == 0, 1.0, norms)
+                index = int(np.argmin(distances))
+                if distances[index] <= self.max_distance:
+                    best = rows[index]
+
+            if best:
+                self._conn.execute(
+                    "UPDATE answers SET last_used = ? WHERE id = ?", (now, best[0])
+                )
+            self._count("answer_hits" if best else "answer_misses")
+            self._conn.commit()
+        return best[2] if best else None
+
+    def put_answer(
+        self,
+        model: str,
+        chunk_ids: Sequence[int],
+        corpus_version: str,
+        question: str,
+        vector: Sequence[float],
+        answer: str,
+        collection: str = "",
+    ):
+        """Store a generated answer for a question about ``collection``."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (model, chunks_key, collection, corpus_version, "
+                "question, vector, answer, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    model,
+                    _chunks_key(chunk_ids),
+                    collection,
+                    corpus_version,
+                    normalize_question(question),
+                    _to_blob(vector),
+                    answer,
+                    now,
+                    now,
+                ),
+            )
+            self._evict("answers", self.max_entries)
+            self._conn.commit()
+
+    def invalidate(
+        self, collection: Optional[str] = None, corpus_version: Optional[str] = None
+    ) -> int:
+        """Drop ``collection``'s answers not generated against ``corpus_version``.
+
+        Without a ``corpus_version`` every answer of the collection is dropped,
+        and without a ``collection`` every answer in the cache.
+        """
+        with self._lock:
+            if collection is None:
+                removed = self._conn.execute("DELETE FROM answers").rowcount
+            elif corpus_version is None:
+                removed = self._conn.execute(
+                    "DELETE FROM answers WHERE collection = ?", (collection,)
+                ).rowcount
+            else:
+                removed = self._conn.execute(
+                    "DELETE FROM answers WHERE collection = ? AND corpus_version != ?",
+                    (collection, corpus_version),
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def _evict(self, table: str, max_entries: int) -> int:
+        """Drop expired rows, then least recently used rows beyond ``max_entries``."""
+        removed = self._conn.execute(
+            f"DELETE FROM {table} WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        ).rowcount
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        excess = count - max_entries
+        if excess > 0:
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN ("
+                f"SELECT rowid FROM {table} ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            removed += excess
+        return removed
+
+    def prune(
+        self, max_entries: Optional[int] = None, older_than_days: Optional[float] = None
+    ) -> int:
+        """Remove expired, idle and excess LRU entries from both layers.
+
+        Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            for table in ("query_embeddings", "answers"):
+                if older_than_days is not None:
+                    cutoff = time.time() - older_than_days * 86400
+                    removed += self._conn.execute(
+                        f"DELETE FROM {table} WHERE last_used < ?", (cutoff,)
+                    ).rowcount
+                removed += self._evict(
+                    table, self.max_entries if max_entries is None else max_entries
+                )
+            self._conn.commit()
+        return removed
+
+    def clear(self) -> int:
+        """Remove every query embedding and answer."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM query_embeddings").rowcount
+            removed += self._conn.execute("DELETE FROM answers").rowcount
+            self._conn.execute(
+                "DELETE FROM counters WHERE name LIKE 'query_embedding_%' "
+                "OR name LIKE 'answer_%'"
+            )
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry counts and lifetime hit/miss counters for both layers."""
+        with self._lock:
+            (embeddings,) = self._conn.execute(
+                "SELECT COUNT(*) FROM query_embeddings"
+            ).fetchone()
+            (answers,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+            counters = dict(
+                self._conn.execute("SELECT name, value FROM counters").fetchall()
+            )
+
+        def layer(entries: int, prefix: str) -> Dict[str, Any]:
+            hits = counters.get(f"{prefix}_hits", 0)
+            misses = counters.get(f"{prefix}_misses", 0)
+            lookups = hits + misses
+            return {
+                "entries": entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+        return {
+            "path": str(self.path),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "max_distance": self.max_distance,
+            "embeddings": layer(embeddings, "query_embedding"),
+            "answers": layer(answers, "answer"),
+        }
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def _to_blob(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _chunks_key(chunk_ids: Sequence[int]) -> str:
+    return content_hash(json.dumps(list(chunk_ids)))
+
+
+def open_cache(config) -> Optional[EmbeddingCache]:
+    """Open the embedding cache described by a Config, or None if disabled."""
+    if not config.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(
+        config.embedding_cache_path, max_entries=config.embedding_cache_max_entries
+    )
+
+
+def open_query_cache(config) -> Optional[QueryCache]:
+    """Open the query/answer cache described by a Config, or None if disabled."""
+    if not config.query_cache_enabled:
+        return None
+    return QueryCache(
+        config.embedding_cache_path,
+        max_entries=config.query_cache_max_entries,
+        ttl_seconds=config.query_cache_ttl_seconds,
+        max_distance=config.answer_cache_max_distance,
+    )
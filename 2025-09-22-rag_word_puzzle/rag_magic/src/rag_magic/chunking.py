@@ -0,0 +1,563 @@
+"""Chunking strategies for RAG Magic.
+
+A chunker splits a document into the texts that get embedded. Strategies:
+
+- ``characters``: character windows breaking at a space, the original
+  splitter. ``chunk_size`` and ``chunk_overlap`` are characters.
+- ``sentence``: whole sentences packed up to a token budget.
+- ``markdown``: heading sections packed up to a token budget, so a chunk
+  does not straddle two sections unless both fit.
+- ``python``: top-level definitions (and the methods of large classes)
+  found with :mod:`ast`, packed up to a token budget.
+- ``auto``: ``markdown`` for ``.md`` files, ``python`` for ``.py`` files and
+  ``sentence`` otherwise.
+
+For the token-budgeted strategies ``chunk_size`` and ``chunk_overlap`` are
+tokens. A structural unit larger than the budget is split into sentences,
+then lines, then token windows.
+
+Tokens are counted with tiktoken (``TOKENIZER``, default ``cl100k_base``)
+when the package is installed and ``TOKENIZER_FILE`` names the encoding's
+local ``.tiktoken`` file; encodings are never downloaded. Otherwise a
+built-in estimate is used. Gemini does not publish its tokenizer, so both
+are approximations of the embedding model's count, but they are consistent
+and far closer than ``len // 4``. The tokenizer decides chunk boundaries, so
+its name is recorded with each document (see :func:`chunking_metadata`).
+"""
+
+import ast
+import base64
+import io
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+from rich.console import Console
+
+console = Console()
+
+CHUNKING_STRATEGIES = ("auto", "characters", "sentence", "markdown", "python")
+
+DEFAULT_TOKENIZER = "cl100k_base"
+
+# Pre-tokenization pattern and special tokens of the supported tiktoken
+# encodings, as published in tiktoken_ext.openai_public
+_TIKTOKEN_ENCODINGS = {
+    "cl100k_base": (
+        r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+|"""
+        r""" ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+    ),
+    "o200k_base": (
+        "|".join(
+            [
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*"""
+                r"""[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+"""
+                r"""[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+                r"""\p{N}{1,3}""",
+                r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+                r"""\s*[\r\n]+""",
+                r"""\s+(?!\S)""",
+                r"""\s+""",
+            ]
+        ),
+        {"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+    ),
+}
+
+# Estimate: a word piece of up to 6 letters, up to 3 digits or one other
+# character, each with an optional leading space (like BPE vocabularies)
+_TOKEN_PATTERN = re.compile(r" ?[^\W\d_]{1,6}| ?\d{1,3}| ?[^\w\s]| ?_|\s+")
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+|\n\s*\n")
+_HEADING = re.compile(r"^#{1,6}\s")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+# Expected content-defined break points per half chunk (see _is_anchor)
+_ANCHORS_PER_HALF_CHUNK = 2
+
+
+class Tokenizer:
+    """Built-in token estimate, used when tiktoken is unavailable.
+
+    ``encode`` returns the pieces themselves, so ``decode`` reproduces the
+    input exactly.
+    """
+
+    name = "estimate"
+
+    def encode(self, text: str) -> list:
+        return _TOKEN_PATTERN.findall(text)
+
+    def decode(self, tokens: Sequence) -> str:
+        return "".join(tokens)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+
+class TiktokenTokenizer(Tokenizer):
+    """A tiktoken BPE encoding."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = f"tiktoken:{encoding.name}"
+
+    def encode(self, text: str) -> list:
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens: Sequence) -> str:
+        return self.encoding.decode(list(tokens))
+
+
+def load_tiktoken_encoding(name: str, path: str):
+    """Build the tiktoken encoding ``name`` from its local ``.tiktoken`` file.
+
+    The file holds one base64 token and its rank per line. Raises ValueError
+    for an unsupported encoding, and OSError or ImportError if the file or
+    the package is missing.
+    """
+    if name not in _TIKTOKEN_ENCODINGS:
+        raise ValueError(
+            f"unsupported encoding (use {', '.join(_TIKTOKEN_ENCODINGS)} or estimate)"
+        )
+    import tiktoken
+
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    pattern, special_tokens = _TIKTOKEN_ENCODINGS[name]
+    return tiktoken.Encoding(
+        name, pat_str=pattern, mergeable_ranks=ranks, special_tokens=special_tokens
+    )
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: Optional[str] = None, path: Optional[str] = None) -> Tokenizer:
+    """Return the tokenizer named by ``name`` or ``TOKENIZER``.
+
+    "estimate" selects the built-in estimate; any other name is a tiktoken
+    encoding read from ``path`` or ``TOKENIZER_FILE``, never downloaded. If
+    that fails the estimate is used, with a warning.
+    """
+    name = name or os.getenv("TOKENIZER", DEFAULT_TOKENIZER)
+    name = name.removeprefix("tiktoken:")
+    if name == "estimate":
+        return Tokenizer()
+    path = path or os.getenv("TOKENIZER_FILE")
+    try:
+        if not path:
+            raise ValueError("TOKENIZER_FILE is not set")
+        return TiktokenTokenizer(load_tiktoken_encoding(name, path))
+    except Exception as e:
+        console.print(
+            f"[yellow]⚠ Tokenizer {name} unavailable ({e}); "
+            "using the built-in token estimate[/yellow]"
+        )
+        return Tokenizer()
+
+
+def _is_anchor(word: str, span: int) -> bool:
+    """Whether a chunk may end after ``word``, decided by a hash of the word.
+
+    About ``_ANCHORS_PER_HALF_CHUNK`` of every ``span`` characters of text
+    end in an anchor, independent of where the chunk started.
+    """
+    return zlib.crc32(word.encode()) % span < _ANCHORS_PER_HALF_CHUNK * (len(word) + 1)
+
+
+def iter_chunks(
+    stream: TextIO,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    read_size: int = 1 << 16,
+) -> Iterator[str]:
+    """Lazily split a text stream into overlapping chunks.
+
+    Reads the stream incrementally and keeps only a window of roughly
+    ``chunk_size + read_size`` characters in memory. Each chunk starts
+    ``chunk_overlap`` characters before the previous one ended, but always
+    after its start.
+
+    Breaks are content-defined: a chunk ends at the first space past half
+    of ``chunk_size`` that follows an anchor word (see :func:`_is_anchor`),
+    or at the last space before ``chunk_size`` if there is none. Boundaries
+    therefore depend on the nearby words rather than on where the document
+    starts, and re-align shortly after an edit, so incremental re-ingestion
+    only re-embeds the chunks around it.
+    """
+    span = max(chunk_size // 2, 1)
+    buffer = ""
+    offset = 0  # absolute position of buffer[0]
+    eof = False
+
+    def fill(position: int):
+        """Read until the buffer extends past ``position`` or the stream ends."""
+        nonlocal buffer, eof
+        while not eof and offset + len(buffer) <= position:
+            block = stream.read(max(read_size, chunk_size))
+            if block:
+                buffer += block
+            else:
+                eof = True
+
+    start = 0
+    while True:
+        fill(start)
+        if start >= offset + len(buffer):
+            break
+
+        # Calculate end position
+        end = start + chunk_size
+
+        # If this is not the last chunk, try to break at word boundary
+        fill(end)
+        if end < offset + len(buffer):
+            end = _break_at(buffer, start - offset, end - offset, span) + offset
+
+        chunk = buffer[start - offset : end - offset].strip()
+        if chunk:
+            yield chunk
+
+        # Move start position, accounting for overlap, but never backwards
+        next_start = end - chunk_overlap
+        start = next_start if next_start > start else end
+
+        # Drop text before the next chunk once enough has accumulated
+        if start - offset > read_size:
+            buffer = buffer[start - offset :]
+            offset = start
+
+
+def _break_at(buffer: str, start: int, end: int, span: int) -> int:
+    """Where a chunk of ``buffer[start:end]`` ends (``end`` if it has no spaces)."""
+    # Words ending past the first half are candidates
+    word_start = max(buffer.rfind(" ", start, start + span) + 1, start)
+    space = buffer.find(" ", start + span, end)
+    while space != -1:
+        if _is_anchor(buffer[word_start:space], span):
+            return space
+        word_start = space + 1
+        space = buffer.find(" ", word_start, end)
+    # No anchor: the last space, as long as the chunk is not empty
+    last_space = buffer.rfind(" ", start, end)
+    return last_space if last_space > start else end
+
+
+def chunk_text(
+    text: str, chunk_size: int = 1000, chunk_overlap: int = 200
+) -> List[str]:
+    """Split text into overlapping chunks, breaking at word boundaries."""
+    if not text.strip():
+        return []
+    return list(iter_chunks(io.StringIO(text), chunk_size, chunk_overlap))
+
+
+def _split_after(pattern: re.Pattern, text: str) -> List[str]:
+    """Split ``text`` after each match of ``pattern``, keeping every character."""
+    parts = []
+    start = 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            parts.append(text[start : match.end()])
+            start = match.end()
+    if start < len(text):
+        parts.append(text[start:])
+    return parts
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences and paragraphs, keeping trailing whitespace."""
+    return _split_after(_SENTENCE_END, text)
+
+
+def split_lines(text: str) -> List[str]:
+    return text.splitlines(keepends=True)
+
+
+def split_markdown_sections(text: str) -> List[str]:
+    """Split Markdown before each heading outside fenced code blocks."""
+    sections: List[str] = []
+    current: List[str] = []
+    fenced = False
+    for line in split_lines(text):
+        if _FENCE.match(line):
+            fenced = not fenced
+        elif not fenced and _HEADING.match(line) and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+class Chunker(ABC):
+    """Splits documents into chunks of at most ``chunk_size`` units."""
+
+    name: str = ""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int = 0,
+        tokenizer: Optional[Tokenizer] = None,
+    ):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be at least 0 and below chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._tokenizer = tokenizer
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        """Tokenizer for budgets, loaded on first use."""
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return self._tokenizer
+
+    @abstractmethod
+    def split(self, text: str) -> List[str]:
+        """Split a whole document into chunks."""
+
+    def iter_chunks(self, stream: TextIO, read_size: int = 1 << 20) -> Iterator[str]:
+        """Chunk a stream in bounded memory.
+
+        The stream is read in blocks cut at the last paragraph break (or
+        line break), and each block is split on its own.
+        """
+        buffer = ""
+        while block := stream.read(read_size):
+            buffer += block
+            cut = buffer.rfind("\n\n")
+            if cut == -1:
+                cut = buffer.rfind("\n")
+            if cut == -1:
+                continue
+            yield from self.split(buffer[: cut + 1])
+            buffer = buffer[cut + 1 :]
+        if buffer:
+            yield from self.split(buffer)
+
+
+class CharacterChunker(Chunker):
+    """Fixed-size character windows (``chunk_size`` is in characters)."""
+
+    name = "characters"
+
+    def split(self, text: str) -> List[str]:
+        return chunk_text(text, self.chunk_size, self.chunk_overlap)
+
+    def iter_chunks(self, stream: TextIO, read_size: int = 1 << 16) -> Iterator[str]:
+        return iter_chunks(stream, self.chunk_size, self.chunk_overlap, read_size)
+
+
+class TokenChunker(Chunker):
+    """Packs structural segments into chunks of at most ``chunk_size`` tokens.
+
+    Consecutive segments share a chunk while they fit. Each chunk after the
+    first starts with the trailing segments of the previous one, up to
+    ``chunk_overlap`` tokens.
+    """
+
+    @abstractmethod
+    def segments(self, text: str) -> List[str]:
+        """Split text into the units a chunk should not break."""
+
+    def refine(self, segment: str) -> List[str]:
+        """Split a segment over the budget into smaller segments ([] if none)."""
+        for split in (split_sentences, split_lines):
+            parts = split(segment)
+            if len(parts) > 1:
+                return parts
+        return []
+
+    def split(self, text: str) -> List[str]:
+        if not text.strip():
+            return []
+        return [chunk for chunk in self._pack(self.segments(text)) if chunk]
+
+    def _pack(self, segments: Iterable[str]) -> Iterator[str]:
+        current: List[str] = []
+        counts: List[int] = []
+        for segment in segments:
+            tokens = self.tokenizer.count(segment)
+            if tokens > self.chunk_size:
+                if current:
+                    yield "".join(current).strip()
+                    current, counts = [], []
+                parts = self.refine(segment)
+                yield from self._pack(parts) if parts else self._windows(segment)
+                continue
+
+            if current and sum(counts) + tokens > self.chunk_size:
+                yield "".join(current).strip()
+                current, counts = self._overlap(current, counts, tokens)
+            current.append(segment)
+            counts.append(tokens)
+        if current:
+            yield "".join(current).strip()
+
+    def _overlap(self, segments: List[str], counts: List[int], incoming: int):
+        """Trailing segments to repeat at the start of the next chunk."""
+        budget = min(self.chunk_overlap, self.chunk_size - incoming)
+        kept = 0
+        total = 0
+        while kept < len(segments) and total + counts[-1 - kept] <= budget:
+            total += counts[-1 - kept]
+            kept += 1
+        if not kept:
+            return [], []
+        return segments[-kept:], counts[-kept:]
+
+    def _windows(self, text: str) -> Iterator[str]:
+        """Split text into overlapping windows of ``chunk_size`` tokens."""
+        tokens = self.tokenizer.encode(text)
+        step = self.chunk_size - self.chunk_overlap
+        for start in range(0, len(tokens), step):
+            yield self.tokenizer.decode(tokens[start : start + self.chunk_size])
+            if start + self.chunk_size >= len(tokens):
+                break
+
+
+class SentenceChunker(TokenChunker):
+    """Whole sentences up to the token budget."""
+
+    name = "sentence"
+
+    def segments(self, text: str) -> List[str]:
+        return split_sentences(text)
+
+    def refine(self, segment: str) -> List[str]:
+        parts = split_lines(segment)
+        return parts if len(parts) > 1 else []
+
+
+class MarkdownChunker(TokenChunker):
+    """Markdown heading sections up to the token budget."""
+
+    name = "markdown"
+
+    def segments(self, text: str) -> List[str]:
+        return split_markdown_sections(text)
+
+
+class PythonChunker(TokenChunker):
+    """Top-level Python definitions up to the token budget.
+
+    Comments and blank lines stay with the statement that follows them. A
+    class over the budget is split into its header and its methods. Source
+    that does not parse is chunked by lines.
+    """
+
+    name = "python"
+
+    def segments(self, text: str) -> List[str]:
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            return split_lines(text)
+        lines = split_lines(text)
+        segments = list(self._statements(tree.body, lines, 0))
+        tail = "".join(lines[tree.body[-1].end_lineno :]) if tree.body else text
+        if tail:
+            segments.append(tail)
+        return segments
+
+    def refine(self, segment: str) -> List[str]:
+        parts = split_lines(segment)
+        return parts if len(parts) > 1 else []
+
+    def _statements(self, body: List[ast.stmt], lines: List[str], start: int):
+        """Yield the source of each statement in ``body``, from line ``start``."""
+        for node in body:
+            end = node.end_lineno
+            source = "".join(lines[start:end])
+            if (
+                isinstance(node, ast.ClassDef)
+                and len(node.body) > 1
+                and self.tokenizer.count(source) > self.chunk_size
+            ):
+                header_end = self._first_line(node.body[1])
+                yield "".join(lines[start:header_end])
+                yield from self._statements(node.body[1:], lines, header_end)
+            elif source:
+                yield source
+            start = max(start, end)
+
+    @staticmethod
+    def _first_line(node: ast.stmt) -> int:
+        """Zero-based first line of a statement, including its decorators."""
+        decorators = getattr(node, "decorator_list", [])
+        return min([node.lineno] + [d.lineno for d in decorators]) - 1
+
+
+_CHUNKERS = {
+    chunker.name: chunker
+    for chunker in (CharacterChunker, SentenceChunker, MarkdownChunker, PythonChunker)
+}
+
+
+def resolve_strategy(strategy: str, source: Optional[str] = None) -> str:
+    """Resolve "auto" to a concrete strategy for ``source``'s file type."""
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(
+            f"Unknown chunking strategy: {strategy} "
+            f"(use {', '.join(CHUNKING_STRATEGIES)})"
+        )
+    if strategy != "auto":
+        return strategy
+    suffix = Path(source).suffix.lower() if source else ""
+    return {".md": "markdown", ".py": "python"}.get(suffix, "sentence")
+
+
+def chunking_metadata(
+    strategy: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    source: Optional[str] = None,
+    tokenizer: Optional[Tokenizer] = None,
+) -> Dict[str, Any]:
+    """Document metadata describing how its chunks were made.
+
+    Records the strategy, sizes and, for the token-budgeted strategies, the
+    tokenizer: a different tokenizer moves chunk boundaries, which
+    ``ingest --incremental`` reports.
+    """
+    chunking = resolve_strategy(strategy, source)
+    metadata: Dict[str, Any] = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "chunking": chunking,
+    }
+    if chunking != "characters":
+        metadata["tokenizer"] = (tokenizer or get_tokenizer()).name
+    return metadata
+
+
+def get_chunker(
+    strategy: str,
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    source: Optional[str] = None,
+    tokenizer: Optional[Tokenizer] = None,
+) -> Chunker:
+    """Create the chunker for ``strategy`` (resolving "auto" by ``source``)."""
+    return _CHUNKERS[resolve_strategy(strategy, source)](
+        chunk_size, chunk_overlap, tokenizer
+    )
@@ -2,11 +2,17 @@
 
 import os
 from pathlib import Path
+from typing import Optional
 
-from dotenv import load_dotenv
 from rich.console import Console
 
+from .chunking import CHUNKING_STRATEGIES, DEFAULT_TOKENIZER
+from .registry import DEFAULT_COLLECTION, check_collection_name
+from .storage import RERANK_METHODS, STORAGE_BACKENDS
+
 console = Console()
+# Load messages go to stderr so stdout can carry machine-readable output
+status_console = Console(stderr=True)
 
 
 class Config:
@@ -17,28 +23,131 @@ class Config:
         # Load .env files from current directory and project root
         self._load_env_files()
 
+        # Storage backend: "postgres" (pgvector) or "local" (in-process, no server)
+        self.storage_backend = os.getenv("STORAGE_BACKEND", "postgres")
+        self.local_store_path = os.getenv(
+            "LOCAL_STORE_PATH", str(Path.home() / ".cache/rag_magic/store")
+        )
+        self.local_ivf_min_rows = int(os.getenv("LOCAL_IVF_MIN_ROWS", "50000"))
+        # Collection used when a command is not given --collection
+        self.collection = os.getenv("RAG_COLLECTION", DEFAULT_COLLECTION)
+
         # Database configuration
         self.db_host = os.getenv("POSTGRES_HOST", "localhost")
         self.db_port = int(os.getenv("POSTGRES_PORT", "5432"))
         self.db_name = os.getenv("POSTGRES_DB", "rag_database")
         self.db_user = os.getenv("POSTGRES_USER", "rag_user")
         self.db_password = os.getenv("POSTGRES_PASSWORD", "rag_password")
+        self.db_pool_min_size = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1"))
+        self.db_pool_max_size = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+        self.db_pool_timeout = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+        self.db_statement_timeout_ms = int(
+            os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "30000")
+        )
+        self.db_health_check_interval = float(
+            os.getenv("POSTGRES_HEALTH_CHECK_INTERVAL", "30")
+        )
 
         # Google Gemini configuration
         self.gemini_api_key = os.getenv("GEMINI_TOKEN") or os.getenv("GOOGLE_API_KEY")
         self.embedding_model = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
         self.chat_model = os.getenv("CHAT_MODEL", "gemini-1.5-flash")
 
-        # Default settings
+        # Embedding engine configuration
+        self.embedding_backend = os.getenv("EMBEDDING_BACKEND", "google")
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        self.embedding_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+        self.embedding_requests_per_second = float(
+            os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "10")
+        )
+        self.embedding_max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+        # The fake embedding backend implies a fake chat model unless overridden
+        self.chat_backend = os.getenv(
+            "CHAT_BACKEND", "fake" if self.embedding_backend == "fake" else "google"
+        )
+
+        # Embedding cache configuration
+        self.embedding_cache_enabled = os.getenv(
+            "EMBEDDING_CACHE_ENABLED", "true"
+        ).lower() in ("1", "true", "yes")
+        self.embedding_cache_path = os.getenv(
+            "EMBEDDING_CACHE_PATH", str(Path.home() / ".cache/rag_magic/embeddings.db")
+        )
+        self.embedding_cache_max_entries = int(
+            os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000")
+        )
+
+        # Query embedding and semantic answer cache configuration
+        self.query_cache_enabled = os.getenv("QUERY_CACHE_ENABLED", "true").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        self.query_cache_ttl_seconds = (
+            float(os.getenv("QUERY_CACHE_TTL_HOURS", "24")) * 3600
+        )
+        self.query_cache_max_entries = int(
+            os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000")
+        )
+        self.answer_cache_max_distance = float(
+            os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05")
+        )
+
+        # Chunking: the strategy, and token budgets for the token-aware strategies
+        self.chunking_strategy = os.getenv("CHUNKING_STRATEGY", "auto")
+        self.default_chunk_tokens = int(os.getenv("DEFAULT_CHUNK_TOKENS", "256"))
+        self.default_chunk_overlap_tokens = int(
+            os.getenv("DEFAULT_CHUNK_OVERLAP_TOKENS", "32")
+        )
+        self.tokenizer = os.getenv("TOKENIZER", DEFAULT_TOKENIZER)
+        self.tokenizer_file = os.getenv("TOKENIZER_FILE")
+
+        # Answer prompt context: token budget (0 = unlimited) and the share of
+        # shared word shingles above which a chunk counts as a near-duplicate
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+        self.context_dedup_threshold = float(
+            os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.9")
+        )
+
+        # Re-ranking of search results before answering: the method, how many
+        # chunks to keep (0 = all), the MMR relevance/diversity trade-off and
+        # the cross-encoder model
+        self.rerank_method = os.getenv("RERANK_METHOD", "none")
+        self.rerank_top_n = int(os.getenv("RERANK_TOP_N", "5")) or None
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.rerank_model = os.getenv(
+            "RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+        )
+
+        # Default settings (chunk sizes in characters, for CHUNKING_STRATEGY=characters)
         self.default_chunk_size = int(os.getenv("DEFAULT_CHUNK_SIZE", "1000"))
         self.default_chunk_overlap = int(os.getenv("DEFAULT_CHUNK_OVERLAP", "200"))
         self.default_similarity_threshold = float(
             os.getenv("DEFAULT_SIMILARITY_THRESHOLD", "0.7")
         )
         self.default_max_results = int(os.getenv("DEFAULT_MAX_RESULTS", "10"))
+        self.default_search_mode = os.getenv("DEFAULT_SEARCH_MODE", "vector")
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        # ANN search tuning; unset keeps the PostgreSQL/pgvector defaults
+        self.default_ef_search = int(os.getenv("DEFAULT_EF_SEARCH", "0")) or None
+        self.default_ivfflat_probes = (
+            int(os.getenv("DEFAULT_IVFFLAT_PROBES", "0")) or None
+        )
+        # Quantized searches re-rank this many times the requested candidates
+        self.quantization_rerank_factor = int(
+            os.getenv("QUANTIZATION_RERANK_FACTOR", "4")
+        )
+        # Filtered searches matching at most this many chunks scan them exactly
+        self.filter_prefilter_rows = int(os.getenv("FILTER_PREFILTER_ROWS", "20000"))
+        self.insert_page_size = int(os.getenv("INSERT_PAGE_SIZE", "500"))
+        self.streaming_threshold_bytes = int(
+            float(os.getenv("STREAMING_THRESHOLD_MB", "16")) * 1024 * 1024
+        )
 
     def _load_env_files(self):
         """Load environment variables from .env files."""
+        from dotenv import load_dotenv
+
         # Look for .env files in current directory and parent directories
         current_path = Path.cwd()
 
@@ -47,7 +156,7 @@ class Config:
             env_file = current_path / ".env"
             if env_file.exists():
                 load_dotenv(env_file)
-                console.print(f"[green]✓ Loaded config from {env_file}[/green]")
+                status_console.print(f"[green]✓ Loaded config from {env_file}[/green]")
                 break
             current_path = current_path.parent
 
@@ -55,13 +164,42 @@ class Config:
         postgres_env = Path("postgres/.env")
         if postgres_env.exists():
             load_dotenv(postgres_env)
-            console.print(f"[green]✓ Loaded config from {postgres_env}[/green]")
+            status_console.print(f"[green]✓ Loaded config from {postgres_env}[/green]")
 
     def validate(self) -> bool:
         """Validate that required configuration is present."""
         errors = []
 
-        if not self.gemini_api_key:
+        if self.storage_backend not in STORAGE_BACKENDS:
+            errors.append(
+                f"STORAGE_BACKEND must be one of {', '.join(STORAGE_BACKENDS)}"
+            )
+
+        try:
+            check_collection_name(self.collection)
+        except ValueError as e:
+            errors.append(f"RAG_COLLECTION: {e}")
+
+        if self.chunking_strategy not in CHUNKING_STRATEGIES:
+            errors.append(
+                f"CHUNKING_STRATEGY must be one of {', '.join(CHUNKING_STRATEGIES)}"
+            )
+
+        if self.context_token_budget < 0:
+            errors.append("CONTEXT_TOKEN_BUDGET must be 0 (unlimited) or positive")
+        if not 0 < self.context_dedup_threshold <= 1:
+            errors.append("CONTEXT_DEDUP_THRESHOLD must be in (0, 1]")
+        if self.rerank_method not in RERANK_METHODS:
+            errors.append(f"RERANK_METHOD must be one of {', '.join(RERANK_METHODS)}")
+        if self.rerank_top_n is not None and self.rerank_top_n < 0:
+            errors.append("RERANK_TOP_N must be 0 (keep all) or positive")
+        if not 0 <= self.mmr_lambda <= 1:
+            errors.append("MMR_LAMBDA must be in [0, 1]")
+        if self.filter_prefilter_rows < 0:
+            errors.append("FILTER_PREFILTER_ROWS must be 0 or positive")
+
+        uses_google = "google" in (self.embedding_backend, self.chat_backend)
+        if not self.gemini_api_key and uses_google:
             errors.append("GEMINI_TOKEN or GOOGLE_API_KEY is required")
 
         if errors:
@@ -75,11 +213,32 @@ class Config:
     def display(self):
         """Display current configuration (masking sensitive data)."""
         console.print("[blue]Current Configuration:[/blue]")
+        console.print(f"  Storage Backend: {self.storage_backend}")
+        if self.storage_backend == "local":
+            console.print(f"  Local Store Path: {self.local_store_path}")
+            console.print(
+                f"  Local IVF Partitioning: from {self.local_ivf_min_rows:,} chunks"
+                if self.local_ivf_min_rows > 0
+                else "  Local IVF Partitioning: [yellow]disabled[/yellow]"
+            )
+        console.print(f"  Collection: {self.collection}")
         console.print(f"  Database Host: {self.db_host}")
         console.print(f"  Database Port: {self.db_port}")
         console.print(f"  Database Name: {self.db_name}")
         console.print(f"  Database User: {self.db_user}")
         console.print(f"  Database Password: {'*' * len(self.db_password)}")
+        console.print(
+            f"  Database Pool Size: {self.db_pool_min_size}-{self.db_pool_max_size} "
+            f"(wait {self.db_pool_timeout:g}s)"
+        )
+        console.print(
+            f"  Statement Timeout: {self.db_statement_timeout_ms} ms"
+            if self.db_statement_timeout_ms > 0
+            else "  Statement Timeout: [yellow]disabled[/yellow]"
+        )
+        console.print(
+            f"  Connection Health Check: after {self.db_health_check_interval:g}s idle"
+        )
 
         api_key_display = (
             f"{self.gemini_api_key[:8]}..."
@@ -89,12 +248,85 @@ class Config:
         console.print(f"  Gemini API Key: {api_key_display}")
         console.print(f"  Embedding Model: {self.embedding_model}")
         console.print(f"  Chat Model: {self.chat_model}")
-        console.print(f"  Default Chunk Size: {self.default_chunk_size}")
-        console.print(f"  Default Chunk Overlap: {self.default_chunk_overlap}")
+        console.print(f"  Chat Backend: {self.chat_backend}")
+        console.print(f"  Embedding Backend: {self.embedding_backend}")
+        console.print(f"  Embedding Batch Size: {self.embedding_batch_size}")
+        console.print(f"  Embedding Concurrency: {self.embedding_concurrency}")
+        console.print(
+            "  Embedding Requests/sec: "
+            f"{self.embedding_requests_per_second or 'unlimited'}"
+        )
+        console.print(f"  Embedding Max Retries: {self.embedding_max_retries}")
+        console.print(
+            f"  Embedding Cache: {self.embedding_cache_path}"
+            if self.embedding_cache_enabled
+            else "  Embedding Cache: [yellow]disabled[/yellow]"
+        )
+        console.print(
+            f"  Embedding Cache Max Entries: {self.embedding_cache_max_entries}"
+        )
+        console.print(
+            f"  Query Cache: TTL {self.query_cache_ttl_seconds / 3600:g}h, "
+            f"max {self.query_cache_max_entries} entries, "
+            f"answer distance <= {self.answer_cache_max_distance}"
+            if self.query_cache_enabled
+            else "  Query Cache: [yellow]disabled[/yellow]"
+        )
+        console.print(f"  Chunking Strategy: {self.chunking_strategy}")
+        console.print(
+            f"  Default Chunk Tokens: {self.default_chunk_tokens} "
+            f"(overlap {self.default_chunk_overlap_tokens}, tokenizer {self.tokenizer})"
+        )
+        if self.tokenizer != "estimate":
+            console.print(
+                f"  Tokenizer File: {self.tokenizer_file or '[yellow]not set[/yellow]'}"
+            )
+        console.print(
+            f"  Context Token Budget: {self.context_token_budget:,} "
+            f"(dedupe at {self.context_dedup_threshold:g} overlap)"
+            if self.context_token_budget > 0
+            else "  Context Token Budget: [yellow]unlimited[/yellow]"
+        )
+        if self.rerank_method == "none":
+            console.print("  Re-ranking: [yellow]disabled[/yellow]")
+        else:
+            detail = (
+                f"lambda {self.mmr_lambda:g}"
+                if self.rerank_method == "mmr"
+                else self.rerank_model
+            )
+            console.print(
+                f"  Re-ranking: {self.rerank_method} ({detail}), "
+                f"keep {self.rerank_top_n or 'all'} chunks"
+            )
+        console.print(f"  Default Chunk Size: {self.default_chunk_size} characters")
+        console.print(
+            f"  Default Chunk Overlap: {self.default_chunk_overlap} characters"
+        )
         console.print(
             f"  Default Similarity Threshold: {self.default_similarity_threshold}"
         )
         console.print(f"  Default Max Results: {self.default_max_results}")
+        console.print(f"  Default Search Mode: {self.default_search_mode}")
+        console.print(f"  Hybrid RRF k: {self.rrf_k}")
+        console.print(
+            f"  Default HNSW ef_search: {self.default_ef_search or 'server default'}"
+        )
+        console.print(
+            "  Default ivfflat probes: "
+            f"{self.default_ivfflat_probes or 'server default'}"
+        )
+        console.print(
+            f"  Quantization Re-rank Factor: {self.quantization_rerank_factor}x"
+        )
+        console.print(
+            f"  Filter Pre-filter Rows: up to {self.filter_prefilter_rows:,} chunks"
+        )
+        console.print(f"  Insert Page Size: {self.insert_page_size}")
+        console.print(
+            "  Streaming Threshold: "
+            f"{self.streaming_threshold_bytes / 1024 / 1024:g} MB"
+        )
 
     def get_database_url(self) -> str:
         """Get database connection URL."""
@@ -104,19 +336,31 @@ class Config:
         )
 
 
-# Global config instance
-config = Config()
+# Global config instance, created on first use
+_config: Optional[Config] = None
 
 
 def get_config() -> Config:
-    """Get the global configuration instance."""
-    return config
+    """Get the global configuration instance, loading it on first use."""
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
 
 
 def create_sample_env_file(file_path: str = ".env"):
     """Create a sample .env file with all configuration options."""
     sample_content = """# RAG Magic Configuration
 
+# Storage backend: postgres (pgvector) or local (no database server needed)
+STORAGE_BACKEND=postgres
+# Local backend: store directory, and the chunk count from which searches
+# use IVF partitioning instead of an exact scan (0 disables)
+LOCAL_STORE_PATH=~/.cache/rag_magic/store
+LOCAL_IVF_MIN_ROWS=50000
+# Collection used by commands without --collection (see 'rag-magic collection')
+RAG_COLLECTION=default
+
 # Database Configuration
 POSTGRES_HOST=localhost
 POSTGRES_PORT=5432
@@ -124,6 +368,16 @@ POSTGRES_DB=rag_database
 POSTGRES_USER=rag_user
 POSTGRES_PASSWORD=rag_password
 
+# Connection Pool (connections are reused across operations)
+POSTGRES_POOL_MIN_SIZE=1
+POSTGRES_POOL_MAX_SIZE=10
+# Seconds to wait for a free pooled connection
+POSTGRES_POOL_TIMEOUT=30
+# Per-statement timeout in milliseconds (0 disables)
+POSTGRES_STATEMENT_TIMEOUT_MS=30000
+# Idle seconds after which a connection is checked before reuse
+POSTGRES_HEALTH_CHECK_INTERVAL=30
+
 # Google Gemini Configuration (Required)
 GEMINI_TOKEN=your_gemini_api_key_here
 # Alternative: GOOGLE_API_KEY=your_google_api_key_here
@@ -132,11 +386,77 @@ GEMINI_TOKEN=your_gemini_api_key_here
 EMBEDDING_MODEL=models/text-embedding-004
 CHAT_MODEL=gemini-1.5-flash
 
-# Default Settings
+# Embedding Engine (EMBEDDING_BACKEND=fake runs offline with deterministic vectors)
+EMBEDDING_BACKEND=google
+EMBEDDING_BATCH_SIZE=100
+EMBEDDING_CONCURRENCY=4
+EMBEDDING_REQUESTS_PER_SECOND=10
+EMBEDDING_MAX_RETRIES=5
+# Chat backend for answers (defaults to fake when EMBEDDING_BACKEND=fake)
+# CHAT_BACKEND=google
+
+# Embedding Cache (keyed by model + sha256 of chunk text)
+EMBEDDING_CACHE_ENABLED=true
+# EMBEDDING_CACHE_PATH=~/.cache/rag_magic/embeddings.db
+EMBEDDING_CACHE_MAX_ENTRIES=200000
+
+# Query Cache (question embeddings + semantically matched answers)
+QUERY_CACHE_ENABLED=true
+QUERY_CACHE_TTL_HOURS=24
+QUERY_CACHE_MAX_ENTRIES=10000
+# Reuse an answer when the question is within this cosine distance
+ANSWER_CACHE_MAX_DISTANCE=0.05
+
+# Default Settings (chunk size and overlap in characters, for
+# CHUNKING_STRATEGY=characters)
 DEFAULT_CHUNK_SIZE=1000
 DEFAULT_CHUNK_OVERLAP=200
 DEFAULT_SIMILARITY_THRESHOLD=0.7
 DEFAULT_MAX_RESULTS=10
+# vector, hybrid (vector + full-text, rank fused) or lexical (full-text only)
+DEFAULT_SEARCH_MODE=vector
+RRF_K=60
+# ANN search tuning (higher = better recall, slower); unset uses server defaults
+# DEFAULT_EF_SEARCH=40
+# DEFAULT_IVFFLAT_PROBES=10
+# With a quantized index (rag-magic index build --quantization), searches
+# re-rank this many times the requested candidates at full precision
+QUANTIZATION_RERANK_FACTOR=4
+# Filtered searches (query --source-glob/--doc-id/--meta) whose documents hold
+# at most this many chunks scan just those exactly; broader filters search the
+# index for extra candidates and drop the ones outside the filter
+FILTER_PREFILTER_ROWS=20000
+
+# Chunking: auto (markdown for .md, python for .py, sentence otherwise),
+# sentence, markdown, python, or characters (fixed character windows)
+CHUNKING_STRATEGY=auto
+# Token budget per chunk and overlap for the token-aware strategies
+DEFAULT_CHUNK_TOKENS=256
+DEFAULT_CHUNK_OVERLAP_TOKENS=32
+# tiktoken encoding used to count tokens (cl100k_base or o200k_base), or
+# "estimate"; encodings are read from TOKENIZER_FILE, never downloaded
+TOKENIZER=cl100k_base
+# TOKENIZER_FILE=/path/to/cl100k_base.tiktoken
+
+# Answer prompts: retrieved chunks are deduplicated, adjacent chunks merged,
+# and the best packed into this many tokens (0 = no limit)
+CONTEXT_TOKEN_BUDGET=2000
+CONTEXT_DEDUP_THRESHOLD=0.9
+
+# Re-ranking of search results before answering: none, mmr (Maximal Marginal
+# Relevance over the chunk embeddings, drops redundant chunks) or
+# cross-encoder (local model; pip install 'rag-magic[rerank]')
+RERANK_METHOD=none
+# Chunks kept for the answer out of DEFAULT_MAX_RESULTS (0 = all)
+RERANK_TOP_N=5
+# MMR trade-off: 1 = relevance only, 0 = diversity only
+MMR_LAMBDA=0.7
+RERANK_MODEL=cross-encoder/ms-marco-MiniLM-L-6-v2
+
+# Ingestion Settings
+INSERT_PAGE_SIZE=500
+# Files larger than this are chunked and embedded as a stream
+STREAMING_THRESHOLD_MB=16
 """
 
     env_path = Path(file_path)
@@ -0,0 +1,203 @@
+"""Context assembly for RAG Magic answer prompts.
+
+Retrieved chunks are turned into the prompt's context in three steps:
+
+1. **Dedupe**: a chunk whose word shingles mostly match a better-ranked
+   chunk (the same passage ingested twice, boilerplate) is dropped.
+2. **Merge**: chunks of the same document with consecutive ``chunk_index``
+   values are joined into one block, with the text they share through
+   chunk overlap included once.
+3. **Pack**: blocks are added best first while they fit the token budget.
+
+Blocks keep the rank of their best chunk, and text inside a block stays in
+document order.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from .chunking import Tokenizer, get_tokenizer
+
+DEFAULT_DEDUP_THRESHOLD = 0.9
+
+# Words per shingle when comparing chunks for near-duplicates
+_SHINGLE_WORDS = 3
+
+# Longest chunk overlap looked for when merging adjacent chunks, in characters
+_MAX_OVERLAP_CHARS = 4000
+
+
+@dataclass
+class ContextBlock:
+    """Consecutive chunks of one document, merged."""
+
+    document_id: Optional[int]
+    chunk_ids: List[int]
+    content: str
+    rank: int
+    tokens: int = 0
+
+
+@dataclass
+class PackedContext:
+    """The context chosen for a prompt and what assembling it saved."""
+
+    blocks: List[ContextBlock] = field(default_factory=list)
+    tokens: int = 0
+    # Tokens of the retrieved chunks as-is, before assembly
+    input_tokens: int = 0
+    merged: int = 0
+    deduplicated: int = 0
+    dropped: int = 0
+
+    @property
+    def texts(self) -> List[str]:
+        return [block.content for block in self.blocks]
+
+    def summary(self) -> str:
+        """One-line description for the CLI."""
+        parts = [f"{len(self.blocks)} blocks, {self.tokens:,} tokens"]
+        if self.input_tokens:
+            parts.append(f"from {self.input_tokens:,}")
+        for count, label in (
+            (self.merged, "merged"),
+            (self.deduplicated, "deduplicated"),
+            (self.dropped, "over budget"),
+        ):
+            if count:
+                parts.append(f"{count} {label}")
+        return ", ".join(parts)
+
+
+def _shingles(text: str) -> Set[tuple]:
+    words = text.lower().split()
+    if len(words) <= _SHINGLE_WORDS:
+        return {tuple(words)}
+    return {
+        tuple(words[i : i + _SHINGLE_WORDS])
+        for i in range(len(words) - _SHINGLE_WORDS + 1)
+    }
+
+
+def _similarity(a: Set[tuple], b: Set[tuple]) -> float:
+    """Share of the smaller shingle set found in the other (containment)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of ``first`` that starts ``second``."""
+    limit = min(len(first), len(second), _MAX_OVERLAP_CHARS)
+    for start in range(len(first) - limit, len(first)):
+        if second.startswith(first[start:]):
+            return len(first) - start
+    return 0
+
+
+def _join(first: str, second: str) -> str:
+    overlap = _overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    return f"{first}\n{second}"
+
+
+def deduplicate(
+    results: Sequence[Dict[str, Any]], threshold: float = DEFAULT_DEDUP_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """Drop chunks that are near-copies of a better-ranked chunk.
+
+    Two chunks are near-copies when at least ``threshold`` of the smaller
+    one's word shingles appear in the other. Chunks next to each other in
+    the same document are never dropped; their overlap is merged instead.
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_shingles: List[Set[tuple]] = []
+    for hit in results:
+        shingles = _shingles(hit["content"])
+        if not any(
+            _similarity(shingles, other) >= threshold and not _adjacent(hit, previous)
+            for previous, other in zip(kept, kept_shingles)
+        ):
+            kept.append(hit)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def _adjacent(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return (
+        a.get("chunk_index") is not None
+        and b.get("chunk_index") is not None
+        and a.get("document_id") == b.get("document_id")
+        and abs(a["chunk_index"] - b["chunk_index"]) == 1
+    )
+
+
+def merge_adjacent(results: Sequence[Dict[str, Any]]) -> List[ContextBlock]:
+    """Merge chunks with consecutive ``chunk_index`` values in one document.
+
+    ``results`` are best first; each block is ranked by its best chunk.
+    Chunks without a ``chunk_index`` become blocks on their own.
+    """
+    ranked = list(enumerate(results))
+    ordered = sorted(
+        (item for item in ranked if item[1].get("chunk_index") is not None),
+        key=lambda item: (item[1].get("document_id"), item[1]["chunk_index"]),
+    )
+    blocks: List[ContextBlock] = []
+    previous: Optional[Dict[str, Any]] = None
+    for rank, hit in ordered:
+        if previous is not None and _adjacent(previous, hit):
+            block = blocks[-1]
+            block.chunk_ids.append(hit["id"])
+            block.content = _join(block.content, hit["content"])
+            block.rank = min(block.rank, rank)
+        else:
+            blocks.append(
+                ContextBlock(hit.get("document_id"), [hit["id"]], hit["content"], rank)
+            )
+        previous = hit
+    blocks.extend(
+        ContextBlock(hit.get("document_id"), [hit["id"]], hit["content"], rank)
+        for rank, hit in ranked
+        if hit.get("chunk_index") is None
+    )
+    return sorted(blocks, key=lambda block: block.rank)
+
+
+def assemble_context(
+    results: Sequence[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD,
+    tokenizer: Optional[Tokenizer] = None,
+) -> PackedContext:
+    """Dedupe, merge and pack retrieved chunks (best first) into a context.
+
+    Blocks that do not fit the remaining ``token_budget`` are skipped, so a
+    smaller lower-ranked block can still fill the space. If even the best
+    block is over the budget it is truncated to it, so the prompt is never
+    empty. ``token_budget`` of None or 0 packs everything.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    packed = PackedContext(
+        input_tokens=sum(tokenizer.count(hit["content"]) for hit in results)
+    )
+    kept = deduplicate(results, dedup_threshold)
+    packed.deduplicated = len(results) - len(kept)
+    blocks = merge_adjacent(kept)
+    packed.merged = len(kept) - len(blocks)
+
+    for block in blocks:
+        block.tokens = tokenizer.count(block.content)
+        if not token_budget or packed.tokens + block.tokens <= token_budget:
+            packed.blocks.append(block)
+            packed.tokens += block.tokens
+        elif not packed.blocks and block is blocks[0]:
+            tokens = tokenizer.encode(block.content)[:token_budget]
+            block.content = tokenizer.decode(tokens)
+            block.tokens = len(tokens)
+            packed.blocks.append(block)
+            packed.tokens += block.tokens
+        else:
+            packed.dropped += 1
+    return packed
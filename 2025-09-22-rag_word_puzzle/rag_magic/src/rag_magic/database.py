@@ -1,18 +1,331 @@
 """Database connection and utilities for RAG Magic."""
 
+import json
 import os
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 import psycopg2
-from psycopg2.extras import Json, RealDictCursor
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from rich.console import Console
-from rich.table import Table
+
+from . import tracing
+from .filters import (
+    DEFAULT_PREFILTER_ROWS,
+    FilterPlan,
+    SearchFilter,
+    glob_to_like,
+    plan_filter,
+)
+from .indexing import IndexSpec, recommended_lists
+from .quantization import DEFAULT_RERANK_FACTOR
+from .registry import (
+    DEFAULT_COLLECTION,
+    Collection,
+    check_collection_name,
+    collection_table,
+)
+
+# Also re-exports backend-independent names (SEARCH_MODES,
+# AsyncDatabaseConnection, display_documents_table) that used to live here
+from .storage import (  # noqa: F401
+    DEFAULT_PAGE_SIZE,
+    SEARCH_MODES,
+    AsyncDatabaseConnection,
+    EmbeddingRow,
+    IndexedEmbeddingRow,
+    NewDocument,
+    StorageBackend,
+    display_documents_table,
+    report_throughput,
+)
 
 console = Console()
 
+# Embeddings table, ANN index and vector width of the default collection
+EMBEDDINGS_TABLE = "rag.embeddings"
+INDEX_NAME = "embeddings_embedding_idx"
+EMBEDDING_DIMENSIONS = 768
+
+# pgvector's limits on indexed vector width, per index operand type
+MAX_INDEX_DIMENSIONS = {"none": 2000, "halfvec": 4000, "binary": 64000}
+
+# The SQL templates below are formatted with the collection's embeddings
+# table as {embeddings}.
+
+# Top-k by distance first, so the ANN index can serve the ORDER BY ... LIMIT
+# directly; the distance is computed once and the threshold applied after.
+TOP_K_SEARCH_SQL = """
+    SELECT id, document_id, chunk_index, content, 1 - distance AS similarity, metadata
+    FROM (
+        SELECT e.id, e.document_id, e.chunk_index, e.content, e.metadata,
+               e.embedding <=> %(embedding)s::vector AS distance
+        FROM {embeddings} e
+        ORDER BY e.embedding <=> %(embedding)s::vector
+        LIMIT %(candidates)s
+    ) AS top_k
+    {postfilter}
+    ORDER BY distance
+"""
+
+# Quantized searches take the ``rerank`` nearest rows by the quantized
+# distance (served by the expression index), then re-rank them by exact
+# distance on the full-precision vectors.
+QUANTIZED_TOP_K_SEARCH_SQL = """
+    SELECT id, document_id, chunk_index, content, 1 - distance AS similarity, metadata
+    FROM (
+        SELECT e.id, e.document_id, e.chunk_index, e.content, e.metadata,
+               e.embedding <=> %(embedding)s::vector AS distance
+        FROM {embeddings} e
+        WHERE e.id IN (
+            SELECT id FROM {embeddings}
+            ORDER BY {expression} {operator} {query}
+            LIMIT %(rerank)s
+        )
+        ORDER BY distance
+        LIMIT %(candidates)s
+    ) AS top_k
+    {postfilter}
+    ORDER BY distance
+"""
+
+# Lexical candidates: any query word may match ("a | b" rather than "a & b"),
+# ranked with length-normalized ts_rank
+LEXICAL_SEARCH_SQL = """
+    SELECT e.id, e.document_id, e.chunk_index, e.content, e.metadata,
+           ts_rank(e.content_tsv, q.query, 1) AS lexical_score
+    FROM {embeddings} e,
+         (SELECT replace(
+                     plainto_tsquery('simple', %(text)s)::text, ' & ', ' | '
+                 )::tsquery AS query) AS q
+    WHERE e.content_tsv @@ q.query {filter}
+    ORDER BY lexical_score DESC
+    LIMIT %(candidates)s
+"""
+
+# Filtered searches (see rag_magic.filters) are restricted to the chunks of
+# the documents in %(document_ids)s. Pre-filtering replaces {embeddings} with
+# just those chunks, found through the document_id index; OFFSET 0 stops the
+# planner from flattening the subquery and serving the ORDER BY from the ANN
+# index, so the (small) filtered set is scanned exactly.
+PREFILTERED_EMBEDDINGS_SQL = """(
+        SELECT id, document_id, chunk_index, content, metadata, embedding
+        FROM {embeddings}
+        WHERE document_id = ANY(%(document_ids)s)
+        OFFSET 0
+    )"""
+# Post-filtering drops top-k candidates outside the filter
+POSTFILTER_SQL = "WHERE document_id = ANY(%(document_ids)s)"
+LEXICAL_FILTER_SQL = "AND e.document_id = ANY(%(document_ids)s)"
+
+# The documents of the collection matching a filter's {conditions}, how many
+# documents the collection has and how many chunks the matching documents
+# hold, counted up to %(bound)s. The source pattern is served by
+# documents_collection_source_pattern_idx and metadata containment by the
+# GIN index documents_metadata_idx.
+FILTER_PLAN_SQL = """
+    WITH matching AS (
+        SELECT id FROM rag.documents
+        WHERE collection = %(collection)s {conditions}
+    )
+    SELECT
+        ARRAY(SELECT id FROM matching ORDER BY id) AS document_ids,
+        (SELECT count(*) FROM rag.documents WHERE collection = %(collection)s)
+            AS documents,
+        (SELECT count(*) FROM (
+            SELECT 1 FROM {embeddings}
+            WHERE document_id IN (SELECT id FROM matching)
+            LIMIT %(bound)s
+        ) AS chunks) AS chunk_rows
+"""
+
+# Reciprocal rank fusion of the vector and lexical candidate lists:
+# score = sum over lists of 1 / (rrf_k + rank)
+HYBRID_SEARCH_SQL = """
+    WITH vector AS (
+        SELECT id, row_number() OVER (ORDER BY similarity DESC) AS rank
+        FROM ({top_k}) AS v
+    ),
+    lexical AS (
+        SELECT id, lexical_score,
+               row_number() OVER (ORDER BY lexical_score DESC) AS rank
+        FROM ({lexical}) AS l
+    )
+    SELECT e.id, e.document_id, e.chunk_index, e.content, e.metadata,
+           1 - (e.embedding <=> %(embedding)s::vector) AS similarity,
+           lexical.lexical_score,
+           COALESCE(1.0 / (%(rrf_k)s + vector.rank), 0)
+             + COALESCE(1.0 / (%(rrf_k)s + lexical.rank), 0) AS score
+    FROM vector
+    FULL OUTER JOIN lexical ON lexical.id = vector.id
+    JOIN {embeddings} e ON e.id = COALESCE(vector.id, lexical.id)
+    ORDER BY score DESC
+    LIMIT %(limit)s
+"""
+
+# A collection's embeddings table, mirroring rag.embeddings; formatted with
+# the qualified {table}, its unqualified {name} and the vector {dimension}
+COLLECTION_TABLE_SQL = """
+    CREATE TABLE {table} (
+        id SERIAL PRIMARY KEY,
+        document_id INTEGER REFERENCES rag.documents(id) ON DELETE CASCADE,
+        chunk_index INTEGER DEFAULT 0,
+        content TEXT NOT NULL,
+        embedding vector({dimension}),
+        metadata JSONB DEFAULT '{{}}',
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+    );
+    CREATE INDEX {name}_document_id_idx ON {table}(document_id);
+    CREATE INDEX {name}_content_tsv_idx ON {table} USING gin (content_tsv);
+"""
+
+# Operator classes of the quantized expression indexes
+QUANTIZED_OPCLASSES = {"halfvec": "halfvec_cosine_ops", "binary": "bit_hamming_ops"}
+
+
+def index_name(collection: str) -> str:
+    """Name of the ANN index on ``collection``'s embeddings table."""
+    return f"{collection_table(collection)}_embedding_idx"
+
+
+def quantized_index(
+    quantization: str, dimension: int = EMBEDDING_DIMENSIONS
+) -> Tuple[str, str, str, str]:
+    """How a quantized index is built and searched.
+
+    Quantized indexes are expression indexes over the full-precision column.
+    Returns (indexed expression, operator class, distance operator, query
+    expression); searches must order by the same expression for the planner
+    to use the index.
+    """
+    if quantization == "halfvec":
+        return (
+            f"(embedding::halfvec({dimension}))",
+            QUANTIZED_OPCLASSES["halfvec"],
+            "<=>",
+            f"%(embedding)s::halfvec({dimension})",
+        )
+    if quantization == "binary":
+        return (
+            f"(binary_quantize(embedding)::bit({dimension}))",
+            QUANTIZED_OPCLASSES["binary"],
+            "<~>",
+            "binary_quantize(%(embedding)s::vector)",
+        )
+    raise ValueError(f"No quantized index for: {quantization}")
+
+
+def create_index_sql(
+    spec: IndexSpec,
+    name: str = INDEX_NAME,
+    table: str = EMBEDDINGS_TABLE,
+    dimension: int = EMBEDDING_DIMENSIONS,
+) -> str:
+    """The CREATE INDEX statement building ``spec`` as ``name`` on ``table``."""
+    expression, opclass = "embedding", "vector_cosine_ops"
+    if spec.quantization not in (None, "none"):
+        expression, opclass, _, _ = quantized_index(spec.quantization, dimension)
+    return (
+        f"CREATE INDEX {name} ON {table} "
+        f"USING {spec.method} ({expression} {opclass}) "
+        f"WITH ({spec.with_params()})"
+    )
+
+
+def _plan_nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
 
-class DatabaseConnection:
-    """Handles PostgreSQL database connections and operations."""
+def top_k_sql(
+    quantization: str = "none",
+    embeddings: str = EMBEDDINGS_TABLE,
+    dimension: int = EMBEDDING_DIMENSIONS,
+    filtering: Optional[str] = None,
+) -> str:
+    """The top-k similarity query over ``embeddings`` for a ``quantization`` index.
+
+    ``filtering`` is None, "pre" or "post" (see :data:`PREFILTERED_EMBEDDINGS_SQL`).
+    Pre-filtered queries scan full-precision vectors, so ignore ``quantization``.
+    """
+    postfilter = POSTFILTER_SQL if filtering == "post" else ""
+    if filtering == "pre":
+        embeddings = PREFILTERED_EMBEDDINGS_SQL.format(embeddings=embeddings)
+        quantization = "none"
+    if quantization == "none":
+        return TOP_K_SEARCH_SQL.format(embeddings=embeddings, postfilter=postfilter)
+    expression, _, operator, query = quantized_index(quantization, dimension)
+    return QUANTIZED_TOP_K_SEARCH_SQL.format(
+        embeddings=embeddings,
+        expression=expression,
+        operator=operator,
+        query=query,
+        postfilter=postfilter,
+    )
+
+
+def lexical_search_sql(
+    embeddings: str = EMBEDDINGS_TABLE, filtered: bool = False
+) -> str:
+    """The lexical query over ``embeddings``, optionally limited to %(document_ids)s."""
+    return LEXICAL_SEARCH_SQL.format(
+        embeddings=embeddings, filter=LEXICAL_FILTER_SQL if filtered else ""
+    )
+
+
+def hybrid_search_sql(
+    top_k: str, embeddings: str = EMBEDDINGS_TABLE, filtered: bool = False
+) -> str:
+    """The hybrid (RRF) query fusing ``top_k`` with lexical search on ``embeddings``."""
+    return HYBRID_SEARCH_SQL.format(
+        top_k=top_k,
+        lexical=lexical_search_sql(embeddings, filtered),
+        embeddings=embeddings,
+    )
+
+
+# pgvector defaults and upper bounds for the ANN search widening
+DEFAULT_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+DEFAULT_PROBES = 1
+MAX_PROBES = 1024
+
+
+def to_vector_literal(embedding: Sequence[float]) -> str:
+    """Format an embedding as a pgvector text literal, e.g. '[0.1,0.2]'."""
+    return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+
+def from_vector_literal(literal: str) -> List[float]:
+    """Parse a pgvector text literal (an ``embedding::text`` value)."""
+    return [float(value) for value in literal.strip("[]").split(",")]
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no pooled connection becomes free within the timeout."""
+
+
+class DatabaseConnection(StorageBackend):
+    """Handles PostgreSQL database connections and operations.
+
+    Operations borrow connections from a thread-safe pool that is opened on
+    first use and shared by every method, so a long-running process reuses
+    connections instead of connecting per call. The pool never holds more
+    than ``max_size`` connections; callers beyond that wait up to
+    ``pool_timeout`` seconds. Idle connections are health-checked before
+    being handed out, and every session gets ``statement_timeout_ms``.
+
+    Documents live in ``rag.documents``, tagged with their collection; each
+    collection's chunks and ANN index live in its own embeddings table
+    (``rag.embeddings`` for the default collection).
+    """
+
+    backend = "postgres"
 
     def __init__(
         self,
@@ -21,16 +334,42 @@ class DatabaseConnection:
         database: str = "rag_database",
         user: str = "rag_user",
         password: str = "rag_password",
+        min_size: int = 1,
+        max_size: int = 10,
+        pool_timeout: float = 30.0,
+        statement_timeout_ms: int = 30_000,
+        health_check_interval: float = 30.0,
+        rerank_factor: int = DEFAULT_RERANK_FACTOR,
+        collection: str = DEFAULT_COLLECTION,
+        prefilter_rows: int = DEFAULT_PREFILTER_ROWS,
     ):
         self.host = host
         self.port = port
         self.database = database
         self.user = user
         self.password = password
-        self._connection = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool_timeout = pool_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_interval = health_check_interval
+        self.rerank_factor = rerank_factor
+        self.prefilter_rows = prefilter_rows
+        self.collection = check_collection_name(collection)
+        self.table_name = collection_table(collection)
+        self.embeddings_table = f"rag.{self.table_name}"
+        self.index_name = index_name(collection)
+        # Quantization of the embedding index and the vector width, read
+        # from the catalog on use
+        self._quantization: Optional[str] = None
+        self.dimension: int = EMBEDDING_DIMENSIONS
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
 
     @classmethod
-    def from_env(cls) -> "DatabaseConnection":
+    def from_env(cls, collection: Optional[str] = None) -> "DatabaseConnection":
         """Create database connection from environment variables."""
         return cls(
             host=os.getenv("POSTGRES_HOST", "localhost"),
@@ -38,29 +377,143 @@ class DatabaseConnection:
             database=os.getenv("POSTGRES_DB", "rag_database"),
             user=os.getenv("POSTGRES_USER", "rag_user"),
             password=os.getenv("POSTGRES_PASSWORD", "rag_password"),
+            min_size=int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1")),
+            max_size=int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10")),
+            pool_timeout=float(os.getenv("POSTGRES_POOL_TIMEOUT", "30")),
+            statement_timeout_ms=int(
+                os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "30000")
+            ),
+            health_check_interval=float(
+                os.getenv("POSTGRES_HEALTH_CHECK_INTERVAL", "30")
+            ),
+            rerank_factor=int(
+                os.getenv("QUANTIZATION_RERANK_FACTOR", str(DEFAULT_RERANK_FACTOR))
+            ),
+            collection=collection or DEFAULT_COLLECTION,
+            prefilter_rows=int(
+                os.getenv("FILTER_PREFILTER_ROWS", str(DEFAULT_PREFILTER_ROWS))
+            ),
         )
 
     def connect(self) -> bool:
-        """Establish database connection."""
-        try:
-            self._connection = psycopg2.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                cursor_factory=RealDictCursor,
+        """Open the connection pool (a no-op if it is already open)."""
+        with self._lock:
+            if self._pool:
+                return True
+            options = (
+                f"-c statement_timeout={self.statement_timeout_ms}"
+                if self.statement_timeout_ms > 0
+                else None
             )
+            try:
+                self._pool = ThreadedConnectionPool(
+                    min(self.min_size, self.max_size),
+                    self.max_size,
+                    host=self.host,
+                    port=self.port,
+                    database=self.database,
+                    user=self.user,
+                    password=self.password,
+                    cursor_factory=RealDictCursor,
+                    options=options,
+                )
+                self._last_used.clear()
+                return True
+            except psycopg2.Error as e:
+                console.print(f"[red]Database connection failed: {e}[/red]")
+                return False
+
+    def disconnect(self):
+        """Close every pooled connection."""
+        with self._lock:
+            if self._pool:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+            self._quantization = None
+
+    def _is_healthy(self, conn) -> bool:
+        """Check a connection that has been idle past the health-check interval."""
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle < self.health_check_interval:
             return True
-        except psycopg2.Error as e:
-            console.print(f"[red]Database connection failed: {e}[/red]")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
             return False
 
-    def disconnect(self):
-        """Close database connection."""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
+    def _acquire(self) -> Tuple[ThreadedConnectionPool, Any]:
+        """Take a healthy connection from the pool, waiting for a free slot.
+
+        Returns the pool along with the connection, so it goes back to the
+        pool that issued it even if the pool is reopened meanwhile.
+        """
+        if not self._slots.acquire(timeout=self.pool_timeout):
+            raise PoolTimeoutError(
+                f"No database connection available within {self.pool_timeout}s "
+                f"(pool max size {self.max_size})"
+            )
+        try:
+            pool = self._pool
+            if pool is None:
+                raise PoolError("The connection pool is closed")
+            # Each broken connection is discarded, so this terminates
+            for _ in range(self.max_size + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    return pool, conn
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+            raise PoolError("Could not obtain a healthy database connection")
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, pool: ThreadedConnectionPool, conn):
+        """Return a connection to ``pool``, discarding it if it is broken.
+
+        Connections of a pool that has since been closed are just closed.
+        """
+        try:
+            if pool is self._pool:
+                broken = bool(conn.closed)
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn, close=broken)
+            else:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrow a pooled connection for one unit of work.
+
+        The transaction is rolled back if the block raises, and the
+        connection goes back to the pool afterwards.
+        """
+        if not self._pool and not self.connect():
+            raise psycopg2.OperationalError("Database connection failed")
+        with tracing.span("db.acquire"):
+            pool, conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._release(pool, conn)
 
     def test_connection(self) -> bool:
         """Test database connectivity and schema."""
@@ -68,7 +521,7 @@ class DatabaseConnection:
             return False
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 # Test basic connectivity
                 cursor.execute("SELECT version();")
                 version = cursor.fetchone()
@@ -107,15 +560,44 @@ class DatabaseConnection:
                     console.print(f"[red]✗ Missing tables. Found: {tables}[/red]")
                     return False
 
+                cursor.execute(
+                    "SELECT to_regclass('rag.collections') AS registry, "
+                    "to_regclass(%s) AS embeddings",
+                    (self.embeddings_table,),
+                )
+                row = cursor.fetchone()
+                if not row["registry"]:
+                    console.print(
+                        "[red]✗ Collection registry not found; "
+                        "run 'rag-magic migrate'[/red]"
+                    )
+                    return False
+                if not row["embeddings"]:
+                    console.print(
+                        f"[red]✗ Collection '{self.collection}' not found; create it "
+                        "with 'rag-magic collection create'[/red]"
+                    )
+                    return False
+                console.print(
+                    f"[green]✓ Collection '{self.collection}' "
+                    f"({self.embeddings_table})[/green]"
+                )
+
+                quantization = self.index_quantization(cursor)
+                if quantization != "none":
+                    console.print(
+                        f"[green]✓ {quantization} quantized index "
+                        f"(re-ranking {self.rerank_factor}x candidates)[/green]"
+                    )
+
                 console.print("[green]✓ Database is ready for RAG operations[/green]")
                 return True
 
         except psycopg2.Error as e:
             console.print(f"[red]Database test failed: {e}[/red]")
             return False
-        finally:
-            self.disconnect()
 
+    @tracing.traced("db.insert_document")
     def insert_document(
         self,
         title: str,
@@ -124,30 +606,31 @@ class DatabaseConnection:
         metadata: Optional[Dict[str, Any]] = None,
     ) -> Optional[int]:
         """Insert a document and return its ID."""
-        if not self._connection:
+        if not self._pool:
             if not self.connect():
                 return None
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(
                     """
-                    INSERT INTO rag.documents (title, content, source, metadata)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO rag.documents
+                        (title, content, source, metadata, collection)
+                    VALUES (%s, %s, %s, %s, %s)
                     RETURNING id
                 """,
-                    (title, content, source, Json(metadata or {})),
+                    (title, content, source, Json(metadata or {}), self.collection),
                 )
 
                 document_id = cursor.fetchone()["id"]
-                self._connection.commit()
+                conn.commit()
                 return document_id
 
         except psycopg2.Error as e:
             console.print(f"[red]Failed to insert document: {e}[/red]")
-            self._connection.rollback()
             return None
 
+    @tracing.traced("db.insert_embedding")
     def insert_embedding(
         self,
         document_id: int,
@@ -157,15 +640,16 @@ class DatabaseConnection:
         metadata: Optional[Dict[str, Any]] = None,
     ) -> bool:
         """Insert an embedding for a document chunk."""
-        if not self._connection:
+        if not self._pool:
             if not self.connect():
                 return False
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(
-                    """
-                    INSERT INTO rag.embeddings (document_id, chunk_index, content, embedding, metadata)
+                    f"""
+                    INSERT INTO {self.embeddings_table}
+                        (document_id, chunk_index, content, embedding, metadata)
                     VALUES (%s, %s, %s, %s, %s)
                 """,
                     (
@@ -177,47 +661,850 @@ class DatabaseConnection:
                     ),
                 )
 
-                self._connection.commit()
+                conn.commit()
+                tracing.count("rows_written")
                 return True
 
         except psycopg2.Error as e:
             console.print(f"[red]Failed to insert embedding: {e}[/red]")
-            self._connection.rollback()
             return False
 
-    def similarity_search(
-        self, query_embedding: List[float], threshold: float = 0.7, limit: int = 10
-    ) -> List[Dict[str, Any]]:
-        """Perform similarity search on embeddings."""
-        if not self._connection:
+    def _write_embedding_rows(
+        self,
+        cursor,
+        document_id: int,
+        rows: Iterable[EmbeddingRow],
+        page_size: int,
+        start_index: int = 0,
+    ) -> int:
+        """Stream rows numbered from ``start_index`` into the embeddings table.
+
+        Rows are consumed lazily, so ``rows`` may be a generator. Returns the
+        number of rows written. The caller owns the transaction.
+        """
+        return self._write_indexed_rows(
+            cursor,
+            document_id,
+            ((start_index + offset, *row) for offset, row in enumerate(rows)),
+            page_size,
+        )
+
+    def _write_indexed_rows(
+        self,
+        cursor,
+        document_id: int,
+        rows: Iterable[IndexedEmbeddingRow],
+        page_size: int,
+    ) -> int:
+        """Write ``(chunk_index, content, embedding, metadata)`` rows in pages."""
+        written = 0
+
+        def values() -> Iterator[tuple]:
+            nonlocal written
+            for chunk_index, content, embedding, metadata in rows:
+                written += 1
+                yield (
+                    document_id,
+                    chunk_index,
+                    content,
+                    to_vector_literal(embedding),
+                    Json(metadata or {}),
+                )
+
+        execute_values(
+            cursor,
+            f"""
+            INSERT INTO {self.embeddings_table}
+                (document_id, chunk_index, content, embedding, metadata)
+            VALUES %s
+            """,
+            values(),
+            template="(%s, %s, %s, %s::vector, %s)",
+            page_size=page_size,
+        )
+        tracing.count("rows_written", written)
+        return written
+
+    @tracing.traced("db.insert_embeddings")
+    def insert_embeddings(
+        self,
+        document_id: int,
+        rows: Iterable[EmbeddingRow],
+        page_size: int = DEFAULT_PAGE_SIZE,
+        start_index: int = 0,
+    ) -> int:
+        """Bulk insert embeddings for a document in a single transaction.
+
+        Returns the number of rows inserted (0 on failure).
+        """
+        if not self._pool:
+            if not self.connect():
+                return 0
+
+        started = time.perf_counter()
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                written = self._write_embedding_rows(
+                    cursor, document_id, rows, page_size, start_index
+                )
+                conn.commit()
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to bulk insert embeddings: {e}[/red]")
+            return 0
+
+        report_throughput(written, time.perf_counter() - started)
+        return written
+
+    @tracing.traced("db.insert_documents")
+    def insert_documents_with_embeddings(
+        self,
+        documents: Iterable[NewDocument],
+        page_size: int = DEFAULT_PAGE_SIZE,
+        report: bool = True,
+    ) -> Optional[List[int]]:
+        """Insert several documents and their embeddings in one transaction.
+
+        Returns the new document IDs in input order, or None on failure.
+        Set ``report=False`` to suppress the throughput message.
+        """
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        started = time.perf_counter()
+        document_ids = []
+        written = 0
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                for document in documents:
+                    cursor.execute(
+                        """
+                        INSERT INTO rag.documents
+                            (title, content, source, metadata, collection)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id
+                    """,
+                        (
+                            document.title,
+                            document.content,
+                            document.source,
+                            Json(document.metadata or {}),
+                            self.collection,
+                        ),
+                    )
+                    document_id = cursor.fetchone()["id"]
+                    rows_written = self._write_embedding_rows(
+                        cursor, document_id, document.rows, page_size
+                    )
+                    if "total_chunks" not in (document.metadata or {}):
+                        # Streamed rows are only counted once they are written
+                        cursor.execute(
+                            """
+                            UPDATE rag.documents
+                            SET metadata = metadata
+                                || jsonb_build_object('total_chunks', %s)
+                            WHERE id = %s
+                        """,
+                            (rows_written, document_id),
+                        )
+                    written += rows_written
+                    document_ids.append(document_id)
+                conn.commit()
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to ingest documents: {e}[/red]")
+            return None
+
+        if report:
+            report_throughput(written, time.perf_counter() - started)
+        return document_ids
+
+    @tracing.traced("db.get_existing_sources")
+    def get_existing_sources(self, sources: List[str]) -> Set[str]:
+        """Return which of ``sources`` already have a document."""
+        if not self._pool:
+            if not self.connect():
+                return set()
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT source FROM rag.documents "
+                    "WHERE collection = %s AND source = ANY(%s)",
+                    (self.collection, sources),
+                )
+                return {row["source"] for row in cursor.fetchall()}
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to look up documents: {e}[/red]")
+            return set()
+
+    @tracing.traced("db.get_chunk_hashes", count_rows="rows_read")
+    def get_chunk_hashes(self, document_id: int) -> List[Dict[str, Any]]:
+        """Get id, chunk_index and sha256 content hash of a document's chunks.
+
+        Hashes are computed server-side so chunk text is not transferred.
+        """
+        if not self._pool:
             if not self.connect():
                 return []
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT
+                        id,
+                        chunk_index,
+                        encode(sha256(convert_to(content, 'UTF8')), 'hex')
+                            AS content_hash
+                    FROM {self.embeddings_table}
+                    WHERE document_id = %s
+                    ORDER BY chunk_index
+                """,
+                    (document_id,),
+                )
+                return [dict(row) for row in cursor.fetchall()]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to get chunk hashes: {e}[/red]")
+            return []
+
+    @tracing.traced("db.apply_chunk_diff")
+    def apply_chunk_diff(
+        self,
+        document_id: int,
+        content: str,
+        metadata: Dict[str, Any],
+        moved: List[Tuple[int, int]],
+        deleted: List[int],
+        inserted: Iterable[IndexedEmbeddingRow],
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> bool:
+        """Apply an incremental chunk diff to a document in one transaction.
+
+        Deletes removed chunk rows, renumbers moved rows in place, inserts new
+        ``(chunk_index, content, embedding, metadata)`` rows and refreshes the
+        document's content and metadata. Unchanged rows are not touched.
+        """
+        if not self._pool:
+            if not self.connect():
+                return False
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                if deleted:
+                    cursor.execute(
+                        f"DELETE FROM {self.embeddings_table} WHERE id = ANY(%s)",
+                        (deleted,),
+                    )
+                if moved:
+                    execute_values(
+                        cursor,
+                        f"""
+                        UPDATE {self.embeddings_table} AS e
+                        SET chunk_index = v.chunk_index
+                        FROM (VALUES %s) AS v(id, chunk_index)
+                        WHERE e.id = v.id
+                        """,
+                        moved,
+                        page_size=page_size,
+                    )
+                self._write_indexed_rows(cursor, document_id, inserted, page_size)
                 cursor.execute(
                     """
-                    SELECT * FROM rag.similarity_search(%s::vector, %s, %s)
+                    UPDATE rag.documents SET content = %s, metadata = %s
+                    WHERE id = %s
                 """,
-                    (query_embedding, threshold, limit),
+                    (content, Json(metadata), document_id),
                 )
+                conn.commit()
+            return True
 
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to apply incremental update: {e}[/red]")
+            return False
+
+    @staticmethod
+    def set_search_params(
+        cursor,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ):
+        """Apply ANN tuning for the current transaction only.
+
+        ``ef_search`` sets ``hnsw.ef_search`` and ``probes`` sets
+        ``ivfflat.probes``; higher values trade latency for recall.
+        ``exact`` disables index scans so the search is brute force.
+        """
+        settings = []
+        if ef_search:
+            settings.append(("hnsw.ef_search", str(int(ef_search))))
+        if probes:
+            settings.append(("ivfflat.probes", str(int(probes))))
+        if exact:
+            settings.append(("enable_indexscan", "off"))
+        if settings:
+            # One round trip for every setting
+            cursor.execute(
+                "SELECT " + ", ".join("set_config(%s, %s, true)" for _ in settings),
+                [value for setting in settings for value in setting],
+            )
+
+    def index_quantization(self, cursor, refresh: bool = False) -> str:
+        """Quantization of the embedding index, read from its definition.
+
+        Also reads the width of the embedding column. Both are cached until
+        ``refresh``, a disconnect or an index rebuild through
+        :meth:`build_index`.
+        """
+        if self._quantization is None or refresh:
+            cursor.execute(
+                """
+                SELECT
+                    (SELECT indexdef FROM pg_indexes
+                     WHERE schemaname = 'rag' AND indexname = %s) AS indexdef,
+                    (SELECT atttypmod FROM pg_attribute
+                     WHERE attrelid = to_regclass(%s) AND attname = 'embedding')
+                        AS dimension
+            """,
+                (self.index_name, self.embeddings_table),
+            )
+            row = cursor.fetchone() or {}
+            definition = row.get("indexdef") or ""
+            self.dimension = row.get("dimension") or EMBEDDING_DIMENSIONS
+            self._quantization = next(
+                (
+                    mode
+                    for mode, opclass in QUANTIZED_OPCLASSES.items()
+                    if opclass in definition
+                ),
+                "none",
+            )
+        return self._quantization
+
+    def partitions(self, cursor) -> List[str]:
+        """Names of the embeddings table's partitions; empty if it has none."""
+        cursor.execute(
+            """
+            SELECT c.relname AS name
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """,
+            (self.embeddings_table,),
+        )
+        return [row["name"] for row in cursor.fetchall()]
+
+    def top_k_sql(
+        self, quantization: str = "none", filtering: Optional[str] = None
+    ) -> str:
+        """The top-k query over this collection (see :func:`top_k_sql`)."""
+        return top_k_sql(quantization, self.embeddings_table, self.dimension, filtering)
+
+    def filter_plan(self, cursor, filters: SearchFilter) -> FilterPlan:
+        """Resolve ``filters`` to document IDs and choose pre- or post-filtering."""
+        conditions = []
+        params: Dict[str, Any] = {
+            "collection": self.collection,
+            "bound": self.prefilter_rows + 1,
+        }
+        if filters.source_glob:
+            conditions.append("AND source LIKE %(source)s")
+            params["source"] = glob_to_like(filters.source_glob)
+        if filters.document_ids:
+            conditions.append("AND id = ANY(%(ids)s)")
+            params["ids"] = list(filters.document_ids)
+        if filters.metadata:
+            conditions.append("AND metadata @> %(metadata)s::jsonb")
+            params["metadata"] = Json(filters.metadata)
+        cursor.execute(
+            FILTER_PLAN_SQL.format(
+                conditions=" ".join(conditions), embeddings=self.embeddings_table
+            ),
+            params,
+        )
+        row = cursor.fetchone()
+        return plan_filter(
+            list(row["document_ids"]),
+            row["chunk_rows"],
+            row["documents"],
+            self.prefilter_rows,
+        )
+
+    @tracing.traced("db.similarity_search", count_rows="rows_read")
+    def similarity_search(
+        self,
+        query_embedding: List[float],
+        threshold: float = 0.7,
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        max_rounds: int = 4,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Perform similarity search on embeddings.
+
+        Runs an index-ordered top-k scan and applies ``threshold`` to the
+        candidates afterwards. An ANN index can return fewer than ``limit``
+        candidates: HNSW stops at ``ef_search`` and ivfflat only scans
+        ``probes`` lists. When that leaves too few matches, the search is
+        repeated with ef_search/probes doubled, up to ``max_rounds`` times,
+        until the scan stops finding new candidates. ``ef_search`` and
+        ``probes`` only apply to this query; None starts from the pgvector
+        defaults. With a quantized index, ``rerank_factor`` x ``limit``
+        candidates are re-ranked at full precision.
+
+        ``filters`` restricts the search to matching documents. If they hold
+        at most ``prefilter_rows`` chunks, only those are scanned, exactly.
+        Otherwise the index is asked for ``limit`` / selectivity candidates
+        and the ones outside the filter are dropped; if widening still leaves
+        too few matches, the filtered chunks are scanned exactly.
+        """
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        ef_search = ef_search or DEFAULT_EF_SEARCH
+        probes = probes or DEFAULT_PROBES
+        params: Dict[str, Any] = {
+            "embedding": to_vector_literal(query_embedding),
+            "candidates": limit,
+            "rerank": limit * self.rerank_factor,
+        }
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                plan = self.filter_plan(cursor, filters) if filters else None
+                if plan is not None:
+                    if not plan.document_ids:
+                        return []
+                    params["document_ids"] = plan.document_ids
+                    if plan.prefilter:
+                        return self._prefiltered_search(
+                            cursor, params, threshold, limit
+                        )
+                    params["candidates"] = plan.candidates(limit)
+                    params["rerank"] = params["candidates"] * self.rerank_factor
+
+                quantization = self.index_quantization(cursor)
+                if quantization != "none":
+                    # The index must return every candidate to be re-ranked
+                    ef_search = max(ef_search, min(params["rerank"], MAX_EF_SEARCH))
+                elif plan is not None:
+                    ef_search = max(ef_search, min(params["candidates"], MAX_EF_SEARCH))
+                sql = self.top_k_sql(quantization, None if plan is None else "post")
+                previous = -1
+                for _ in range(max_rounds):
+                    self.set_search_params(cursor, ef_search, probes)
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+                    matches = [
+                        dict(row) for row in rows if row["similarity"] > threshold
+                    ]
+                    # Done when there are enough matches, the top-k was full,
+                    # the farthest candidate already fails the threshold (so
+                    # every row beyond it does too) or widening found nothing
+                    if (
+                        len(matches) >= limit
+                        or len(rows) >= limit
+                        or (rows and rows[-1]["similarity"] <= threshold)
+                        or len(rows) <= previous
+                    ):
+                        break
+                    if ef_search >= MAX_EF_SEARCH and probes >= MAX_PROBES:
+                        break
+                    previous = len(rows)
+                    ef_search = min(ef_search * 2, MAX_EF_SEARCH)
+                    probes = min(probes * 2, MAX_PROBES)
+                    if plan is not None:
+                        # Post-filtered rows are a share of the candidates
+                        params["candidates"] *= 2
+                        params["rerank"] *= 2
+
+                if (
+                    plan is not None
+                    and len(matches) < limit
+                    and not (rows and rows[-1]["similarity"] <= threshold)
+                ):
+                    return self._prefiltered_search(cursor, params, threshold, limit)
+                return matches[:limit]
 
         except psycopg2.Error as e:
             console.print(f"[red]Similarity search failed: {e}[/red]")
             return []
 
+    def _prefiltered_search(
+        self, cursor, params: Dict[str, Any], threshold: float, limit: int
+    ) -> List[Dict[str, Any]]:
+        """Exact top-k over the chunks of ``params["document_ids"]``."""
+        cursor.execute(self.top_k_sql(filtering="pre"), {**params, "candidates": limit})
+        return [dict(row) for row in cursor.fetchall() if row["similarity"] > threshold]
+
+    @tracing.traced("db.lexical_search", count_rows="rows_read")
+    def lexical_search(
+        self,
+        query_text: str,
+        limit: int = 10,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Full-text search over chunk content; no embedding is needed.
+
+        Rows carry ``lexical_score`` (ts_rank) and no ``similarity``.
+        ``filters`` restricts the search to matching documents.
+        """
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        params: Dict[str, Any] = {"text": query_text, "candidates": limit}
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                plan = self.filter_plan(cursor, filters) if filters else None
+                if plan is not None:
+                    if not plan.document_ids:
+                        return []
+                    params["document_ids"] = plan.document_ids
+                cursor.execute(
+                    lexical_search_sql(self.embeddings_table, plan is not None),
+                    params,
+                )
+                return [{**dict(row), "similarity": None} for row in cursor.fetchall()]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Lexical search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.hybrid_search", count_rows="rows_read")
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        rrf_k: int = 60,
+        candidates: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and lexical rankings with reciprocal rank fusion.
+
+        Each side contributes its top ``candidates`` rows (default 4 x limit).
+        Rows carry the fused ``score``, their cosine ``similarity`` and their
+        ``lexical_score`` (None when the text did not match). ``filters``
+        restricts both sides to matching documents, pre- or post-filtering
+        the vector side like :meth:`similarity_search`.
+        """
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        candidates = candidates or limit * 4
+        params: Dict[str, Any] = {
+            "text": query_text,
+            "embedding": to_vector_literal(query_embedding),
+            "candidates": candidates,
+            "rerank": candidates * self.rerank_factor,
+            "rrf_k": rrf_k,
+            "limit": limit,
+        }
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                plan = self.filter_plan(cursor, filters) if filters else None
+                filtering = None
+                if plan is not None:
+                    if not plan.document_ids:
+                        return []
+                    params["document_ids"] = plan.document_ids
+                    filtering = "pre" if plan.prefilter else "post"
+                    if not plan.prefilter:
+                        # Enough vector candidates for about ``candidates``
+                        # to survive the filter
+                        params["candidates"] = plan.candidates(candidates)
+                        params["rerank"] = params["candidates"] * self.rerank_factor
+                quantization = self.index_quantization(cursor)
+                # HNSW returns at most ef_search rows, so widen it to the
+                # number of rows the index must return
+                wanted = (
+                    params["candidates"] if quantization == "none" else params["rerank"]
+                )
+                ef_search = max(ef_search or DEFAULT_EF_SEARCH, wanted)
+                self.set_search_params(cursor, min(ef_search, MAX_EF_SEARCH), probes)
+                cursor.execute(
+                    hybrid_search_sql(
+                        self.top_k_sql(quantization, filtering),
+                        self.embeddings_table,
+                        plan is not None,
+                    ),
+                    params,
+                )
+                return [dict(row) for row in cursor.fetchall()]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Hybrid search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.nearest_neighbours", count_rows="rows_read")
+    def nearest_neighbours(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[int]:
+        """Return the IDs of the ``limit`` nearest chunks by cosine distance.
+
+        With ``exact`` the index is bypassed, giving ground truth for recall
+        measurements. Otherwise a quantized index is searched and re-ranked
+        like :meth:`similarity_search`.
+        """
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        params = {
+            "embedding": to_vector_literal(query_embedding),
+            "candidates": limit,
+            "rerank": limit * self.rerank_factor,
+        }
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                quantization = "none" if exact else self.index_quantization(cursor)
+                if quantization != "none":
+                    ef_search = max(ef_search or DEFAULT_EF_SEARCH, params["rerank"])
+                    ef_search = min(ef_search, MAX_EF_SEARCH)
+                self.set_search_params(cursor, ef_search, probes, exact)
+                if quantization == "none":
+                    cursor.execute(
+                        f"""
+                        SELECT id FROM {self.embeddings_table}
+                        ORDER BY embedding <=> %(embedding)s::vector
+                        LIMIT %(candidates)s
+                    """,
+                        params,
+                    )
+                else:
+                    cursor.execute(
+                        f"SELECT id FROM ({self.top_k_sql(quantization)}) AS ranked "
+                        "ORDER BY similarity DESC",
+                        params,
+                    )
+                return [row["id"] for row in cursor.fetchall()]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Nearest neighbour search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.get_embeddings", count_rows="rows_read")
+    def get_embeddings(self, ids: List[int]) -> Dict[int, List[float]]:
+        """Return the stored embeddings of the chunks ``ids``, keyed by ID."""
+        if not ids:
+            return {}
+        if not self._pool:
+            if not self.connect():
+                return {}
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT id, embedding::text AS embedding
+                    FROM {self.embeddings_table}
+                    WHERE id = ANY(%s)
+                """,
+                    (list(ids),),
+                )
+                return {
+                    row["id"]: from_vector_literal(row["embedding"])
+                    for row in cursor.fetchall()
+                }
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to get embeddings: {e}[/red]")
+            return {}
+
+    def list_collections(self) -> List[Collection]:
+        """Return every registered collection."""
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT name, model, dimension, normalize, created_at
+                    FROM rag.collections
+                    ORDER BY name
+                """)
+                return [Collection(**row) for row in cursor.fetchall()]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to list collections: {e}[/red]")
+            return []
+
+    def get_collection(self, name: Optional[str] = None) -> Optional[Collection]:
+        """Return the collection ``name`` (default: this connection's), or None."""
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT name, model, dimension, normalize, created_at
+                    FROM rag.collections
+                    WHERE name = %s
+                """,
+                    (name or self.collection,),
+                )
+                row = cursor.fetchone()
+                return Collection(**row) if row else None
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to get collection: {e}[/red]")
+            return None
+
+    def create_collection(self, collection: Collection) -> bool:
+        """Register a collection and create its embeddings table and HNSW index.
+
+        Vectors wider than pgvector can index directly get a halfvec (or
+        binary) expression index, re-ranked at full precision.
+        """
+        quantization = next(
+            (
+                mode
+                for mode, limit in MAX_INDEX_DIMENSIONS.items()
+                if collection.dimension <= limit
+            ),
+            None,
+        )
+        if quantization is None:
+            console.print(
+                f"[red]pgvector cannot index {collection.dimension}-dimensional "
+                "vectors[/red]"
+            )
+            return False
+        if not self._pool:
+            if not self.connect():
+                return False
+
+        table = f"rag.{collection.table_name}"
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO rag.collections (name, model, dimension, normalize)
+                    VALUES (%s, %s, %s, %s)
+                """,
+                    (
+                        collection.name,
+                        collection.model,
+                        collection.dimension,
+                        collection.normalize,
+                    ),
+                )
+                cursor.execute(
+                    COLLECTION_TABLE_SQL.format(
+                        table=table,
+                        name=collection.table_name,
+                        dimension=collection.dimension,
+                    )
+                )
+                cursor.execute(
+                    create_index_sql(
+                        IndexSpec(quantization=quantization),
+                        index_name(collection.name),
+                        table,
+                        collection.dimension,
+                    )
+                )
+                conn.commit()
+
+            console.print(
+                f"[green]✓ Created collection '{collection.name}' ({table}, "
+                f"{collection.model}, {collection.dimension} dimensions)[/green]"
+            )
+            return True
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to create collection: {e}[/red]")
+            return False
+
+    def drop_collection(self, name: str) -> bool:
+        """Drop a collection's embeddings table, documents and registry entry.
+
+        The default collection cannot be dropped.
+        """
+        if name == DEFAULT_COLLECTION:
+            console.print("[red]The default collection cannot be dropped[/red]")
+            return False
+        if not self._pool:
+            if not self.connect():
+                return False
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS rag.{collection_table(name)}")
+                # Documents cascade from the registry entry
+                cursor.execute("DELETE FROM rag.collections WHERE name = %s", (name,))
+                dropped = cursor.rowcount
+                conn.commit()
+
+            if not dropped:
+                console.print(f"[yellow]No collection named: {name}[/yellow]")
+                return False
+            console.print(f"[green]Dropped collection: {name}[/green]")
+            return True
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to drop collection: {e}[/red]")
+            return False
+
+    @tracing.traced("db.get_corpus_version")
+    def get_corpus_version(self) -> Optional[str]:
+        """Return a fingerprint that changes whenever documents change.
+
+        Inserts raise the max ID, deletes lower the count and updates bump
+        ``updated_at`` (via trigger), so cached answers can be invalidated.
+        The collection name is included, since chunk IDs are per collection.
+        """
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT COUNT(*) AS documents, COALESCE(MAX(id), 0) AS max_id,
+                           MAX(updated_at) AS updated_at
+                    FROM rag.documents
+                    WHERE collection = %s
+                """,
+                    (self.collection,),
+                )
+                row = cursor.fetchone()
+                return (
+                    f"{self.collection}:{row['documents']}:{row['max_id']}:"
+                    f"{row['updated_at']}"
+                )
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to get corpus version: {e}[/red]")
+            return None
+
+    @tracing.traced("db.get_documents", count_rows="rows_read")
     def get_documents(self) -> List[Dict[str, Any]]:
         """Get all documents with basic statistics."""
-        if not self._connection:
+        if not self._pool:
             if not self.connect():
                 return []
 
         try:
-            with self._connection.cursor() as cursor:
-                cursor.execute("""
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
                     SELECT 
                         d.id,
                         d.title,
@@ -226,10 +1513,13 @@ class DatabaseConnection:
                         d.metadata,
                         COUNT(e.id) as chunk_count
                     FROM rag.documents d
-                    LEFT JOIN rag.embeddings e ON d.id = e.document_id
+                    LEFT JOIN {self.embeddings_table} e ON d.id = e.document_id
+                    WHERE d.collection = %s
                     GROUP BY d.id, d.title, d.source, d.created_at, d.metadata
                     ORDER BY d.created_at DESC
-                """)
+                """,
+                    (self.collection,),
+                )
 
                 results = cursor.fetchall()
                 return [dict(row) for row in results]
@@ -238,19 +1528,20 @@ class DatabaseConnection:
             console.print(f"[red]Failed to get documents: {e}[/red]")
             return []
 
+    @tracing.traced("db.get_document_by_source")
     def get_document_by_source(self, source: str) -> Optional[Dict[str, Any]]:
         """Get a document by its source."""
-        if not self._connection:
+        if not self._pool:
             if not self.connect():
                 return None
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(
                     """
-                    SELECT * FROM rag.documents WHERE source = %s
+                    SELECT * FROM rag.documents WHERE collection = %s AND source = %s
                 """,
-                    (source,),
+                    (self.collection, source),
                 )
 
                 result = cursor.fetchone()
@@ -260,23 +1551,24 @@ class DatabaseConnection:
             console.print(f"[red]Failed to get document: {e}[/red]")
             return None
 
+    @tracing.traced("db.delete_document_by_source")
     def delete_document_by_source(self, source: str) -> bool:
         """Delete a document and its embeddings by source."""
-        if not self._connection:
+        if not self._pool:
             if not self.connect():
                 return False
 
         try:
-            with self._connection.cursor() as cursor:
+            with self.connection() as conn, conn.cursor() as cursor:
                 cursor.execute(
                     """
-                    DELETE FROM rag.documents WHERE source = %s
+                    DELETE FROM rag.documents WHERE collection = %s AND source = %s
                 """,
-                    (source,),
+                    (self.collection, source),
                 )
 
                 deleted_count = cursor.rowcount
-                self._connection.commit()
+                conn.commit()
 
                 if deleted_count > 0:
                     console.print(f"[green]Deleted document: {source}[/green]")
@@ -289,30 +1581,230 @@ class DatabaseConnection:
 
         except psycopg2.Error as e:
             console.print(f"[red]Failed to delete document: {e}[/red]")
-            self._connection.rollback()
             return False
 
+    # Index management, used by the ``rag-magic index`` and ``bench`` commands
+
+    def index_status(self) -> Optional[Dict[str, Any]]:
+        """Return the embedding row count and the vector indexes of the collection.
+
+        Index sizes of a partitioned table are summed over its partitions.
+        """
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) AS rows FROM {self.embeddings_table}")
+                rows = cursor.fetchone()["rows"]
+                cursor.execute(
+                    """
+                    SELECT
+                        i.indexname AS name,
+                        am.amname AS method,
+                        i.indexdef AS definition,
+                        (SELECT coalesce(sum(pg_relation_size(t.relid)), 0)
+                         FROM pg_partition_tree(c.oid) t) AS size_bytes
+                    FROM pg_indexes i
+                    JOIN pg_class c ON c.relname = i.indexname
+                    JOIN pg_namespace n
+                        ON n.oid = c.relnamespace AND n.nspname = i.schemaname
+                    JOIN pg_am am ON am.oid = c.relam
+                    WHERE i.schemaname = 'rag' AND i.tablename = %s
+                      AND am.amname IN ('hnsw', 'ivfflat')
+                    ORDER BY i.indexname
+                """,
+                    (self.table_name,),
+                )
+                indexes = [dict(row) for row in cursor.fetchall()]
+                quantization = self.index_quantization(cursor, refresh=True)
+                partitions = self.partitions(cursor)
+            return {
+                "rows": rows,
+                "indexes": indexes,
+                "quantization": quantization,
+                "partitions": partitions,
+            }
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to get index status: {e}[/red]")
+            return None
+
+    @tracing.traced("db.build_index")
+    def build_index(
+        self, spec: IndexSpec, maintenance_work_mem: Optional[str] = None
+    ) -> Optional[IndexSpec]:
+        """Drop and rebuild the embedding ANN index in one transaction.
+
+        ivfflat ``lists`` default to pgvector's guidance for the rows per
+        partition, where every partition gets its own index.
+        """
+        if spec.quantization == "int8":
+            console.print(
+                "[red]pgvector has no int8 vector type; use halfvec or binary, "
+                "or the local storage backend for int8[/red]"
+            )
+            return None
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                current = self.index_quantization(cursor, refresh=True)
+                if spec.quantization is None:
+                    spec.quantization = current
+                if spec.method == "ivfflat" and not spec.lists:
+                    cursor.execute(
+                        f"SELECT COUNT(*) AS rows FROM {self.embeddings_table}"
+                    )
+                    rows = cursor.fetchone()["rows"]
+                    spec.lists = recommended_lists(
+                        rows // max(len(self.partitions(cursor)), 1)
+                    )
+                if maintenance_work_mem:
+                    cursor.execute(
+                        "SELECT set_config('maintenance_work_mem', %s, true)",
+                        (maintenance_work_mem,),
+                    )
+                # Index builds on large tables can exceed the statement timeout
+                cursor.execute("SELECT set_config('statement_timeout', '0', true)")
+
+                started = time.perf_counter()
+                cursor.execute(f"DROP INDEX IF EXISTS rag.{self.index_name}")
+                cursor.execute(
+                    create_index_sql(
+                        spec, self.index_name, self.embeddings_table, self.dimension
+                    )
+                )
+                cursor.execute(f"ANALYZE {self.embeddings_table}")
+                conn.commit()
+                self.index_quantization(cursor, refresh=True)
+
+            quantized = f", {spec.quantization}" if spec.quantization != "none" else ""
+            console.print(
+                f"[green]✓ Built {spec.method} index ({spec.with_params()}"
+                f"{quantized}) in {time.perf_counter() - started:.1f}s[/green]"
+            )
+            return spec
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to build index: {e}[/red]")
+            return None
+
+    def sample_embeddings(self, count: int) -> List[List[float]]:
+        """Return up to ``count`` randomly chosen stored embeddings."""
+        if not self._pool:
+            if not self.connect():
+                return []
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT embedding::text AS embedding FROM {self.embeddings_table}
+                    ORDER BY random() LIMIT %s
+                """,
+                    (count,),
+                )
+                return [
+                    from_vector_literal(row["embedding"]) for row in cursor.fetchall()
+                ]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to sample embeddings: {e}[/red]")
+            return []
+
+    def explain_search(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        force_index: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """EXPLAIN the top-k similarity query and report which index serves it.
+
+        Returns the JSON plan, the vector index used (None means a sequential
+        scan) and the plan's estimated ``total_cost``.
+        """
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                # A partitioned table is scanned through its partitions
+                relations = {self.table_name, *self.partitions(cursor)}
+                self.set_search_params(cursor, ef_search, probes)
+                if force_index:
+                    cursor.execute("SELECT set_config('enable_seqscan', 'off', true)")
+                cursor.execute(
+                    "EXPLAIN (FORMAT JSON) "
+                    + self.top_k_sql(self.index_quantization(cursor)),
+                    {
+                        "embedding": to_vector_literal(query_embedding),
+                        "candidates": limit,
+                        "rerank": limit * self.rerank_factor,
+                    },
+                )
+                explained = cursor.fetchone()["QUERY PLAN"]
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to explain search: {e}[/red]")
+            return None
 
-def display_documents_table(documents: List[Dict[str, Any]]):
-    """Display documents in a formatted table."""
-    if not documents:
-        console.print("[yellow]No documents found.[/yellow]")
-        return
-
-    table = Table(title="Vectorized Documents")
-    table.add_column("ID", style="cyan", no_wrap=True)
-    table.add_column("Title", style="magenta")
-    table.add_column("Source", style="green")
-    table.add_column("Chunks", style="blue", justify="right")
-    table.add_column("Created", style="yellow")
-
-    for doc in documents:
-        table.add_row(
-            str(doc["id"]),
-            doc["title"][:50] + "..." if len(doc["title"]) > 50 else doc["title"],
-            doc["source"],
-            str(doc["chunk_count"]),
-            doc["created_at"].strftime("%Y-%m-%d %H:%M"),
+        if isinstance(explained, str):
+            explained = json.loads(explained)
+        plan = explained[0]["Plan"]
+        index = next(
+            (
+                node.get("Index Name")
+                for node in _plan_nodes(plan)
+                if node["Node Type"] in ("Index Scan", "Index Only Scan")
+                and node.get("Relation Name") in relations
+            ),
+            None,
         )
+        return {"plan": plan, "index": index, "total_cost": plan.get("Total Cost")}
+
+    def storage_bytes(self) -> Optional[int]:
+        """Size of the embeddings table, its partitions and their indexes."""
+        if not self._pool:
+            if not self.connect():
+                return None
+
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) AS size "
+                    "FROM pg_partition_tree(%s::regclass)",
+                    (self.embeddings_table,),
+                )
+                return int(cursor.fetchone()["size"])
+
+        except psycopg2.Error as e:
+            console.print(f"[red]Failed to measure table size: {e}[/red]")
+            return None
 
-    console.print(table)
+    def apply_migrations(self) -> bool:
+        """Apply pending schema migrations (see :mod:`rag_magic.migrations`)."""
+        from .migrations import apply_migrations
+
+        return apply_migrations(self)
+
+    def partition_embeddings(
+        self,
+        partitions: int,
+        batch_size: int = 10_000,
+        keep_old: bool = False,
+        maintenance_work_mem: Optional[str] = None,
+    ) -> bool:
+        """Hash-partition the embeddings table online (see
+        :mod:`rag_magic.partitioning`)."""
+        from .partitioning import partition_embeddings
+
+        return partition_embeddings(
+            self, partitions, batch_size, keep_old, maintenance_work_mem
+        )
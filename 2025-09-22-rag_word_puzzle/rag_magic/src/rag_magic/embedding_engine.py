@@ -0,0 +1,328 @@
+"""Concurrent, rate-limited embedding generation for RAG Magic."""
+
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from . import tracing
+
+T = TypeVar("T")
+
+TRANSIENT_STATUS_CODES = {429, 503}
+TRANSIENT_MARKERS = (
+    "429",
+    "503",
+    "resource exhausted",
+    "resourceexhausted",
+    "service unavailable",
+    "serviceunavailable",
+    "rate limit",
+    "quota",
+)
+
+
+class TransientEmbeddingError(Exception):
+    """Raised by backends for retryable failures (rate limits, overload)."""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True if an embedding error is worth retrying (429/503 style)."""
+    if isinstance(error, TransientEmbeddingError):
+        return True
+
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(error, attribute, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int) and value in TRANSIENT_STATUS_CODES:
+            return True
+
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in TRANSIENT_MARKERS)
+
+
+class EmbeddingBackend(ABC):
+    """A provider that turns a batch of texts into embedding vectors."""
+
+    name = "base"
+
+    @abstractmethod
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of document texts, preserving order."""
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        return (await self.embed_batch([text]))[0]
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of query texts, preserving order."""
+        return await self.embed_batch(texts)
+
+
+class GoogleEmbeddingBackend(EmbeddingBackend):
+    """Google Gemini embeddings via LangChain, run off the event loop."""
+
+    name = "google"
+
+    def __init__(self, model: str, api_key: str):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self.model = model
+        self.client = GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.client.embed_documents, texts)
+
+    async def embed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.client.embed_query, text)
+
+    async def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(
+            self.client.embed_documents, texts, task_type="retrieval_query"
+        )
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """Deterministic, offline embedder for tests and benchmarks.
+
+    Vectors are hashed bag-of-words features, so texts sharing words have a
+    higher cosine similarity. ``latency`` simulates a network round trip and
+    ``failure_rate`` injects transient errors to exercise the retry path.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        dimension: int = 768,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.dimension = dimension
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def embed_text(self, text: str) -> List[float]:
+        """Embed one text synchronously."""
+        vector = [0.0] * self.dimension
+        for token in re.findall(r"\w+", text.lower()) or [text]:
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise TransientEmbeddingError("429 simulated rate limit")
+        return [self.embed_text(text) for text in texts]
+
+
+def create_backend(
+    name: str = "google",
+    model: str = "models/text-embedding-004",
+    api_key: Optional[str] = None,
+    dimension: int = 768,
+) -> EmbeddingBackend:
+    """Create an embedding backend by name ("google" or "fake")."""
+    if name == "fake":
+        return FakeEmbeddingBackend(dimension=dimension)
+    if name == "google":
+        if not api_key:
+            raise ValueError(
+                "Google API key is required. "
+                "Set GEMINI_TOKEN or GOOGLE_API_KEY environment variable."
+            )
+        return GoogleEmbeddingBackend(model=model, api_key=api_key)
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter (``rate`` tokens/sec, ``capacity`` burst)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until ``tokens`` are available, then consume them."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+@dataclass
+class EngineStats:
+    """Counters for the most recent embedding run."""
+
+    texts: int = 0
+    batches: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def texts_per_second(self) -> float:
+        return self.texts / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class EmbeddingEngine:
+    """Splits texts into provider-sized batches and embeds them concurrently.
+
+    Up to ``concurrency`` batches are in flight at once, each request first
+    taking a token from the rate limiter. Transient failures are retried with
+    jittered exponential backoff. Results are always returned in input order.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        batch_size: int = 100,
+        concurrency: int = 4,
+        requests_per_second: Optional[float] = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        if batch_size < 1 or concurrency < 1:
+            raise ValueError("batch_size and concurrency must be at least 1")
+        self.backend = backend
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = EngineStats()
+
+    @classmethod
+    def from_config(cls, backend: EmbeddingBackend, config) -> "EmbeddingEngine":
+        """Create an engine using the batching settings from a Config."""
+        return cls(
+            backend,
+            batch_size=config.embedding_batch_size,
+            concurrency=config.embedding_concurrency,
+            requests_per_second=config.embedding_requests_per_second or None,
+            max_retries=config.embedding_max_retries,
+        )
+
+    async def _with_retry(
+        self,
+        call: Callable[[], Awaitable[T]],
+        limiter: Optional[TokenBucket] = None,
+    ) -> T:
+        """Await ``call()``, retrying transient failures with jittered backoff."""
+        attempt = 0
+        while True:
+            if limiter:
+                await limiter.acquire()
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+                self.stats.retries += 1
+                tracing.count("embedding_retries")
+                attempt += 1
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def _embed_batch(
+        self, batch: List[str], limiter: Optional[TokenBucket], queries: bool = False
+    ) -> List[List[float]]:
+        embed = self.backend.embed_queries if queries else self.backend.embed_batch
+        with tracing.span("embedding_batch", texts=len(batch)):
+            vectors = await self._with_retry(lambda: embed(batch), limiter)
+        tracing.count("embedding_requests")
+        tracing.observe("embedding_batch_size", len(batch))
+        if len(vectors) != len(batch):
+            raise ValueError(
+                f"Embedding backend returned {len(vectors)} vectors "
+                f"for {len(batch)} texts"
+            )
+        return vectors
+
+    async def aembed(
+        self,
+        texts: List[str],
+        on_batch_done: Optional[Callable[[int], None]] = None,
+        queries: bool = False,
+    ) -> List[List[float]]:
+        """Embed ``texts`` concurrently; ``on_batch_done(n)`` reports progress.
+
+        With ``queries`` the texts are embedded as search queries rather than
+        documents.
+        """
+        self.stats = EngineStats(texts=len(texts))
+        if not texts:
+            return []
+
+        started = time.perf_counter()
+        limiter = (
+            TokenBucket(self.requests_per_second) if self.requests_per_second else None
+        )
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+
+        async def run(index: int, batch: List[str]):
+            async with semaphore:
+                results[index] = await self._embed_batch(batch, limiter, queries)
+            self.stats.batches += 1
+            if on_batch_done:
+                on_batch_done(len(batch))
+
+        await asyncio.gather(*(run(i, batch) for i, batch in enumerate(batches)))
+
+        self.stats.elapsed = time.perf_counter() - started
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed(
+        self,
+        texts: List[str],
+        on_batch_done: Optional[Callable[[int], None]] = None,
+    ) -> List[List[float]]:
+        """Synchronous wrapper around :meth:`aembed`."""
+        return asyncio.run(self.aembed(texts, on_batch_done))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query, with the same retry policy as batches."""
+        return await self._with_retry(lambda: self.backend.embed_query(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Synchronous wrapper around :meth:`aembed_query`."""
+        return asyncio.run(self.aembed_query(text))
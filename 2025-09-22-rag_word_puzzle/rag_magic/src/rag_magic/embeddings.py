@@ -1,124 +1,277 @@
 """Document processing and embedding generation for RAG Magic."""
 
+import codecs
+import itertools
 import os
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn
+
+from . import tracing
+from .cache import EmbeddingCache, open_cache
+from .chunking import get_chunker, get_tokenizer
+from .config import get_config
+from .embedding_engine import EmbeddingBackend, EmbeddingEngine, create_backend
+from .registry import (
+    DEFAULT_DIMENSION,
+    EMBEDDING_MODELS,
+    Collection,
+    prepare_embedding,
+)
 
 console = Console()
 
 
+def read_text_file(file_path: str) -> Tuple[str, str]:
+    """Read a text file, falling back to latin-1. Returns (content, encoding)."""
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), "utf-8"
+    except UnicodeDecodeError:
+        # Try with different encoding
+        try:
+            with open(path, "r", encoding="latin-1") as f:
+                return f.read(), "latin-1"
+        except Exception as e:
+            raise ValueError(f"Could not read file {file_path}: {e}")
+
+
+def detect_encoding(file_path: str, block_size: int = 1 << 20) -> str:
+    """Return "utf-8" if the file decodes as UTF-8, else "latin-1".
+
+    The file is validated block by block, so memory use stays bounded.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(file_path, "rb") as f:
+            while block := f.read(block_size):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def iter_file_chunks(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    strategy: str = "characters",
+) -> Iterator[str]:
+    """Stream a file's chunks without loading the whole file into memory."""
+    if not Path(file_path).exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    chunker = get_chunker(strategy, chunk_size, chunk_overlap, source=file_path)
+    encoding = detect_encoding(file_path)
+    with open(file_path, "r", encoding=encoding) as f:
+        yield from chunker.iter_chunks(f)
+
+
 class DocumentProcessor:
     """Handles document chunking and embedding generation."""
 
     def __init__(
-        self, api_key: Optional[str] = None, model: str = "models/text-embedding-004"
+        self,
+        api_key: Optional[str] = None,
+        model: str = "models/text-embedding-004",
+        backend: Optional[EmbeddingBackend] = None,
+        engine: Optional[EmbeddingEngine] = None,
+        cache: Optional[EmbeddingCache] = None,
+        use_cache: bool = True,
+        dimension: Optional[int] = None,
+        normalize: bool = False,
     ):
-        """Initialize with Google Gemini API key and embedding model."""
+        """Initialize with an embedding backend and a concurrent embedding engine.
+
+        By default the backend is chosen by EMBEDDING_BACKEND (Google Gemini
+        unless set to "fake"), and batching/concurrency/rate limits come from
+        the configuration. Chunk embeddings are looked up in the persistent
+        embedding cache first unless ``use_cache`` is False.
+
+        ``dimension`` truncates embeddings to their first ``dimension``
+        values (Matryoshka models) and ``normalize`` re-normalizes them; the
+        cache keeps the model's full output, so collections sharing a model
+        share cached embeddings.
+        """
+        config = get_config()
         self.api_key = (
             api_key or os.getenv("GEMINI_TOKEN") or os.getenv("GOOGLE_API_KEY")
         )
-        if not self.api_key:
-            raise ValueError(
-                "Google API key is required. Set GEMINI_TOKEN or GOOGLE_API_KEY environment variable."
+        self.model = model
+        native = EMBEDDING_MODELS.get(model)
+        self.dimension = dimension or (
+            native.dimension if native else DEFAULT_DIMENSION
+        )
+        self.normalize = normalize
+
+        if engine is not None:
+            backend = engine.backend
+        elif backend is None:
+            backend = create_backend(
+                config.embedding_backend,
+                model=self.model,
+                api_key=self.api_key,
+                dimension=native.dimension if native else self.dimension,
             )
 
-        self.model = model
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=self.model, google_api_key=self.api_key
+        self.backend = backend
+        self.engine = engine or EmbeddingEngine.from_config(backend, config)
+        self.cache = (cache or open_cache(config)) if use_cache else None
+
+    @classmethod
+    def for_collection(
+        cls, collection: Collection, use_cache: bool = True, **kwargs
+    ) -> "DocumentProcessor":
+        """Create a processor producing embeddings for ``collection``."""
+        return cls(
+            model=collection.model,
+            dimension=collection.dimension,
+            normalize=collection.normalize,
+            use_cache=use_cache,
+            **kwargs,
         )
 
+    def prepare(self, vector: List[float]) -> List[float]:
+        """Fit a model embedding to this processor's dimension and normalization."""
+        if len(vector) == self.dimension and not self.normalize:
+            return vector
+        return prepare_embedding(vector, self.dimension, self.normalize)
+
+    @property
+    def cache_key(self) -> str:
+        """Model identifier used to namespace cached embeddings."""
+        return f"{self.backend.name}:{self.model}"
+
     def read_file(self, file_path: str) -> str:
         """Read and return file contents."""
-        path = Path(file_path)
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
-
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read()
+        with tracing.span("read_file") as span:
+            content, encoding = read_text_file(file_path)
+            span.set(characters=len(content))
+        name = Path(file_path).name
+        if encoding == "utf-8":
             console.print(
-                f"[green]✓ Read file: {path.name} ({len(content)} characters)[/green]"
+                f"[green]✓ Read file: {name} ({len(content)} characters)[/green]"
             )
-            return content
-        except UnicodeDecodeError:
-            # Try with different encoding
-            try:
-                with open(path, "r", encoding="latin-1") as f:
-                    content = f.read()
-                console.print(
-                    f"[yellow]⚠ Read file with latin-1 encoding: {path.name}[/yellow]"
-                )
-                return content
-            except Exception as e:
-                raise ValueError(f"Could not read file {file_path}: {e}")
+        else:
+            console.print(
+                f"[yellow]⚠ Read file with {encoding} encoding: {name}[/yellow]"
+            )
+        return content
 
     def chunk_text(
-        self, text: str, chunk_size: int = 1000, chunk_overlap: int = 200
+        self,
+        text: str,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        strategy: str = "characters",
+        source: Optional[str] = None,
     ) -> List[str]:
-        """Split text into overlapping chunks."""
-        if not text.strip():
-            return []
-
-        chunks = []
-        start = 0
-        text_length = len(text)
-
-        while start < text_length:
-            # Calculate end position
-            end = start + chunk_size
-
-            # If this is not the last chunk, try to break at word boundary
-            if end < text_length:
-                # Look for the last space within the chunk
-                last_space = text.rfind(" ", start, end)
-                if last_space > start:
-                    end = last_space
-
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-
-            # Move start position, accounting for overlap
-            start = end - chunk_overlap
-            if start <= 0:
-                start = end
-
-        console.print(f"[blue]✓ Split text into {len(chunks)} chunks[/blue]")
+        """Split text into chunks with a chunking strategy.
+
+        ``source`` picks the strategy for "auto" by file type.
+        """
+        with tracing.span("chunk") as span:
+            chunker = get_chunker(strategy, chunk_size, chunk_overlap, source=source)
+            chunks = chunker.split(text)
+            span.set(strategy=chunker.name, chunks=len(chunks))
+        tracing.count("chunks", len(chunks))
+        if tracing.tracer.enabled:
+            tokenizer = get_tokenizer()
+            tracing.count(
+                "chunk_tokens", sum(tokenizer.count(chunk) for chunk in chunks)
+            )
+        if chunks:
+            console.print(
+                f"[blue]✓ Split text into {len(chunks)} chunks ({chunker.name})[/blue]"
+            )
         return chunks
 
     def count_tokens(self, text: str) -> int:
-        """Estimate token count for text (rough approximation for Gemini)."""
-        # Rough approximation: ~4 characters per token for English text
-        return len(text) // 4
+        """Count tokens with the configured tokenizer (see TOKENIZER)."""
+        return get_tokenizer().count(text)
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts using Google Gemini."""
+    def generate_embeddings(
+        self, texts: List[str], show_progress: bool = True
+    ) -> List[List[float]]:
+        """Generate embeddings for a list of texts, reusing cached vectors.
+
+        With ``show_progress=False`` nothing is printed, so callers can drive
+        their own progress display.
+        """
         if not texts:
             return []
 
+        with tracing.span("embed", texts=len(texts)) as span:
+            if self.cache:
+                with tracing.span("embedding_cache.get"):
+                    cached = self.cache.get_many(self.cache_key, texts)
+            else:
+                cached = [None] * len(texts)
+            # Embed each distinct uncached text once
+            missing = list(
+                dict.fromkeys(
+                    text for text, vector in zip(texts, cached) if vector is None
+                )
+            )
+            hits = sum(1 for vector in cached if vector is not None)
+            if self.cache and show_progress:
+                console.print(
+                    f"[blue]✓ Embedding cache: {hits} hits, "
+                    f"{len(missing)} to embed[/blue]"
+                )
+
+            if not missing:
+                fresh = []
+            elif show_progress:
+                fresh = self._embed_uncached(missing)
+            else:
+                fresh = self.engine.embed(missing)
+            if self.cache and fresh:
+                with tracing.span("embedding_cache.put"):
+                    self.cache.put_many(self.cache_key, missing, fresh)
+            span.set(cache_hits=hits)
+        tracing.count("embedded_texts", len(texts))
+        tracing.count("embedding_cache_hits", hits)
+
+        lookup = dict(zip(missing, fresh))
+        return [
+            self.prepare(vector if vector is not None else lookup[text])
+            for text, vector in zip(texts, cached)
+        ]
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts through the engine with a progress bar."""
         try:
             with Progress(
                 SpinnerColumn(),
                 TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                TextColumn("{task.completed}/{task.total}"),
                 console=console,
             ) as progress:
                 task = progress.add_task(
-                    f"Generating embeddings for {len(texts)} chunks...", total=None
+                    f"Generating embeddings for {len(texts)} chunks...",
+                    total=len(texts),
                 )
 
-                # Generate embeddings using LangChain
-                embeddings = self.embeddings.embed_documents(texts)
-
-                progress.update(task, completed=True)
-                console.print(
-                    f"[green]✓ Generated {len(embeddings)} embeddings[/green]"
+                embeddings = self.engine.embed(
+                    texts, on_batch_done=lambda n: progress.advance(task, n)
                 )
 
-                return embeddings
+            stats = self.engine.stats
+            console.print(
+                f"[green]✓ Generated {len(embeddings)} embeddings in "
+                f"{stats.batches} batches ({stats.texts_per_second:,.0f} chunks/sec"
+                f"{f', {stats.retries} retries' if stats.retries else ''})[/green]"
+            )
+            return embeddings
 
         except Exception as e:
             console.print(f"[red]✗ Error generating embeddings: {e}[/red]")
@@ -127,14 +280,18 @@ class DocumentProcessor:
     def generate_single_embedding(self, text: str) -> List[float]:
         """Generate embedding for a single text."""
         try:
-            embedding = self.embeddings.embed_query(text)
-            return embedding
+            with tracing.span("embed_query"):
+                return self.prepare(self.engine.embed_query(text))
         except Exception as e:
             console.print(f"[red]✗ Error generating embedding: {e}[/red]")
             raise
 
     def process_file(
-        self, file_path: str, chunk_size: int = 1000, chunk_overlap: int = 200
+        self,
+        file_path: str,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        strategy: str = "characters",
     ) -> List[Tuple[str, List[float]]]:
         """Process a file: read, chunk, and generate embeddings."""
         console.print(f"[blue]Processing file: {file_path}[/blue]")
@@ -143,7 +300,9 @@ class DocumentProcessor:
         content = self.read_file(file_path)
 
         # Chunk text
-        chunks = self.chunk_text(content, chunk_size, chunk_overlap)
+        chunks = self.chunk_text(
+            content, chunk_size, chunk_overlap, strategy, source=file_path
+        )
 
         if not chunks:
             console.print("[yellow]⚠ No chunks generated from file[/yellow]")
@@ -162,10 +321,32 @@ class DocumentProcessor:
 
         return result
 
+    def iter_file_embeddings(
+        self,
+        file_path: str,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        group_size: Optional[int] = None,
+        strategy: str = "characters",
+    ) -> Iterator[Tuple[str, List[float]]]:
+        """Stream (chunk, embedding) pairs for a file in bounded memory.
+
+        Chunks are read lazily and embedded in groups of ``group_size``
+        (default: enough to fill every concurrent embedding request).
+        """
+        group_size = group_size or self.engine.batch_size * self.engine.concurrency
+        chunks = iter_file_chunks(file_path, chunk_size, chunk_overlap, strategy)
+        embedded = 0
+        while group := list(itertools.islice(chunks, group_size)):
+            tracing.count("chunks", len(group))
+            vectors = self.generate_embeddings(group, show_progress=False)
+            embedded += len(group)
+            console.print(f"[blue]  ✓ Embedded {embedded} chunks[/blue]")
+            yield from zip(group, vectors)
+
     def get_embedding_dimension(self) -> int:
-        """Get the dimension of embeddings from this model."""
-        # Google text-embedding-004 produces 768-dimensional embeddings
-        return 768
+        """Get the dimension of the embeddings this processor produces."""
+        return self.dimension
 
     def validate_api_connection(self) -> bool:
         """Test the API connection by generating a test embedding."""
@@ -183,7 +364,9 @@ class DocumentProcessor:
 
 
 def create_processor(
-    api_key: Optional[str] = None, model: str = "models/text-embedding-004"
+    api_key: Optional[str] = None,
+    model: str = "models/text-embedding-004",
+    backend: Optional[EmbeddingBackend] = None,
 ) -> DocumentProcessor:
     """Create and return a DocumentProcessor instance."""
-    return DocumentProcessor(api_key=api_key, model=model)
+    return DocumentProcessor(api_key=api_key, model=model, backend=backend)
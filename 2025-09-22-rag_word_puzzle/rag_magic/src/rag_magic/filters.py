@@ -0,0 +1,156 @@
+"""Search filters for RAG Magic.
+
+A :class:`SearchFilter` scopes a search to some documents of the
+collection: those whose source matches a glob, those with given IDs and
+those whose metadata contains given key/value pairs. Conditions combine
+with AND.
+
+Backends resolve a filter to the IDs of the matching documents first, then
+pick a plan by how many chunks those documents hold:
+
+- **Pre-filter** (at most ``prefilter_rows`` chunks): only the matching
+  chunks are scanned, exactly. An ANN index would walk past most of them.
+- **Post-filter** (more chunks than that): the ANN index is searched for
+  extra candidates, in proportion to the share of documents that match,
+  and non-matching candidates are dropped.
+"""
+
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+# Filters matching at most this many chunks are searched exactly
+DEFAULT_PREFILTER_ROWS = 20_000
+
+# Upper bound on the candidates fetched for a post-filtered search
+MAX_POSTFILTER_CANDIDATES = 1000
+
+
+@dataclass
+class SearchFilter:
+    """Which documents a search may return chunks from."""
+
+    # Shell-style pattern on the document source: * and ? only
+    source_glob: Optional[str] = None
+    document_ids: List[int] = field(default_factory=list)
+    # Top-level document metadata values that must match exactly
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.source_glob or self.document_ids or self.metadata)
+
+    def describe(self) -> str:
+        """One-line description for the CLI."""
+        parts = []
+        if self.source_glob:
+            parts.append(f"source {self.source_glob}")
+        if self.document_ids:
+            parts.append("documents " + ", ".join(map(str, self.document_ids)))
+        parts.extend(
+            f"{key}={json.dumps(value)}" for key, value in self.metadata.items()
+        )
+        return ", ".join(parts)
+
+
+@dataclass
+class FilterPlan:
+    """How a filtered search runs: the matching documents and the strategy."""
+
+    document_ids: List[int]
+    # Chunks in the matching documents, counted up to prefilter_rows + 1
+    rows: int
+    prefilter: bool
+    # Share of the collection's documents that match
+    selectivity: float
+
+    def candidates(self, limit: int) -> int:
+        """Candidates to fetch so ``limit`` are likely to survive the filter."""
+        wanted = math.ceil(limit / max(self.selectivity, 1e-6))
+        return max(limit, min(wanted, MAX_POSTFILTER_CANDIDATES))
+
+
+def plan_filter(
+    document_ids: List[int], rows: int, total_documents: int, prefilter_rows: int
+) -> FilterPlan:
+    """Choose pre- or post-filtering for documents holding ``rows`` chunks."""
+    return FilterPlan(
+        document_ids=document_ids,
+        rows=rows,
+        prefilter=rows <= prefilter_rows,
+        selectivity=len(document_ids) / max(total_documents, 1),
+    )
+
+
+def make_filter(
+    source_glob: Optional[str] = None,
+    document_ids: Optional[Iterable[int]] = None,
+    metadata: Optional[Iterable[str]] = None,
+) -> Optional[SearchFilter]:
+    """Build a filter from CLI-style options, or None if none were given.
+
+    Raises ValueError for malformed ``key=value`` metadata pairs.
+    """
+    filters = SearchFilter(
+        source_glob=source_glob or None,
+        document_ids=sorted(set(document_ids or [])),
+        metadata=parse_metadata_filters(metadata or []),
+    )
+    return filters or None
+
+
+def parse_metadata_filters(pairs: Iterable[str]) -> Dict[str, Any]:
+    """Parse ``key=value`` pairs into a metadata filter.
+
+    Values are read as JSON where possible (``total_chunks=3`` is a number,
+    ``draft=true`` a boolean) and as strings otherwise.
+    """
+    metadata: Dict[str, Any] = {}
+    for pair in pairs:
+        key, separator, value = pair.partition("=")
+        key = key.strip()
+        if not separator or not key:
+            raise ValueError(f"Invalid metadata filter: {pair!r} (use key=value)")
+        try:
+            metadata[key] = json.loads(value)
+        except json.JSONDecodeError:
+            metadata[key] = value
+    return metadata
+
+
+def glob_to_like(pattern: str) -> str:
+    """Translate a ``*``/``?`` glob into a LIKE pattern (escape character ``\\``)."""
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+
+def glob_to_sqlite(pattern: str) -> str:
+    """Translate a ``*``/``?`` glob into a SQLite GLOB pattern.
+
+    SQLite's GLOB also treats ``[`` as a character class; it is escaped so
+    only ``*`` and ``?`` are special, as with :func:`glob_to_like`.
+    """
+    return pattern.replace("[", "[[]")
+
+
+def metadata_contains(metadata: Any, wanted: Any) -> bool:
+    """Whether ``metadata`` contains ``wanted``, like PostgreSQL's jsonb ``@>``.
+
+    Objects contain objects whose keys they contain; arrays contain arrays
+    whose every element they contain; scalars must be equal and of the same
+    JSON type (so ``1`` does not match ``true``).
+    """
+    if isinstance(wanted, dict):
+        return isinstance(metadata, dict) and all(
+            key in metadata and metadata_contains(metadata[key], value)
+            for key, value in wanted.items()
+        )
+    if isinstance(wanted, list):
+        return isinstance(metadata, list) and all(
+            any(metadata_contains(item, value) for item in metadata) for value in wanted
+        )
+    if isinstance(wanted, bool) or isinstance(metadata, bool):
+        return metadata is wanted
+    if isinstance(wanted, (int, float)) and isinstance(metadata, (int, float)):
+        return metadata == wanted
+    return type(metadata) is type(wanted) and metadata == wanted
@@ -0,0 +1,64 @@
+"""Chunk-level diffing for incremental re-ingestion in RAG Magic."""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from .cache import content_hash
+
+
+@dataclass
+class ChunkDiff:
+    """Changes needed to turn a stored document's chunks into new chunks.
+
+    - ``unchanged``: IDs of rows that keep their content and position
+    - ``moved``: ``(row_id, new_chunk_index)`` for rows whose position changed
+    - ``inserted``: ``(chunk_index, text)`` for chunks that need embedding
+    - ``deleted``: IDs of rows whose content no longer appears
+    """
+
+    unchanged: List[int] = field(default_factory=list)
+    moved: List[Tuple[int, int]] = field(default_factory=list)
+    inserted: List[Tuple[int, str]] = field(default_factory=list)
+    deleted: List[int] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.moved or self.inserted or self.deleted)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.unchanged)} unchanged, {len(self.moved)} moved, "
+            f"{len(self.inserted)} inserted, {len(self.deleted)} deleted"
+        )
+
+
+def diff_chunks(existing: List[Dict[str, Any]], chunks: List[str]) -> ChunkDiff:
+    """Match new chunks to stored rows by content hash.
+
+    ``existing`` rows need ``id``, ``chunk_index`` and ``content_hash``. Each
+    stored row is reused at most once; when several rows share a hash, the one
+    already at the right position is preferred so repeated chunks do not move.
+    """
+    available: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in sorted(existing, key=lambda r: r["chunk_index"]):
+        available[row["content_hash"]].append(row)
+
+    diff = ChunkDiff()
+    for index, text in enumerate(chunks):
+        candidates = available.get(content_hash(text))
+        if not candidates:
+            diff.inserted.append((index, text))
+            continue
+
+        match = next(
+            (row for row in candidates if row["chunk_index"] == index), candidates[0]
+        )
+        candidates.remove(match)
+        if match["chunk_index"] == index:
+            diff.unchanged.append(match["id"])
+        else:
+            diff.moved.append((match["id"], index))
+
+    diff.deleted = [row["id"] for rows in available.values() for row in rows]
+    return diff
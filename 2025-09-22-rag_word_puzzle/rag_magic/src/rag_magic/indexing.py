@@ -0,0 +1,135 @@
+"""Vector index management for RAG Magic.
+
+Builds and inspects the approximate nearest neighbour (ANN) index on the
+``embedding`` column of a collection's embeddings table (``rag.embeddings``
+for the default collection). Two pgvector index types are supported:
+
+- ``hnsw``: graph index, tuned by ``m`` and ``ef_construction`` at build
+  time and ``hnsw.ef_search`` at query time. Needs no training data.
+- ``ivfflat``: clustered index, tuned by ``lists`` at build time and
+  ``ivfflat.probes`` at query time. Lists are derived from the row count,
+  so it should be rebuilt after large ingests.
+
+Either index can be built over a quantized expression of the column
+(``halfvec`` or ``binary``, see :mod:`rag_magic.quantization`); searches
+then re-rank the index's candidates on the full-precision vectors.
+
+The backends implement the builds and plans (see
+:class:`~rag_magic.storage.StorageBackend`); this module holds the build
+parameters and sizing guidance and needs no database driver. With the
+local storage backend the same functions manage its IVF partitioning,
+which behaves like ivfflat, and its quantized codes.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+from . import tracing
+from .quantization import QUANTIZATION_MODES, check_mode
+
+if TYPE_CHECKING:
+    from .storage import StorageBackend
+
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+
+def recommended_lists(rows: int) -> int:
+    """pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def recommended_probes(lists: int) -> int:
+    """A starting point for ``ivfflat.probes``: sqrt(lists)."""
+    return max(1, int(math.sqrt(lists)))
+
+
+@dataclass
+class IndexSpec:
+    """Build parameters for the embedding ANN index."""
+
+    method: str = "hnsw"
+    m: int = 16
+    ef_construction: int = 64
+    lists: Optional[int] = None  # ivfflat only; None derives it from the row count
+    quantization: Optional[str] = None  # None keeps the current quantization
+
+    def __post_init__(self):
+        if self.method not in INDEX_METHODS:
+            raise ValueError(
+                f"Unknown index method: {self.method} "
+                f"(use {' or '.join(INDEX_METHODS)})"
+            )
+        if self.quantization is not None:
+            check_mode(self.quantization, QUANTIZATION_MODES)
+
+    def with_params(self) -> str:
+        """The ``WITH (...)`` storage parameters for CREATE INDEX."""
+        if self.method == "hnsw":
+            return f"m = {int(self.m)}, ef_construction = {int(self.ef_construction)}"
+        return f"lists = {int(self.lists or 1)}"
+
+
+def get_index_status(db: "StorageBackend") -> Optional[Dict[str, Any]]:
+    """Return the embedding row count and the vector indexes of the collection.
+
+    Index sizes of a partitioned table are summed over its partitions.
+    """
+    return db.index_status()
+
+
+@tracing.traced("index.build")
+def build_index(
+    db: "StorageBackend",
+    spec: IndexSpec,
+    maintenance_work_mem: Optional[str] = None,
+) -> Optional[IndexSpec]:
+    """Drop and rebuild the embedding ANN index.
+
+    For ivfflat without explicit ``lists`` the count is derived from the
+    current number of rows (per partition for a partitioned table, where
+    every partition gets its own index). Without ``quantization`` the index
+    keeps its current one. Returns the spec that was built, or None.
+    The local backend only supports ivfflat, which compacts the store,
+    rewrites its quantized codes and retrains its IVF partitioning.
+    """
+    return db.build_index(spec, maintenance_work_mem)
+
+
+def sample_embeddings(db: "StorageBackend", count: int) -> List[List[float]]:
+    """Return up to ``count`` randomly chosen stored embeddings."""
+    return db.sample_embeddings(count)
+
+
+def explain_search(
+    db: "StorageBackend",
+    query_embedding: Sequence[float],
+    limit: int = 10,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    force_index: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """EXPLAIN the top-k similarity query and report which index serves it.
+
+    Returns the plan and the vector index used (None means every row is
+    scanned), plus PostgreSQL's estimated ``total_cost`` or the local
+    store's ``rows_scanned``. ``force_index`` disables sequential scans,
+    showing whether the index *can* serve the query even when the planner
+    prefers scanning a small table.
+    """
+    return db.explain_search(query_embedding, limit, ef_search, probes, force_index)
+
+
+def format_plan(plan: Dict[str, Any], depth: int = 0) -> List[str]:
+    """Render a JSON plan as indented ``Node Type on relation using index`` lines."""
+    line = "  " * depth + "-> " + plan["Node Type"]
+    if plan.get("Relation Name"):
+        line += f" on {plan['Relation Name']}"
+    if plan.get("Index Name"):
+        line += f" using {plan['Index Name']}"
+    lines = [line]
+    for child in plan.get("Plans", []):
+        lines.extend(format_plan(child, depth + 1))
+    return lines
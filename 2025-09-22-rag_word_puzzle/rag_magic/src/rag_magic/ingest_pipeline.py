@@ -0,0 +1,255 @@
+"""Parallel, pipelined directory ingestion for RAG Magic.
+
+Files are read and chunked in a process pool, chunks from several files are
+grouped into engine-sized embedding batches, and finished documents are
+written by a background thread with batched multi-row INSERTs, so reading,
+embedding and database writes overlap.
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from . import tracing
+from .chunking import chunking_metadata, get_chunker, get_tokenizer
+from .embeddings import DocumentProcessor, read_text_file
+from .storage import NewDocument, StorageBackend
+
+console = Console()
+
+
+@dataclass
+class ChunkedFile:
+    """A file's content and chunks, produced by a worker process."""
+
+    source: str
+    content: str = ""
+    chunks: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    # Tokens in the chunks, counted only while tracing
+    tokens: int = 0
+
+
+@dataclass
+class DirectoryIngestStats:
+    """Outcome of a directory ingestion run."""
+
+    files: int = 0
+    chunks: int = 0
+    empty: int = 0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def discover_files(
+    root: str, patterns: List[str], predicate: Callable[[str], bool]
+) -> List[str]:
+    """Find files under ``root`` matching any glob pattern and ``predicate``."""
+    base = Path(root)
+    found = set()
+    for pattern in patterns:
+        for path in base.glob(pattern):
+            if path.is_file() and predicate(str(path)):
+                found.add(str(path))
+    return sorted(found)
+
+
+def read_and_chunk(
+    source: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    strategy: str = "characters",
+    count_tokens: bool = False,
+    tokenizer_name: Optional[str] = None,
+) -> ChunkedFile:
+    """Read and chunk one file (runs in a worker process).
+
+    With ``count_tokens`` the chunks' tokens are counted for tracing.
+    ``tokenizer_name`` is the tokenizer the parent resolved, so workers
+    agree with it and do not repeat a failed load.
+    """
+    try:
+        content, _ = read_text_file(source)
+        tokenizer = get_tokenizer(tokenizer_name)
+        chunker = get_chunker(
+            strategy, chunk_size, chunk_overlap, source=source, tokenizer=tokenizer
+        )
+        chunks = chunker.split(content)
+        tokens = sum(tokenizer.count(chunk) for chunk in chunks) if count_tokens else 0
+        return ChunkedFile(source, content, chunks, tokens=tokens)
+    except Exception as e:
+        return ChunkedFile(source, error=str(e))
+
+
+def ingest_files(
+    db: StorageBackend,
+    processor: DocumentProcessor,
+    sources: List[str],
+    title_for: Callable[[str], str],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    workers: int = 4,
+    page_size: int = 500,
+    strategy: str = "characters",
+) -> DirectoryIngestStats:
+    """Ingest many files with one DB connection and one embedding engine."""
+    stats = DirectoryIngestStats()
+    tokenizer = get_tokenizer()
+    # Enough chunks to keep every concurrent embedding request busy
+    batch_target = processor.engine.batch_size * processor.engine.concurrency
+    writes: queue.Queue = queue.Queue(maxsize=2)
+    started = time.perf_counter()
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("[cyan]{task.fields[files_rate]:.1f} files/s"),
+        TextColumn("[green]{task.fields[chunks_rate]:,.0f} chunks/s"),
+        TimeElapsedColumn(),
+        console=console,
+    )
+    task = progress.add_task(
+        "Ingesting files", total=len(sources), files_rate=0.0, chunks_rate=0.0
+    )
+
+    def advance(files: int):
+        stats.elapsed = time.perf_counter() - started
+        progress.update(
+            task,
+            advance=files,
+            files_rate=stats.files_per_second,
+            chunks_rate=stats.chunks_per_second,
+        )
+
+    def build_document(chunked: ChunkedFile, vectors) -> NewDocument:
+        return NewDocument(
+            title=title_for(chunked.source),
+            content=chunked.content,
+            source=chunked.source,
+            rows=[
+                (chunk, vector, {"chunk_size": len(chunk)})
+                for chunk, vector in zip(chunked.chunks, vectors)
+            ],
+            metadata={
+                **chunking_metadata(
+                    strategy, chunk_size, chunk_overlap, chunked.source, tokenizer
+                ),
+                "total_chunks": len(chunked.chunks),
+            },
+        )
+
+    def writer():
+        while True:
+            item = writes.get()
+            if item is None:
+                return
+            files, documents = item
+            try:
+                written = db.insert_documents_with_embeddings(
+                    documents, page_size, report=False
+                )
+                error = None if written else "database write failed"
+            except Exception as e:
+                error = str(e)
+            if error:
+                stats.failed.extend((f.source, error) for f in files)
+            else:
+                stats.files += len(files)
+                stats.chunks += sum(len(f.chunks) for f in files)
+            advance(len(files))
+
+    # Fork the worker processes before any thread (writer, progress refresh) starts
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                read_and_chunk,
+                source,
+                chunk_size,
+                chunk_overlap,
+                strategy,
+                tracing.tracer.enabled,
+                tokenizer.name,
+            )
+            for source in sources
+        ]
+        # The writer's database spans nest under the caller's
+        writer_thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(writer,), daemon=True
+        )
+        writer_thread.start()
+
+        pending: List[ChunkedFile] = []
+        pending_chunks = 0
+
+        def flush():
+            nonlocal pending_chunks
+            texts = [chunk for chunked in pending for chunk in chunked.chunks]
+            vectors = processor.generate_embeddings(texts, show_progress=False)
+            documents = []
+            offset = 0
+            for chunked in pending:
+                count = len(chunked.chunks)
+                documents.append(
+                    build_document(chunked, vectors[offset : offset + count])
+                )
+                offset += count
+            writes.put((list(pending), documents))
+            pending.clear()
+            pending_chunks = 0
+
+        try:
+            with progress:
+                for future in as_completed(futures):
+                    chunked = future.result()
+                    if chunked.error:
+                        stats.failed.append((chunked.source, chunked.error))
+                        advance(1)
+                        continue
+                    if not chunked.chunks:
+                        stats.empty += 1
+                        advance(1)
+                        continue
+
+                    tracing.count("chunks", len(chunked.chunks))
+                    tracing.count("chunk_tokens", chunked.tokens)
+                    pending.append(chunked)
+                    pending_chunks += len(chunked.chunks)
+                    if pending_chunks >= batch_target:
+                        flush()
+
+                if pending:
+                    flush()
+                writes.put(None)
+                writer_thread.join()
+        finally:
+            if writer_thread.is_alive():
+                writes.put(None)
+                writer_thread.join()
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
@@ -0,0 +1,1580 @@
+"""In-process vector store for RAG Magic.
+
+A file-based storage backend for laptops and CI that needs no database
+server. A store is a directory holding:
+
+- ``embeddings.f32``: a memory-mapped float32 matrix with one L2-normalized
+  embedding per row, so cosine similarity is a single matrix product.
+- ``metadata.db``: a SQLite sidecar with documents, chunk text and
+  metadata, an FTS5 full-text index and each chunk's matrix row (slot).
+- ``ivf_centroids.npy`` / ``ivf_lists.i32``: the optional IVF partitioning.
+- ``embeddings.codes`` (and ``int8_scales.npy``): the optional quantized
+  copy of the matrix (see :mod:`rag_magic.quantization`).
+
+Search is an exact, vectorized scan of the matrix. Once the store holds
+``ivf_min_rows`` chunks, an IVF partitioning (spherical k-means lists, like
+pgvector's ivfflat) is trained and searches only scan the ``probes`` lists
+whose centroids are nearest the query. With quantization, the scan reads
+the smaller codes instead and re-ranks the best candidates on the
+full-precision matrix.
+
+The default collection is stored in ``LOCAL_STORE_PATH`` itself; every
+other collection is a store of its own under ``collections/<name>``, whose
+settings record the collection's model, dimension and normalization.
+"""
+
+import itertools
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from rich.console import Console
+
+from . import quantization, tracing
+from .cache import content_hash
+from .filters import (
+    DEFAULT_PREFILTER_ROWS,
+    FilterPlan,
+    SearchFilter,
+    glob_to_sqlite,
+    metadata_contains,
+    plan_filter,
+)
+from .indexing import IndexSpec, recommended_lists, recommended_probes
+from .quantization import DEFAULT_RERANK_FACTOR
+from .registry import (
+    DEFAULT_COLLECTION,
+    DEFAULT_DIMENSION,
+    Collection,
+    check_collection_name,
+)
+from .storage import (
+    DEFAULT_PAGE_SIZE,
+    IndexedEmbeddingRow,
+    NewDocument,
+    StorageBackend,
+    report_throughput,
+)
+
+console = Console()
+
+MATRIX_FILE = "embeddings.f32"
+LISTS_FILE = "ivf_lists.i32"
+CENTROIDS_FILE = "ivf_centroids.npy"
+CODES_FILE = "embeddings.codes"
+SCALES_FILE = "int8_scales.npy"
+METADATA_FILE = "metadata.db"
+COLLECTIONS_DIR = "collections"
+
+# Matrix rows handled per step when compacting or assigning IVF lists
+_SCAN_BATCH = 65_536
+_MIN_CAPACITY = 1024
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+# Failures reported like psycopg2.Error is by DatabaseConnection
+StoreError = (sqlite3.Error, OSError, ValueError)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS settings (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        content TEXT,
+        source TEXT,
+        metadata TEXT NOT NULL DEFAULT '{}',
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS documents_source_idx ON documents(source);
+    CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        document_id INTEGER NOT NULL REFERENCES documents(id),
+        chunk_index INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        metadata TEXT NOT NULL DEFAULT '{}',
+        slot INTEGER NOT NULL UNIQUE,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS chunks_document_idx ON chunks(document_id, chunk_index);
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+        content, content='chunks', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END;
+"""
+
+# Any query word may match, ranked by BM25 (higher is better)
+LEXICAL_SEARCH_SQL = """
+    SELECT c.id, c.document_id, c.chunk_index, c.content, c.metadata,
+           -bm25(chunks_fts) AS lexical_score
+    FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+    WHERE chunks_fts MATCH ? {filter}
+    ORDER BY lexical_score DESC
+    LIMIT ?
+"""
+
+# Restricts a query to the documents in a JSON array parameter
+DOCUMENT_FILTER_SQL = "c.document_id IN (SELECT value FROM json_each(?))"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so cosine similarity is a dot product."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """OR together the quoted words of ``text`` as an FTS5 query."""
+    words = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{word}"' for word in words) or None
+
+
+def collection_path(root: Path, name: str) -> Path:
+    """Store directory of collection ``name`` under the store root."""
+    if name == DEFAULT_COLLECTION:
+        return root
+    return root / COLLECTIONS_DIR / check_collection_name(name)
+
+
+def _batches(values: Sequence[Any]) -> Iterator[Sequence[Any]]:
+    for i in range(0, len(values), _LOOKUP_BATCH):
+        yield values[i : i + _LOOKUP_BATCH]
+
+
+class LocalVectorStore(StorageBackend):
+    """File-based storage backend with exact or IVF-partitioned vector search.
+
+    Operations are serialized by a lock, so one store directory should be
+    used by one process at a time. Deleted chunks leave free rows in the
+    matrix until the next IVF (re)build compacts it.
+    """
+
+    backend = "local"
+    index_methods = ("ivfflat",)
+
+    def __init__(
+        self,
+        path: str,
+        ivf_min_rows: int = 50_000,
+        rerank_factor: int = DEFAULT_RERANK_FACTOR,
+        collection: str = DEFAULT_COLLECTION,
+        prefilter_rows: int = DEFAULT_PREFILTER_ROWS,
+    ):
+        self.root = Path(path).expanduser()
+        self.collection = check_collection_name(collection)
+        self.path = collection_path(self.root, collection)
+        self.ivf_min_rows = ivf_min_rows
+        self.rerank_factor = rerank_factor
+        self.prefilter_rows = prefilter_rows
+        self.dimension: Optional[int] = None
+        self.quantization = "none"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._capacity = 0
+        # Slots handed out so far; rows at or beyond this are unused
+        self._used = 0
+        self._matrix: Optional[np.memmap] = None
+        # Chunk ID stored in each slot, -1 for free slots
+        self._slot_ids = np.empty(0, dtype=np.int64)
+        self._lists: Optional[np.memmap] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._codes: Optional[np.memmap] = None
+        self._scales: Optional[np.ndarray] = None
+        # Live slots grouped by IVF list, rebuilt on first search after a write
+        self._list_order: Optional[np.ndarray] = None
+        self._list_bounds: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_env(cls, collection: Optional[str] = None) -> "LocalVectorStore":
+        """Create a local store from environment variables."""
+        return cls(
+            path=os.getenv(
+                "LOCAL_STORE_PATH", str(Path.home() / ".cache/rag_magic/store")
+            ),
+            ivf_min_rows=int(os.getenv("LOCAL_IVF_MIN_ROWS", "50000")),
+            rerank_factor=int(
+                os.getenv("QUANTIZATION_RERANK_FACTOR", str(DEFAULT_RERANK_FACTOR))
+            ),
+            collection=collection or DEFAULT_COLLECTION,
+            prefilter_rows=int(
+                os.getenv("FILTER_PREFILTER_ROWS", str(DEFAULT_PREFILTER_ROWS))
+            ),
+        )
+
+    def connect(self) -> bool:
+        """Open the store directory, creating it for the default collection.
+
+        Other collections must first be created with :meth:`create_collection`.
+        """
+        with self._lock:
+            if self._conn:
+                return True
+            if self.collection != DEFAULT_COLLECTION and not self.path.exists():
+                console.print(
+                    f"[red]Collection '{self.collection}' not found; create it "
+                    "with 'rag-magic collection create'[/red]"
+                )
+                return False
+            try:
+                self.path.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(
+                    str(self.path / METADATA_FILE), check_same_thread=False
+                )
+                conn.row_factory = sqlite3.Row
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(SCHEMA)
+                conn.commit()
+                self._conn = conn
+                self._load()
+                return True
+            except StoreError as e:
+                console.print(f"[red]Failed to open local vector store: {e}[/red]")
+                self._conn = None
+                return False
+
+    def disconnect(self):
+        """Flush the matrix and close the metadata database."""
+        with self._lock:
+            if self._conn:
+                self._flush()
+                self._conn.close()
+                self._conn = None
+                self._matrix = self._lists = self._codes = None
+
+    def _setting(self, name: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM settings WHERE name = ?", (name,)
+        ).fetchone()
+        return row["value"] if row else None
+
+    def _set_setting(self, name: str, value: Any):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+            (name, str(value)),
+        )
+
+    def _load(self):
+        """(Re)build the in-memory state from the files on disk."""
+        dimension = self._setting("dimension")
+        self.dimension = int(dimension) if dimension else None
+        self._used = int(self._setting("next_slot") or 0)
+        self.quantization = self._setting("quantization") or "none"
+        self._capacity = 0
+        self._matrix = self._lists = self._codes = None
+        self._slot_ids = np.empty(0, dtype=np.int64)
+        self._centroids = self._scales = None
+        self._list_order = None
+        if not self.dimension:
+            return
+
+        matrix_path = self.path / MATRIX_FILE
+        on_disk = matrix_path.stat().st_size if matrix_path.exists() else 0
+        self._open_files(max(self._used, on_disk // (4 * self.dimension)))
+        pairs = np.array(
+            self._conn.execute("SELECT slot, id FROM chunks").fetchall(),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        self._slot_ids[pairs[:, 0]] = pairs[:, 1]
+        if (self.path / CENTROIDS_FILE).exists():
+            self._centroids = np.load(self.path / CENTROIDS_FILE)
+        if (self.path / SCALES_FILE).exists():
+            self._scales = np.load(self.path / SCALES_FILE)
+
+    def _open_files(self, capacity: int):
+        """Map the matrix, IVF list and code files, grown to ``capacity`` rows."""
+        self._flush()
+        self._matrix = self._lists = self._codes = None
+        if capacity <= 0:
+            return
+        lists_path = self.path / LISTS_FILE
+        lists_before = lists_path.stat().st_size // 4 if lists_path.exists() else 0
+        files = [(MATRIX_FILE, 4 * self.dimension), (LISTS_FILE, 4)]
+        if self.quantization != "none":
+            code_bytes = quantization.bytes_per_vector(
+                self.quantization, self.dimension
+            )
+            files.append((CODES_FILE, code_bytes))
+        for name, row_bytes in files:
+            with open(self.path / name, "ab") as f:
+                if f.tell() < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+
+        self._matrix = np.memmap(
+            self.path / MATRIX_FILE,
+            dtype=np.float32,
+            mode="r+",
+            shape=(capacity, self.dimension),
+        )
+        self._lists = np.memmap(
+            lists_path, dtype=np.int32, mode="r+", shape=(capacity,)
+        )
+        if lists_before < capacity:
+            self._lists[lists_before:] = -1
+        if self.quantization != "none":
+            self._codes = np.memmap(
+                self.path / CODES_FILE,
+                dtype=quantization.code_dtype(self.quantization),
+                mode="r+",
+                shape=(
+                    capacity,
+                    quantization.code_width(self.quantization, self.dimension),
+                ),
+            )
+        slot_ids = np.full(capacity, -1, dtype=np.int64)
+        slot_ids[: len(self._slot_ids)] = self._slot_ids[:capacity]
+        self._slot_ids = slot_ids
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int):
+        if rows > self._capacity:
+            self._open_files(max(rows, self._capacity * 2, _MIN_CAPACITY))
+
+    def _flush(self):
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._lists.flush()
+        if self._codes is not None:
+            self._codes.flush()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold the lock for a write; roll back and reload the state on failure."""
+        with self._lock:
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.rollback()
+                self._load()
+                raise
+
+    def _commit(self, next_slot: int):
+        """Flush written rows, then commit the metadata that makes them visible."""
+        self._set_setting("next_slot", next_slot)
+        self._flush()
+        self._conn.commit()
+        self._used = next_slot
+        self._list_order = None
+
+    def _sync_slots(self, start_slot: int):
+        """Pick up the chunk IDs of slots written from ``start_slot`` onwards."""
+        for row in self._conn.execute(
+            "SELECT slot, id FROM chunks WHERE slot >= ?", (start_slot,)
+        ):
+            self._slot_ids[row["slot"]] = row["id"]
+
+    def _free_slots(self, slots: List[int]):
+        self._slot_ids[slots] = -1
+        self._list_order = None
+
+    def _live_rows(self) -> int:
+        return int(np.count_nonzero(self._slot_ids[: self._used] >= 0))
+
+    def _check_dimension(self, dimension: int):
+        if self.dimension is None:
+            self.dimension = dimension
+            self._set_setting("dimension", dimension)
+        elif dimension != self.dimension:
+            raise ValueError(
+                f"Embedding has {dimension} dimensions but the store holds "
+                f"{self.dimension}-dimensional vectors"
+            )
+
+    def _query_vector(self, query_embedding: Sequence[float]) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        self._check_dimension(len(query))
+        return _normalize(query)
+
+    def _write_chunks(
+        self,
+        document_id: int,
+        rows: Iterable[IndexedEmbeddingRow],
+        page_size: int,
+        next_slot: int,
+    ) -> Tuple[int, int]:
+        """Write ``(chunk_index, content, embedding, metadata)`` rows page by page.
+
+        Rows are consumed lazily, so ``rows`` may be a generator. Returns the
+        number of rows written and the next free slot. The caller commits.
+        """
+        written = 0
+        rows = iter(rows)
+        while page := list(itertools.islice(rows, page_size)):
+            vectors = np.asarray([row[2] for row in page], dtype=np.float32)
+            if vectors.ndim != 2:
+                raise ValueError("Embeddings in a page must have equal lengths")
+            self._check_dimension(vectors.shape[1])
+            self._ensure_capacity(next_slot + len(page))
+            vectors = _normalize(vectors)
+            end = next_slot + len(page)
+            self._matrix[next_slot:end] = vectors
+            if self._centroids is not None:
+                self._lists[next_slot:end] = self._assign_lists(vectors)
+            if self._codes is not None:
+                self._codes[next_slot:end] = self._encode(vectors)
+
+            now = _now()
+            self._conn.executemany(
+                """
+                INSERT INTO chunks
+                    (document_id, chunk_index, content, content_hash, metadata,
+                     slot, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        document_id,
+                        chunk_index,
+                        content,
+                        content_hash(content),
+                        json.dumps(metadata or {}),
+                        next_slot + offset,
+                        now,
+                    )
+                    for offset, (chunk_index, content, _, metadata) in enumerate(page)
+                ],
+            )
+            written += len(page)
+            next_slot = end
+        tracing.count("rows_written", written)
+        return written, next_slot
+
+    def test_connection(self) -> bool:
+        """Check the store can be opened and report its contents."""
+        if not self.connect():
+            return False
+
+        try:
+            with self._lock:
+                counts = self._conn.execute("""
+                    SELECT (SELECT COUNT(*) FROM documents) AS documents,
+                           (SELECT COUNT(*) FROM chunks) AS chunks
+                """).fetchone()
+            console.print(f"[green]✓ Local vector store: {self.path}[/green]")
+            console.print(f"[green]✓ Collection '{self.collection}'[/green]")
+            dimensions = f" ({self.dimension} dimensions)" if self.dimension else ""
+            console.print(
+                f"[green]✓ {counts['documents']} documents, "
+                f"{counts['chunks']} chunks{dimensions}[/green]"
+            )
+            if self._centroids is not None:
+                console.print(
+                    f"[green]✓ IVF partitioning: {len(self._centroids)} lists[/green]"
+                )
+            if self.quantization != "none":
+                console.print(
+                    f"[green]✓ {self.quantization} quantization "
+                    f"(re-ranking {self.rerank_factor}x candidates)[/green]"
+                )
+            else:
+                console.print("[green]✓ Exact search (no IVF partitioning)[/green]")
+            console.print("[green]✓ Store is ready for RAG operations[/green]")
+            return True
+
+        except StoreError as e:
+            console.print(f"[red]Local store test failed: {e}[/red]")
+            return False
+
+    @tracing.traced("db.insert_documents")
+    def insert_documents_with_embeddings(
+        self,
+        documents: Iterable[NewDocument],
+        page_size: int = DEFAULT_PAGE_SIZE,
+        report: bool = True,
+    ) -> Optional[List[int]]:
+        """Insert several documents and their embeddings in one transaction.
+
+        Returns the new document IDs in input order, or None on failure.
+        Set ``report=False`` to suppress the throughput message.
+        """
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        started = time.perf_counter()
+        document_ids = []
+        written = 0
+        try:
+            with self._transaction() as conn:
+                start_slot = next_slot = self._used
+                for document in documents:
+                    now = _now()
+                    document_id = conn.execute(
+                        """
+                        INSERT INTO documents
+                            (title, content, source, metadata, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            document.title,
+                            document.content,
+                            document.source,
+                            json.dumps(document.metadata or {}),
+                            now,
+                            now,
+                        ),
+                    ).lastrowid
+                    rows_written, next_slot = self._write_chunks(
+                        document_id,
+                        (
+                            (chunk_index, *row)
+                            for chunk_index, row in enumerate(document.rows)
+                        ),
+                        page_size,
+                        next_slot,
+                    )
+                    if "total_chunks" not in (document.metadata or {}):
+                        # Streamed rows are only counted once they are written
+                        conn.execute(
+                            "UPDATE documents "
+                            "SET metadata = json_set(metadata, '$.total_chunks', ?) "
+                            "WHERE id = ?",
+                            (rows_written, document_id),
+                        )
+                    written += rows_written
+                    document_ids.append(document_id)
+                self._commit(next_slot)
+                self._sync_slots(start_slot)
+            self._maybe_train()
+        except StoreError as e:
+            console.print(f"[red]Failed to ingest documents: {e}[/red]")
+            return None
+
+        if report:
+            report_throughput(written, time.perf_counter() - started)
+        return document_ids
+
+    @tracing.traced("db.get_existing_sources")
+    def get_existing_sources(self, sources: List[str]) -> Set[str]:
+        """Return which of ``sources`` already have a document."""
+        if not self._conn:
+            if not self.connect():
+                return set()
+
+        try:
+            existing = set()
+            with self._lock:
+                for batch in _batches(sources):
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        "SELECT source FROM documents "
+                        f"WHERE source IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    existing.update(row["source"] for row in rows)
+            return existing
+
+        except StoreError as e:
+            console.print(f"[red]Failed to look up documents: {e}[/red]")
+            return set()
+
+    @tracing.traced("db.get_chunk_hashes", count_rows="rows_read")
+    def get_chunk_hashes(self, document_id: int) -> List[Dict[str, Any]]:
+        """Get id, chunk_index and sha256 content hash of a document's chunks."""
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    """
+                    SELECT id, chunk_index, content_hash FROM chunks
+                    WHERE document_id = ?
+                    ORDER BY chunk_index
+                    """,
+                    (document_id,),
+                ).fetchall()
+            return [dict(row) for row in rows]
+
+        except StoreError as e:
+            console.print(f"[red]Failed to get chunk hashes: {e}[/red]")
+            return []
+
+    @tracing.traced("db.apply_chunk_diff")
+    def apply_chunk_diff(
+        self,
+        document_id: int,
+        content: str,
+        metadata: Dict[str, Any],
+        moved: List[Tuple[int, int]],
+        deleted: List[int],
+        inserted: Iterable[IndexedEmbeddingRow],
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> bool:
+        """Apply an incremental chunk diff to a document in one transaction.
+
+        Deletes removed chunk rows, renumbers moved rows in place, inserts new
+        ``(chunk_index, content, embedding, metadata)`` rows and refreshes the
+        document's content and metadata. Unchanged rows are not touched.
+        """
+        if not self._conn:
+            if not self.connect():
+                return False
+
+        try:
+            with self._transaction() as conn:
+                freed = []
+                for batch in _batches(deleted):
+                    placeholders = ",".join("?" * len(batch))
+                    freed += [
+                        row["slot"]
+                        for row in conn.execute(
+                            f"SELECT slot FROM chunks WHERE id IN ({placeholders})",
+                            batch,
+                        )
+                    ]
+                conn.executemany(
+                    "DELETE FROM chunks WHERE id = ?", [(id_,) for id_ in deleted]
+                )
+                conn.executemany(
+                    "UPDATE chunks SET chunk_index = ? WHERE id = ?",
+                    [(chunk_index, id_) for id_, chunk_index in moved],
+                )
+                start_slot = self._used
+                _, next_slot = self._write_chunks(
+                    document_id, inserted, page_size, start_slot
+                )
+                conn.execute(
+                    """
+                    UPDATE documents SET content = ?, metadata = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (content, json.dumps(metadata), _now(), document_id),
+                )
+                self._commit(next_slot)
+                self._free_slots(freed)
+                self._sync_slots(start_slot)
+            return True
+
+        except StoreError as e:
+            console.print(f"[red]Failed to apply incremental update: {e}[/red]")
+            return False
+
+    def _assign_lists(self, vectors: np.ndarray) -> np.ndarray:
+        """The nearest IVF centroid of each (normalized) vector."""
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _list_slots(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Live slots sorted by IVF list, and where each list starts."""
+        if self._list_order is None:
+            live = np.flatnonzero(self._slot_ids[: self._used] >= 0)
+            lists = np.asarray(self._lists[live])
+            order = np.argsort(lists, kind="stable")
+            self._list_order = live[order]
+            self._list_bounds = np.searchsorted(
+                lists[order], np.arange(len(self._centroids) + 1)
+            )
+        return self._list_order, self._list_bounds
+
+    def _probe_slots(
+        self, query: np.ndarray, limit: int, probes: Optional[int]
+    ) -> Tuple[np.ndarray, int]:
+        """Slots in the lists nearest ``query`` and how many lists were probed.
+
+        Probes ``probes`` lists (default sqrt(lists)), and more if those hold
+        fewer than ``limit`` rows.
+        """
+        # indexing pulls in the PostgreSQL modules; load it only once needed
+        order, bounds = self._list_slots()
+        nearest = np.argsort(-(self._centroids @ query))
+        probes = probes or recommended_probes(len(self._centroids))
+        filled = np.cumsum(np.diff(bounds)[nearest])
+        probed = max(probes, int(np.searchsorted(filled, limit)) + 1)
+        chosen = nearest[:probed]
+        slots = np.concatenate([order[bounds[i] : bounds[i + 1]] for i in chosen])
+        return slots, len(chosen)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantization == "int8" and self._scales is None:
+            # First rows of an empty int8 store; rebuilding rescales from all rows
+            self._scales = quantization.int8_scales(vectors)
+            np.save(self.path / SCALES_FILE, self._scales)
+        return quantization.encode(self.quantization, vectors, self._scales)
+
+    def _search(
+        self,
+        query: np.ndarray,
+        limit: int,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[Tuple[int, float]]:
+        """(chunk ID, cosine similarity) of the ``limit`` nearest chunks, best first.
+
+        ``exact`` scans every full-precision row, ignoring IVF and quantization.
+        """
+        if not self._used or limit <= 0:
+            return []
+        quantized = self._codes is not None and not exact
+        source = self._codes if quantized else self._matrix
+        if exact or self._centroids is None:
+            slots = np.arange(self._used)
+            rows = source[: self._used]
+        else:
+            slots, _ = self._probe_slots(query, limit, probes)
+            rows = source[slots]
+        if quantized:
+            scores = quantization.scores(self.quantization, rows, query, self._scales)
+        else:
+            scores = np.asarray(rows @ query)
+        if len(slots) == self._used:
+            scores[self._slot_ids[slots] < 0] = -np.inf
+
+        if quantized:
+            # Re-rank the best candidates by exact similarity
+            candidates = quantization.top_indices(scores, limit * self.rerank_factor)
+            slots = slots[candidates]
+            scores = np.asarray(self._matrix[slots] @ query)
+        top = quantization.top_indices(scores, limit)
+        return [(int(self._slot_ids[slots[i]]), float(scores[i])) for i in top]
+
+    def _search_slots(
+        self, query: np.ndarray, limit: int, slots: np.ndarray
+    ) -> List[Tuple[int, float]]:
+        """Like :meth:`_search`, scanning just ``slots`` at full precision."""
+        if not len(slots) or limit <= 0:
+            return []
+        scores = np.asarray(self._matrix[slots] @ query)
+        top = quantization.top_indices(scores, limit)
+        return [(int(self._slot_ids[slots[i]]), float(scores[i])) for i in top]
+
+    def _filter_plan(self, filters: SearchFilter) -> FilterPlan:
+        """Resolve ``filters`` to document IDs and choose pre- or post-filtering."""
+        conditions, params = ["1"], []
+        if filters.source_glob:
+            conditions.append("source GLOB ?")
+            params.append(glob_to_sqlite(filters.source_glob))
+        if filters.document_ids:
+            conditions.append("id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(filters.document_ids)))
+        rows = self._conn.execute(
+            f"SELECT id, metadata FROM documents WHERE {' AND '.join(conditions)} "
+            "ORDER BY id",
+            params,
+        ).fetchall()
+        document_ids = [
+            row["id"]
+            for row in rows
+            if not filters.metadata
+            or metadata_contains(json.loads(row["metadata"]), filters.metadata)
+        ]
+        (total,) = self._conn.execute("SELECT count(*) FROM documents").fetchone()
+        (chunks,) = self._conn.execute(
+            f"SELECT count(*) FROM chunks c WHERE {DOCUMENT_FILTER_SQL}",
+            (json.dumps(document_ids),),
+        ).fetchone()
+        return plan_filter(document_ids, chunks, total, self.prefilter_rows)
+
+    def _filtered_search(
+        self,
+        query: np.ndarray,
+        limit: int,
+        probes: Optional[int],
+        plan: FilterPlan,
+        threshold: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """:meth:`_search` restricted to the documents of ``plan``.
+
+        Selective filters scan only the matching chunks. Broad ones search
+        for ``limit`` / selectivity candidates and drop the rest, scanning
+        the matching chunks after all if that leaves fewer than ``limit``
+        (unless the last candidate already fails ``threshold``).
+        """
+        if not plan.document_ids:
+            return []
+        if not plan.prefilter:
+            wanted = plan.candidates(limit)
+            candidates = self._search(query, wanted, probes)
+            chunks = self._chunks([id_ for id_, _ in candidates])
+            allowed = set(plan.document_ids)
+            hits = [
+                (id_, similarity)
+                for id_, similarity in candidates
+                if id_ in chunks and chunks[id_]["document_id"] in allowed
+            ]
+            if (
+                len(hits) >= limit
+                or len(candidates) < wanted
+                or (threshold is not None and candidates[-1][1] <= threshold)
+            ):
+                return hits[:limit]
+        slots = np.fromiter(
+            (
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT slot FROM chunks c WHERE {DOCUMENT_FILTER_SQL}",
+                    (json.dumps(plan.document_ids),),
+                )
+            ),
+            dtype=np.int64,
+        )
+        return self._search_slots(query, limit, slots)
+
+    def _lexical(
+        self, query_text: str, limit: int, plan: Optional[FilterPlan] = None
+    ) -> List[Dict[str, Any]]:
+        query = _fts_query(query_text)
+        if not query or (plan is not None and not plan.document_ids):
+            return []
+        if plan is None:
+            sql, params = LEXICAL_SEARCH_SQL.format(filter=""), (query, limit)
+        else:
+            sql = LEXICAL_SEARCH_SQL.format(filter=f"AND {DOCUMENT_FILTER_SQL}")
+            params = (query, json.dumps(plan.document_ids), limit)
+        rows = self._conn.execute(sql, params).fetchall()
+        return [{**dict(row), "metadata": json.loads(row["metadata"])} for row in rows]
+
+    def _chunks(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Chunk rows (including their matrix slot) keyed by ID."""
+        chunks = {}
+        for batch in _batches(ids):
+            placeholders = ",".join("?" * len(batch))
+            for row in self._conn.execute(
+                "SELECT id, document_id, chunk_index, content, metadata, slot "
+                "FROM chunks "
+                f"WHERE id IN ({placeholders})",
+                batch,
+            ):
+                chunks[row["id"]] = {
+                    **dict(row),
+                    "metadata": json.loads(row["metadata"]),
+                }
+        return chunks
+
+    @tracing.traced("db.similarity_search", count_rows="rows_read")
+    def similarity_search(
+        self,
+        query_embedding: List[float],
+        threshold: float = 0.7,
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        max_rounds: int = 4,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Perform similarity search on embeddings.
+
+        Scans every row, or with IVF partitioning the ``probes`` nearest
+        lists. ``ef_search`` and ``max_rounds`` only apply to PostgreSQL.
+        ``filters`` restricts the search to matching documents, scanning
+        only their rows when they hold at most ``prefilter_rows`` chunks.
+        """
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        try:
+            with self._lock:
+                query = self._query_vector(query_embedding)
+                if filters:
+                    plan = self._filter_plan(filters)
+                    ranked = self._filtered_search(
+                        query, limit, probes, plan, threshold
+                    )
+                else:
+                    ranked = self._search(query, limit, probes)
+                hits = [
+                    (id_, similarity)
+                    for id_, similarity in ranked
+                    if similarity > threshold
+                ]
+                chunks = self._chunks([id_ for id_, _ in hits])
+            return [
+                {
+                    "id": id_,
+                    "document_id": chunks[id_]["document_id"],
+                    "chunk_index": chunks[id_]["chunk_index"],
+                    "content": chunks[id_]["content"],
+                    "similarity": similarity,
+                    "metadata": chunks[id_]["metadata"],
+                }
+                for id_, similarity in hits
+            ]
+
+        except StoreError as e:
+            console.print(f"[red]Similarity search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.lexical_search", count_rows="rows_read")
+    def lexical_search(
+        self,
+        query_text: str,
+        limit: int = 10,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Full-text (FTS5, BM25-ranked) search over chunk content.
+
+        Rows carry ``lexical_score`` and no ``similarity``. ``filters``
+        restricts the search to matching documents.
+        """
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        try:
+            with self._lock:
+                plan = self._filter_plan(filters) if filters else None
+                rows = self._lexical(query_text, limit, plan)
+            return [{**row, "similarity": None} for row in rows]
+
+        except StoreError as e:
+            console.print(f"[red]Lexical search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.hybrid_search", count_rows="rows_read")
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        rrf_k: int = 60,
+        candidates: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and lexical rankings with reciprocal rank fusion.
+
+        Each side contributes its top ``candidates`` rows (default 4 x limit).
+        Rows carry the fused ``score``, their cosine ``similarity`` and their
+        ``lexical_score`` (None when the text did not match). ``filters``
+        restricts both sides to matching documents.
+        """
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        candidates = candidates or limit * 4
+        try:
+            with self._lock:
+                query = self._query_vector(query_embedding)
+                plan = self._filter_plan(filters) if filters else None
+                if plan is None:
+                    vector = self._search(query, candidates, probes)
+                else:
+                    vector = self._filtered_search(query, candidates, probes, plan)
+                lexical = self._lexical(query_text, candidates, plan)
+
+                scores: Dict[int, float] = {}
+                for rank, (id_, _) in enumerate(vector, 1):
+                    scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank)
+                for rank, row in enumerate(lexical, 1):
+                    scores[row["id"]] = scores.get(row["id"], 0.0) + 1.0 / (
+                        rrf_k + rank
+                    )
+                fused = sorted(scores, key=scores.get, reverse=True)[:limit]
+
+                chunks = self._chunks(fused)
+                lexical_scores = {row["id"]: row["lexical_score"] for row in lexical}
+                return [
+                    {
+                        "id": id_,
+                        "document_id": chunks[id_]["document_id"],
+                        "chunk_index": chunks[id_]["chunk_index"],
+                        "content": chunks[id_]["content"],
+                        "metadata": chunks[id_]["metadata"],
+                        "similarity": float(self._matrix[chunks[id_]["slot"]] @ query),
+                        "lexical_score": lexical_scores.get(id_),
+                        "score": scores[id_],
+                    }
+                    for id_ in fused
+                ]
+
+        except StoreError as e:
+            console.print(f"[red]Hybrid search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.nearest_neighbours", count_rows="rows_read")
+    def nearest_neighbours(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[int]:
+        """Return the IDs of the ``limit`` nearest chunks by cosine distance.
+
+        With ``exact`` the IVF partitioning is bypassed, giving ground truth
+        for recall measurements.
+        """
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        try:
+            with self._lock:
+                query = self._query_vector(query_embedding)
+                return [id_ for id_, _ in self._search(query, limit, probes, exact)]
+
+        except StoreError as e:
+            console.print(f"[red]Nearest neighbour search failed: {e}[/red]")
+            return []
+
+    @tracing.traced("db.get_embeddings", count_rows="rows_read")
+    def get_embeddings(self, ids: List[int]) -> Dict[int, List[float]]:
+        """Return the stored (normalized) embeddings of the chunks ``ids``."""
+        if not ids:
+            return {}
+        if not self._conn:
+            if not self.connect():
+                return {}
+
+        try:
+            with self._lock:
+                chunks = self._chunks(list(ids))
+                slots = [chunk["slot"] for chunk in chunks.values()]
+                vectors = np.asarray(self._matrix[slots]).tolist()
+            return dict(zip(chunks, vectors))
+
+        except StoreError as e:
+            console.print(f"[red]Failed to get embeddings: {e}[/red]")
+            return {}
+
+    def _read_collection(self, name: str) -> Optional[Collection]:
+        """Read collection ``name`` from its store's settings, or None."""
+        if name == self.collection and self._conn:
+            settings = dict(self._conn.execute("SELECT name, value FROM settings"))
+        else:
+            metadata = collection_path(self.root, name) / METADATA_FILE
+            if not metadata.exists():
+                if name != DEFAULT_COLLECTION:
+                    return None
+                settings = {}
+            else:
+                conn = sqlite3.connect(f"file:{metadata}?mode=ro", uri=True)
+                try:
+                    settings = dict(conn.execute("SELECT name, value FROM settings"))
+                finally:
+                    conn.close()
+        created = settings.get("created_at")
+        return Collection(
+            name,
+            # The default store predates the registry and uses the configured model
+            settings.get("model")
+            or os.getenv("EMBEDDING_MODEL", "models/text-embedding-004"),
+            int(settings.get("dimension") or DEFAULT_DIMENSION),
+            settings.get("normalize") == "1",
+            datetime.fromisoformat(created) if created else None,
+        )
+
+    def list_collections(self) -> List[Collection]:
+        """Return the default collection and every store under ``collections/``."""
+        names = [DEFAULT_COLLECTION]
+        collections_dir = self.root / COLLECTIONS_DIR
+        if collections_dir.is_dir():
+            names += sorted(
+                path.name
+                for path in collections_dir.iterdir()
+                if (path / METADATA_FILE).exists()
+            )
+        try:
+            with self._lock:
+                return [
+                    collection
+                    for collection in map(self._read_collection, names)
+                    if collection is not None
+                ]
+        except StoreError as e:
+            console.print(f"[red]Failed to list collections: {e}[/red]")
+            return []
+
+    def get_collection(self, name: Optional[str] = None) -> Optional[Collection]:
+        """Return the collection ``name`` (default: this store's), or None."""
+        try:
+            with self._lock:
+                return self._read_collection(name or self.collection)
+        except StoreError as e:
+            console.print(f"[red]Failed to get collection: {e}[/red]")
+            return None
+
+    def create_collection(self, collection: Collection) -> bool:
+        """Create the store directory of a new collection and record its settings."""
+        path = collection_path(self.root, collection.name)
+        if collection.name == DEFAULT_COLLECTION or path.exists():
+            console.print(f"[red]Collection '{collection.name}' already exists[/red]")
+            return False
+
+        store = LocalVectorStore(str(self.root), collection=collection.name)
+        try:
+            path.mkdir(parents=True)
+            if not store.connect():
+                shutil.rmtree(path, ignore_errors=True)
+                return False
+            with store._transaction() as conn:
+                store._set_setting("model", collection.model)
+                store._set_setting("dimension", collection.dimension)
+                store._set_setting("normalize", int(collection.normalize))
+                store._set_setting("created_at", _now())
+                conn.commit()
+            console.print(
+                f"[green]✓ Created collection '{collection.name}' ({path}, "
+                f"{collection.model}, {collection.dimension} dimensions)[/green]"
+            )
+            return True
+
+        except StoreError as e:
+            console.print(f"[red]Failed to create collection: {e}[/red]")
+            shutil.rmtree(path, ignore_errors=True)
+            return False
+        finally:
+            store.disconnect()
+
+    def drop_collection(self, name: str) -> bool:
+        """Delete a collection's store directory.
+
+        The default collection cannot be dropped.
+        """
+        if name == DEFAULT_COLLECTION:
+            console.print("[red]The default collection cannot be dropped[/red]")
+            return False
+        path = collection_path(self.root, name)
+        if not path.exists():
+            console.print(f"[yellow]No collection named: {name}[/yellow]")
+            return False
+        if name == self.collection:
+            self.disconnect()
+        try:
+            shutil.rmtree(path)
+            console.print(f"[green]Dropped collection: {name}[/green]")
+            return True
+        except OSError as e:
+            console.print(f"[red]Failed to drop collection: {e}[/red]")
+            return False
+
+    @tracing.traced("db.get_corpus_version")
+    def get_corpus_version(self) -> Optional[str]:
+        """Return a fingerprint that changes whenever documents change.
+
+        Document IDs are never reused, so inserts raise the max ID, deletes
+        lower the count and updates bump ``updated_at``. The collection name
+        is included, since chunk IDs are per collection.
+        """
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        try:
+            with self._lock:
+                row = self._conn.execute("""
+                    SELECT COUNT(*) AS documents, COALESCE(MAX(id), 0) AS max_id,
+                           MAX(updated_at) AS updated_at
+                    FROM documents
+                """).fetchone()
+            return (
+                f"{self.collection}:{row['documents']}:{row['max_id']}:"
+                f"{row['updated_at']}"
+            )
+
+        except StoreError as e:
+            console.print(f"[red]Failed to get corpus version: {e}[/red]")
+            return None
+
+    @staticmethod
+    def _document(row: sqlite3.Row) -> Dict[str, Any]:
+        document = dict(row)
+        document["metadata"] = json.loads(document["metadata"])
+        for column in ("created_at", "updated_at"):
+            if document.get(column):
+                document[column] = datetime.fromisoformat(document[column])
+        return document
+
+    @tracing.traced("db.get_documents", count_rows="rows_read")
+    def get_documents(self) -> List[Dict[str, Any]]:
+        """Get all documents with basic statistics."""
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        try:
+            with self._lock:
+                rows = self._conn.execute("""
+                    SELECT d.id, d.title, d.source, d.created_at, d.metadata,
+                           COUNT(c.id) AS chunk_count
+                    FROM documents d
+                    LEFT JOIN chunks c ON c.document_id = d.id
+                    GROUP BY d.id
+                    ORDER BY d.created_at DESC
+                """).fetchall()
+            return [self._document(row) for row in rows]
+
+        except StoreError as e:
+            console.print(f"[red]Failed to get documents: {e}[/red]")
+            return []
+
+    @tracing.traced("db.get_document_by_source")
+    def get_document_by_source(self, source: str) -> Optional[Dict[str, Any]]:
+        """Get a document by its source."""
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT * FROM documents WHERE source = ? ORDER BY id LIMIT 1",
+                    (source,),
+                ).fetchone()
+            return self._document(row) if row else None
+
+        except StoreError as e:
+            console.print(f"[red]Failed to get document: {e}[/red]")
+            return None
+
+    @tracing.traced("db.delete_document_by_source")
+    def delete_document_by_source(self, source: str) -> bool:
+        """Delete a document and its embeddings by source."""
+        if not self._conn:
+            if not self.connect():
+                return False
+
+        try:
+            with self._transaction() as conn:
+                freed = [
+                    row["slot"]
+                    for row in conn.execute(
+                        """
+                        SELECT c.slot FROM chunks c
+                        JOIN documents d ON d.id = c.document_id
+                        WHERE d.source = ?
+                        """,
+                        (source,),
+                    )
+                ]
+                conn.execute(
+                    "DELETE FROM chunks WHERE document_id IN "
+                    "(SELECT id FROM documents WHERE source = ?)",
+                    (source,),
+                )
+                deleted_count = conn.execute(
+                    "DELETE FROM documents WHERE source = ?", (source,)
+                ).rowcount
+                conn.commit()
+                self._free_slots(freed)
+
+            if deleted_count > 0:
+                console.print(f"[green]Deleted document: {source}[/green]")
+                return True
+            else:
+                console.print(
+                    f"[yellow]No document found with source: {source}[/yellow]"
+                )
+                return False
+
+        except StoreError as e:
+            console.print(f"[red]Failed to delete document: {e}[/red]")
+            return False
+
+    # Index management, used by the ``rag-magic index`` and ``bench`` commands
+
+    def _maybe_train(self):
+        """Train IVF lists once the store is large enough; retrain when it doubles."""
+        if self.ivf_min_rows <= 0:
+            return
+        with self._lock:
+            rows = self._live_rows()
+            trained = int(self._setting("ivf_trained_rows") or 0)
+        if recommended_lists(rows) < 2:
+            return
+        if (self._centroids is None and rows >= self.ivf_min_rows) or (
+            self._centroids is not None and rows >= 2 * trained
+        ):
+            console.print(
+                f"[blue]Training IVF partitioning for {rows:,} rows...[/blue]"
+            )
+            self._train_index()
+
+    def _compact(self) -> int:
+        """Move live rows to the front of the matrix, closing gaps left by deletes.
+
+        Returns the number of live rows. The caller commits.
+        """
+        live = np.flatnonzero(self._slot_ids[: self._used] >= 0)
+        count = len(live)
+        if count == self._used:
+            return count
+
+        ids = self._slot_ids[live]
+        # Ascending order never moves a chunk onto a slot still held by another
+        self._conn.executemany(
+            "UPDATE chunks SET slot = ? WHERE id = ?",
+            [(slot, int(id_)) for slot, id_ in enumerate(ids) if live[slot] != slot],
+        )
+        # Destinations never pass their sources, so copying forwards is safe
+        for start in range(0, count, _SCAN_BATCH):
+            sources = live[start : start + _SCAN_BATCH]
+            self._matrix[start : start + len(sources)] = self._matrix[sources]
+            self._lists[start : start + len(sources)] = self._lists[sources]
+            if self._codes is not None:
+                self._codes[start : start + len(sources)] = self._codes[sources]
+        self._slot_ids[:] = -1
+        self._slot_ids[:count] = ids
+        self._used = count
+        self._set_setting("next_slot", count)
+        return count
+
+    def _train_centroids(
+        self, rows: int, lists: int, iterations: int, seed: int = 0
+    ) -> np.ndarray:
+        """Spherical k-means over a sample of the (compacted) matrix."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(rows, max(lists * 64, 10_000))
+        sample = np.asarray(
+            self._matrix[np.sort(rng.choice(rows, sample_size, replace=False))]
+        )
+        centroids = sample[rng.choice(sample_size, lists, replace=False)]
+        for _ in range(iterations):
+            assigned = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assigned, sample)
+            # Re-seed empty lists from random sample rows
+            empty = np.flatnonzero(np.bincount(assigned, minlength=lists) == 0)
+            sums[empty] = sample[rng.choice(sample_size, len(empty))]
+            centroids = _normalize(sums).astype(np.float32)
+        return centroids
+
+    def _quantize(self, mode: str, rows: int):
+        """Rewrite the quantized codes of the first ``rows`` (compacted) rows."""
+        (self.path / CODES_FILE).unlink(missing_ok=True)
+        (self.path / SCALES_FILE).unlink(missing_ok=True)
+        self.quantization = mode
+        self._scales = None
+        self._set_setting("quantization", mode)
+        if mode == "int8" and rows:
+            sample = self._matrix[: min(rows, 100_000)]
+            self._scales = quantization.int8_scales(np.asarray(sample))
+            np.save(self.path / SCALES_FILE, self._scales)
+        self._open_files(self._capacity)
+        if self._codes is None:
+            return
+        for start in range(0, rows, _SCAN_BATCH):
+            end = min(start + _SCAN_BATCH, rows)
+            self._codes[start:end] = self._encode(np.asarray(self._matrix[start:end]))
+
+    def _train_index(
+        self,
+        lists: Optional[int] = None,
+        quantization_mode: Optional[str] = None,
+        iterations: int = 10,
+    ) -> Optional[int]:
+        """Compact the matrix, (re)quantize it and (re)train the IVF partitioning.
+
+        ``lists`` defaults to pgvector's ivfflat guidance for the row count.
+        Fewer than two lists removes the partitioning, so every search scans
+        all rows. ``quantization_mode`` switches the quantized copy of the
+        matrix (None keeps the current mode). Returns the number of lists,
+        or None on failure.
+        """
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        try:
+            if quantization_mode is not None:
+                quantization.check_mode(quantization_mode)
+            with self._transaction():
+                started = time.perf_counter()
+                rows = self._compact()
+                if quantization_mode is not None and self.dimension:
+                    self._quantize(quantization_mode, rows)
+                lists = min(recommended_lists(rows) if lists is None else lists, rows)
+                if lists < 2:
+                    self._centroids = None
+                    (self.path / CENTROIDS_FILE).unlink(missing_ok=True)
+                    lists = 0
+                else:
+                    self._centroids = self._train_centroids(rows, lists, iterations)
+                    for start in range(0, rows, _SCAN_BATCH):
+                        end = min(start + _SCAN_BATCH, rows)
+                        self._lists[start:end] = self._assign_lists(
+                            np.asarray(self._matrix[start:end])
+                        )
+                    np.save(self.path / CENTROIDS_FILE, self._centroids)
+                self._set_setting("ivf_trained_rows", rows)
+                self._commit(rows)
+
+            elapsed = time.perf_counter() - started
+            if quantization_mode is not None:
+                console.print(
+                    f"[green]✓ Quantization: {self.quantization} "
+                    f"({rows:,} rows)[/green]"
+                )
+            if lists:
+                console.print(
+                    f"[green]✓ Trained {lists} IVF lists over {rows:,} rows "
+                    f"in {elapsed:.1f}s[/green]"
+                )
+            else:
+                console.print("[green]✓ Compacted store; no IVF partitioning[/green]")
+            return lists
+
+        except StoreError as e:
+            console.print(f"[red]Failed to build local index: {e}[/red]")
+            return None
+
+    @tracing.traced("db.build_index")
+    def build_index(
+        self, spec: IndexSpec, maintenance_work_mem: Optional[str] = None
+    ) -> Optional[IndexSpec]:
+        """Compact the store, rewrite its quantized codes and retrain its IVF lists.
+
+        Only ivfflat is supported; ``maintenance_work_mem`` does not apply.
+        """
+        if spec.method not in self.index_methods:
+            console.print("[red]The local backend supports --method ivfflat only[/red]")
+            return None
+        lists = self._train_index(spec.lists, spec.quantization)
+        if lists is None:
+            return None
+        spec.lists = lists
+        spec.quantization = self.quantization
+        return spec
+
+    def index_status(self) -> Optional[Dict[str, Any]]:
+        """Row count, quantization, quantized codes and IVF partitioning."""
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        with self._lock:
+            rows = self._live_rows()
+            status = {"rows": rows, "indexes": [], "quantization": self.quantization}
+            if self._codes is not None:
+                status["indexes"].append(
+                    {
+                        "name": "codes",
+                        "method": self.quantization,
+                        "definition": (
+                            f"{self.quantization} codes, re-ranking "
+                            f"{self.rerank_factor}x candidates"
+                        ),
+                        "size_bytes": self._codes.nbytes,
+                    }
+                )
+            if self._centroids is not None:
+                trained = self._setting("ivf_trained_rows")
+                status["indexes"].append(
+                    {
+                        "name": "ivf",
+                        "method": "ivfflat",
+                        "definition": (
+                            f"lists = {len(self._centroids)} "
+                            f"(trained on {int(trained or 0):,} rows)"
+                        ),
+                        "size_bytes": self._centroids.nbytes + self._capacity * 4,
+                    }
+                )
+            return status
+
+    def sample_embeddings(self, count: int) -> List[List[float]]:
+        """Return up to ``count`` randomly chosen stored (normalized) embeddings."""
+        if not self._conn:
+            if not self.connect():
+                return []
+
+        with self._lock:
+            live = np.flatnonzero(self._slot_ids[: self._used] >= 0)
+            if not len(live):
+                return []
+            chosen = np.random.default_rng().choice(
+                live, min(count, len(live)), replace=False
+            )
+            return np.asarray(self._matrix[np.sort(chosen)]).tolist()
+
+    def explain_search(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        force_index: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Describe how a top-k search would run.
+
+        The plan reports the lists probed and ``rows_scanned`` instead of a
+        cost. ``ef_search`` and ``force_index`` do not apply: a trained IVF
+        partitioning always serves the search.
+        """
+        if not self._conn:
+            if not self.connect():
+                return None
+
+        try:
+            with self._lock:
+                rows = self._live_rows()
+                if self._centroids is None or not rows:
+                    plan = {"Node Type": "Exact Scan", "Relation Name": "embeddings"}
+                    index, scanned = None, rows
+                else:
+                    slots, probed = self._probe_slots(
+                        self._query_vector(query_embedding), limit, probes
+                    )
+                    lists = len(self._centroids)
+                    plan = {
+                        "Node Type": f"IVF Scan ({probed} of {lists} lists)",
+                        "Relation Name": "embeddings",
+                        "Index Name": "ivf",
+                    }
+                    index, scanned = "ivf", len(slots)
+                if self._codes is not None:
+                    plan["Node Type"] = f"{self.quantization} {plan['Node Type']}"
+                    plan = {
+                        "Node Type": (
+                            f"Full-precision Re-rank "
+                            f"(top {limit * self.rerank_factor})"
+                        ),
+                        "Plans": [plan],
+                    }
+            return {"plan": plan, "index": index, "rows_scanned": scanned}
+
+        except StoreError as e:
+            console.print(f"[red]Failed to explain search: {e}[/red]")
+            return None
+
+    def storage_bytes(self) -> Optional[int]:
+        """Size of the collection's directory: metadata, matrix, lists and codes."""
+        return sum(
+            path.stat().st_size for path in self.path.rglob("*") if path.is_file()
+        )
+
+    def apply_migrations(self) -> bool:
+        """The local store upgrades its files on open; nothing to migrate."""
+        console.print("[green]✓ The local vector store needs no migrations[/green]")
+        return True
+
+    def partition_embeddings(
+        self,
+        partitions: int,
+        batch_size: int = 10_000,
+        keep_old: bool = False,
+        maintenance_work_mem: Optional[str] = None,
+    ) -> bool:
+        """Not supported: IVF lists already split each collection's store."""
+        console.print(
+            "[red]Partitioning applies to PostgreSQL only; the local store keeps "
+            "each collection in its own directory with IVF lists[/red]"
+        )
+        return False
@@ -1,17 +1,47 @@
 """RAG Magic CLI - A tool for RAG operations with PostgreSQL and vector embeddings."""
 
+import itertools
+import json
+import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
 import typer
 from rich.console import Console
+from rich.live import Live
+from rich.markup import escape
 from rich.panel import Panel
 from rich.table import Table
 
+# Only light modules are imported here. Commands import the embedding, numpy,
+# database and query modules they need, so cheap commands start fast
+# (checked by "rag-magic bench startup").
+from .chunking import (
+    CHUNKING_STRATEGIES,
+    chunking_metadata,
+    get_tokenizer,
+    resolve_strategy,
+)
 from .config import create_sample_env_file, get_config
-from .database import DatabaseConnection, display_documents_table
-from .embeddings import DocumentProcessor
+from .filters import SearchFilter, make_filter
+from .registry import (
+    DEFAULT_DIMENSION,
+    EMBEDDING_MODELS,
+    make_collection,
+    unknown_collection_message,
+)
+from .storage import (
+    SEARCH_MODES,
+    STORAGE_BACKENDS,
+    StorageBackend,
+    display_documents_table,
+    storage_from_env,
+)
+
+if TYPE_CHECKING:
+    from .embeddings import DocumentProcessor
+    from .rerank import RerankOptions
 
 app = typer.Typer(
     name="rag-magic",
@@ -19,9 +49,108 @@ app = typer.Typer(
     add_completion=False,
 )
 
+bench_app = typer.Typer(help="Run offline performance benchmarks")
+app.add_typer(bench_app, name="bench")
+cache_app = typer.Typer(help="Inspect and prune the embedding cache")
+app.add_typer(cache_app, name="cache")
+index_app = typer.Typer(help="Inspect and rebuild the vector search index")
+app.add_typer(index_app, name="index")
+collection_app = typer.Typer(help="Manage collections and their embedding models")
+app.add_typer(collection_app, name="collection")
+
 console = Console()
 
 
+@app.callback()
+def main_options(
+    ctx: typer.Context,
+    profile: bool = typer.Option(
+        False, "--profile", help="Print a per-stage timing breakdown afterwards"
+    ),
+    trace_json: Optional[str] = typer.Option(
+        None,
+        "--trace-json",
+        help="Write spans, counters and histograms to this JSON file",
+    ),
+    metrics_file: Optional[str] = typer.Option(
+        None,
+        "--metrics-file",
+        help="Write counters and histograms to this file (Prometheus text format)",
+    ),
+    otel: bool = typer.Option(
+        False,
+        "--otel",
+        help=(
+            "Export spans over OTLP (needs the 'otel' extra; "
+            "see OTEL_EXPORTER_OTLP_*)"
+        ),
+    ),
+):
+    """Options shared by every command: tracing and profiling."""
+    if not (profile or trace_json or metrics_file or otel):
+        return
+    from . import tracing
+
+    tracing.tracer.enable()
+    root = tracing.tracer.start(f"cli {ctx.invoked_subcommand}")
+
+    def report():
+        tracing.tracer.finish(root)
+        if profile:
+            _print_profile(tracing.tracer)
+        try:
+            if trace_json:
+                tracing.tracer.write_json(trace_json)
+                console.print(f"[green]✓ Wrote trace to {trace_json}[/green]")
+            if metrics_file:
+                tracing.tracer.write_prometheus(metrics_file)
+                console.print(f"[green]✓ Wrote metrics to {metrics_file}[/green]")
+            if otel:
+                exported = tracing.tracer.export_otel()
+                console.print(f"[green]✓ Exported {exported} spans over OTLP[/green]")
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Failed to export the trace: {escape(str(e))}[/red]")
+
+    ctx.call_on_close(report)
+
+
+def _print_profile(tracer):
+    """Print the per-stage breakdown and counters collected by ``tracer``."""
+    rows = tracer.profile()
+    if not rows:
+        console.print("[yellow]No stages were traced[/yellow]")
+        return
+    failures = any(row["errors"] for row in rows)
+    table = Table(title="Profile")
+    table.add_column("Stage", style="cyan", no_wrap=True)
+    table.add_column("Calls", justify="right")
+    if failures:
+        table.add_column("Failed", justify="right", style="red")
+    table.add_column("Total ms", justify="right", style="green")
+    table.add_column("Mean ms", justify="right")
+    table.add_column("Max ms", justify="right", style="yellow")
+    table.add_column("Share", justify="right", style="magenta")
+    for row in rows:
+        table.add_row(
+            "  " * row["depth"] + row["stage"],
+            f"{row['calls']:,}",
+            *([str(row["errors"] or "")] if failures else []),
+            f"{row['total_ms']:,.1f}",
+            f"{row['mean_ms']:,.2f}",
+            f"{row['max_ms']:,.2f}",
+            f"{row['share']:.0%}" if row["share"] is not None else "-",
+        )
+    console.print(table)
+    if tracer.counters:
+        console.print(
+            "[blue]Counters: "
+            + ", ".join(
+                f"{name} {value:,g}" for name, value in sorted(tracer.counters.items())
+            )
+            + "[/blue]"
+        )
+
+
 def is_supported_file(file_path: str) -> bool:
     """Check if file type is supported."""
     path = Path(file_path)
@@ -48,6 +177,42 @@ def get_file_title(file_path: str) -> str:
     return title
 
 
+def _chunk_settings(
+    config, strategy: Optional[str], chunk_size: Optional[int], overlap: Optional[int]
+):
+    """Resolve the chunking strategy and its size and overlap, exiting if invalid.
+
+    Sizes are tokens, except for the "characters" strategy.
+    """
+    strategy = strategy or config.chunking_strategy
+    try:
+        resolve_strategy(strategy)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    if strategy == "characters":
+        defaults = (config.default_chunk_size, config.default_chunk_overlap)
+    else:
+        defaults = (config.default_chunk_tokens, config.default_chunk_overlap_tokens)
+    chunk_size = chunk_size or defaults[0]
+    overlap = defaults[1] if overlap is None else overlap
+    if not 0 <= overlap < chunk_size:
+        console.print("[red]Chunk overlap must be smaller than the chunk size[/red]")
+        raise typer.Exit(1)
+    return strategy, chunk_size, overlap
+
+
+def _collection_processor(db: StorageBackend, use_cache: bool) -> "DocumentProcessor":
+    """Create a processor for the backend's collection, exiting if it is missing."""
+    from .embeddings import DocumentProcessor
+
+    collection = db.get_collection()
+    if collection is None:
+        console.print(f"[red]{unknown_collection_message(db.collection)}[/red]")
+        raise typer.Exit(1)
+    return DocumentProcessor.for_collection(collection, use_cache=use_cache)
+
+
 @app.command()
 def test_connection():
     """Test database connectivity and schema."""
@@ -55,8 +220,11 @@ def test_connection():
     if not config.validate():
         raise typer.Exit(1)
 
-    db = DatabaseConnection.from_env()
-    success = db.test_connection()
+    db = storage_from_env()
+    try:
+        success = db.test_connection()
+    finally:
+        db.disconnect()
 
     if not success:
         console.print("[red]Database connection test failed![/red]")
@@ -69,14 +237,38 @@ def test_connection():
 def ingest(
     file_path: str = typer.Argument(..., help="Path to the file to ingest"),
     chunk_size: Optional[int] = typer.Option(
-        None, "--chunk-size", "-c", help="Chunk size for text splitting"
+        None,
+        "--chunk-size",
+        "-c",
+        help="Chunk size in tokens (characters with --strategy characters)",
     ),
     chunk_overlap: Optional[int] = typer.Option(
-        None, "--chunk-overlap", "-o", help="Overlap between chunks"
+        None, "--chunk-overlap", "-o", help="Overlap between chunks, same unit"
+    ),
+    strategy: Optional[str] = typer.Option(
+        None,
+        "--strategy",
+        "-s",
+        help="Chunking: auto, sentence, markdown, python or characters",
     ),
     force: bool = typer.Option(
         False, "--force", "-f", help="Overwrite existing document"
     ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        "-i",
+        help="Update an existing document, re-embedding only changed chunks",
+    ),
+    page_size: Optional[int] = typer.Option(
+        None, "--page-size", help="Rows per multi-row INSERT statement"
+    ),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Bypass the embedding cache"
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
 ):
     """Ingest a file: chunk it and create embeddings, then store in database."""
     config = get_config()
@@ -96,66 +288,94 @@ def ingest(
         raise typer.Exit(1)
 
     # Use config defaults if not specified
-    chunk_size = chunk_size or config.default_chunk_size
-    chunk_overlap = chunk_overlap or config.default_chunk_overlap
+    strategy, chunk_size, chunk_overlap = _chunk_settings(
+        config, strategy, chunk_size, chunk_overlap
+    )
+    page_size = page_size or config.insert_page_size
 
     # Check if document already exists
-    db = DatabaseConnection.from_env()
+    db = storage_from_env(collection=collection)
     if not db.connect():
         raise typer.Exit(1)
 
     existing_doc = db.get_document_by_source(file_path)
-    if existing_doc and not force:
+    if existing_doc and not (force or incremental):
         console.print(f"[yellow]Document already exists: {file_path}[/yellow]")
-        console.print("Use --force to overwrite")
+        console.print("Use --force to overwrite or --incremental to update changes")
         raise typer.Exit(1)
 
     # Delete existing document if force is used
-    if existing_doc and force:
+    if existing_doc and force and not incremental:
         db.delete_document_by_source(file_path)
 
     # Process file
     try:
-        processor = DocumentProcessor()
-        chunk_embedding_pairs = processor.process_file(
-            file_path, chunk_size, chunk_overlap
-        )
-
-        if not chunk_embedding_pairs:
-            console.print("[yellow]No content to process[/yellow]")
-            raise typer.Exit(1)
-
-        # Extract chunks and embeddings from the pairs
-        chunks = [pair[0] for pair in chunk_embedding_pairs]
-        embeddings = [pair[1] for pair in chunk_embedding_pairs]
+        processor = _collection_processor(db, use_cache=not no_cache)
+
+        if existing_doc and incremental:
+            _ingest_incremental(
+                db,
+                processor,
+                existing_doc,
+                file_path,
+                chunk_size,
+                chunk_overlap,
+                page_size,
+                strategy,
+            )
+            return
 
-        # Store in database
         title = get_file_title(file_path)
-        # Read the content again for metadata (since we need the full content)
-        content = processor.read_file(file_path)
-        metadata = {
-            "chunk_size": chunk_size,
-            "chunk_overlap": chunk_overlap,
-            "total_chunks": len(chunks),
-        }
-
-        document_id = db.insert_document(title, content, file_path, metadata)
+        metadata = chunking_metadata(strategy, chunk_size, chunk_overlap, file_path)
+
+        if Path(file_path).stat().st_size > config.streaming_threshold_bytes:
+            # Large file: stream chunks straight into embedding batches and
+            # INSERT pages without holding the file or all chunks in memory
+            console.print(f"[blue]Streaming large file: {file_path}[/blue]")
+            content = ""
+            metadata["content_stored"] = False
+            pairs = processor.iter_file_embeddings(
+                file_path, chunk_size, chunk_overlap, strategy=strategy
+            )
+            first = next(pairs, None)
+            if first is None:
+                console.print("[yellow]No content to process[/yellow]")
+                raise typer.Exit(1)
+            pairs = itertools.chain([first], pairs)
+        else:
+            # Read once: the same text feeds chunking and the content column
+            content = processor.read_file(file_path)
+            chunks = processor.chunk_text(
+                content, chunk_size, chunk_overlap, strategy, source=file_path
+            )
+            if not chunks:
+                console.print("[yellow]No content to process[/yellow]")
+                raise typer.Exit(1)
+            pairs = zip(chunks, processor.generate_embeddings(chunks))
+
+        chunk_count = 0
+
+        def rows():
+            nonlocal chunk_count
+            for chunk, embedding in pairs:
+                chunk_count += 1
+                yield chunk, embedding, {"chunk_size": len(chunk)}
+
+        # Insert the document and all embeddings in a single transaction
+        document_id = db.insert_document_with_embeddings(
+            title, content, file_path, rows(), metadata, page_size=page_size
+        )
         if not document_id:
             console.print("[red]Failed to insert document[/red]")
             raise typer.Exit(1)
 
-        # Insert embeddings
-        success_count = 0
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            chunk_metadata = {"chunk_size": len(chunk)}
-            if db.insert_embedding(document_id, i, chunk, embedding, chunk_metadata):
-                success_count += 1
-
         console.print(f"[green]✅ Successfully ingested document:[/green]")
         console.print(f"  Document ID: {document_id}")
         console.print(f"  Title: {title}")
-        console.print(f"  Chunks: {success_count}/{len(chunks)}")
+        console.print(f"  Chunks: {chunk_count}")
 
+    except typer.Exit:
+        raise
     except Exception as e:
         console.print(f"[red]Error processing file: {e}[/red]")
         raise typer.Exit(1)
@@ -163,6 +383,182 @@ def ingest(
         db.disconnect()
 
 
+def _ingest_incremental(
+    db: StorageBackend,
+    processor: "DocumentProcessor",
+    document: dict,
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    page_size: int,
+    strategy: str = "characters",
+):
+    """Re-ingest an existing document, embedding only chunks that changed."""
+    from .incremental import diff_chunks
+
+    chunking = chunking_metadata(strategy, chunk_size, chunk_overlap, file_path)
+    previous = (document.get("metadata") or {}).get("tokenizer")
+    if previous and previous != chunking.get("tokenizer", previous):
+        console.print(
+            f"[yellow]⚠ Tokenizer changed from {previous} to "
+            f"{chunking['tokenizer']}; chunk boundaries move, so most chunks "
+            "will be re-embedded[/yellow]"
+        )
+
+    content = processor.read_file(file_path)
+    chunks = processor.chunk_text(
+        content, chunk_size, chunk_overlap, strategy, source=file_path
+    )
+
+    diff = diff_chunks(db.get_chunk_hashes(document["id"]), chunks)
+    console.print(f"[blue]Chunk diff: {diff.summary()}[/blue]")
+    if not diff.has_changes:
+        console.print(f"[green]✅ Document is up to date: {file_path}[/green]")
+        return
+
+    new_texts = [text for _, text in diff.inserted]
+    embeddings = processor.generate_embeddings(new_texts)
+    rows = (
+        (index, text, embedding, {"chunk_size": len(text)})
+        for (index, text), embedding in zip(diff.inserted, embeddings)
+    )
+    metadata = {
+        key: value
+        for key, value in (document.get("metadata") or {}).items()
+        if key != "tokenizer"
+    }
+    metadata.update(chunking, total_chunks=len(chunks))
+
+    if not db.apply_chunk_diff(
+        document["id"], content, metadata, diff.moved, diff.deleted, rows, page_size
+    ):
+        raise typer.Exit(1)
+
+    console.print("[green]✅ Incrementally updated document:[/green]")
+    console.print(f"  Document ID: {document['id']}")
+    console.print(f"  Chunks: {len(chunks)} ({diff.summary()})")
+
+
+@app.command()
+def ingest_dir(
+    directory: str = typer.Argument(..., help="Directory to ingest"),
+    glob: List[str] = typer.Option(
+        ["**/*"], "--glob", "-g", help="Glob pattern(s) relative to the directory"
+    ),
+    workers: int = typer.Option(
+        min(8, os.cpu_count() or 1),
+        "--workers",
+        "-w",
+        help="Worker processes for reading and chunking",
+    ),
+    chunk_size: Optional[int] = typer.Option(
+        None,
+        "--chunk-size",
+        "-c",
+        help="Chunk size in tokens (characters with --strategy characters)",
+    ),
+    chunk_overlap: Optional[int] = typer.Option(
+        None, "--chunk-overlap", "-o", help="Overlap between chunks, same unit"
+    ),
+    strategy: Optional[str] = typer.Option(
+        None,
+        "--strategy",
+        "-s",
+        help="Chunking: auto, sentence, markdown, python or characters",
+    ),
+    force: bool = typer.Option(
+        False, "--force", "-f", help="Overwrite documents that already exist"
+    ),
+    page_size: Optional[int] = typer.Option(
+        None, "--page-size", help="Rows per multi-row INSERT statement"
+    ),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Bypass the embedding cache"
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Ingest every supported file in a directory using a parallel pipeline."""
+    from .ingest_pipeline import discover_files, ingest_files
+
+    config = get_config()
+    if not config.validate():
+        raise typer.Exit(1)
+
+    if not Path(directory).is_dir():
+        console.print(f"[red]Directory not found: {directory}[/red]")
+        raise typer.Exit(1)
+
+    strategy, chunk_size, chunk_overlap = _chunk_settings(
+        config, strategy, chunk_size, chunk_overlap
+    )
+    page_size = page_size or config.insert_page_size
+
+    sources = discover_files(directory, glob, is_supported_file)
+    if not sources:
+        console.print(f"[yellow]No supported files matched in {directory}[/yellow]")
+        raise typer.Exit(0)
+
+    db = storage_from_env(collection=collection)
+    if not db.connect():
+        raise typer.Exit(1)
+
+    try:
+        processor = _collection_processor(db, use_cache=not no_cache)
+        existing = db.get_existing_sources(sources)
+        if existing and force:
+            for source in sorted(existing):
+                db.delete_document_by_source(source)
+        elif existing:
+            console.print(
+                f"[yellow]Skipping {len(existing)} files already ingested "
+                f"(use --force to overwrite)[/yellow]"
+            )
+            sources = [source for source in sources if source not in existing]
+
+        if not sources:
+            console.print("[green]✅ Nothing new to ingest[/green]")
+            return
+
+        console.print(
+            f"[blue]Ingesting {len(sources)} files with {workers} workers...[/blue]"
+        )
+        stats = ingest_files(
+            db,
+            processor,
+            sources,
+            title_for=get_file_title,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            workers=workers,
+            page_size=page_size,
+            strategy=strategy,
+        )
+
+        console.print(f"[green]✅ Ingested {stats.files} files:[/green]")
+        console.print(f"  Chunks: {stats.chunks}")
+        console.print(
+            f"  Throughput: {stats.files_per_second:.1f} files/sec, "
+            f"{stats.chunks_per_second:,.0f} chunks/sec ({stats.elapsed:.1f}s)"
+        )
+        if stats.empty:
+            console.print(f"  [yellow]Empty files skipped: {stats.empty}[/yellow]")
+        if stats.failed:
+            console.print(f"  [red]Failed: {len(stats.failed)}[/red]")
+            for source, error in stats.failed:
+                console.print(f"    [red]{source}: {error}[/red]")
+            raise typer.Exit(1)
+
+    except typer.Exit:
+        raise
+    except Exception as e:
+        console.print(f"[red]Error ingesting directory: {e}[/red]")
+        raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
 @app.command()
 def query(
     question: str = typer.Argument(..., help="Question to ask"),
@@ -175,8 +571,75 @@ def query(
     chat_model: Optional[str] = typer.Option(
         None, "--model", "-m", help="Chat model to use"
     ),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Bypass the query embedding and answer caches"
+    ),
+    ef_search: Optional[int] = typer.Option(
+        None, "--ef-search", help="HNSW candidate list size (higher = better recall)"
+    ),
+    probes: Optional[int] = typer.Option(
+        None, "--probes", help="ivfflat lists to scan (higher = better recall)"
+    ),
+    mode: Optional[str] = typer.Option(
+        None,
+        "--mode",
+        help="Retrieval: vector, hybrid (vector + full-text) or lexical",
+    ),
+    context_tokens: Optional[int] = typer.Option(
+        None,
+        "--context-tokens",
+        min=1,
+        help="Token budget for the answer's context (default: CONTEXT_TOKEN_BUDGET)",
+    ),
+    stream: bool = typer.Option(
+        True, "--stream/--no-stream", help="Show the answer as it is generated"
+    ),
+    json_lines: bool = typer.Option(
+        False,
+        "--json",
+        help="Write results, answer text and timings to stdout as JSON lines",
+    ),
+    source_glob: Optional[str] = typer.Option(
+        None,
+        "--source-glob",
+        help="Only search documents whose source matches this glob (* and ?)",
+    ),
+    doc_ids: Optional[List[int]] = typer.Option(
+        None, "--doc-id", help="Only search this document ID (repeatable)"
+    ),
+    meta: Optional[List[str]] = typer.Option(
+        None,
+        "--meta",
+        help="Only search documents whose metadata has key=value (repeatable)",
+    ),
+    rerank: Optional[str] = typer.Option(
+        None,
+        "--rerank",
+        help="Re-rank results before answering: none, mmr or cross-encoder "
+        "(default: RERANK_METHOD)",
+    ),
+    rerank_top_n: Optional[int] = typer.Option(
+        None,
+        "--rerank-top-n",
+        min=1,
+        help="Chunks kept after re-ranking (default: RERANK_TOP_N)",
+    ),
+    mmr_lambda: Optional[float] = typer.Option(
+        None,
+        "--mmr-lambda",
+        min=0,
+        max=1,
+        help="MMR trade-off: 1 = relevance only, 0 = diversity only",
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
 ):
     """Query the vectorized documents using natural language."""
+    from .query_pipeline import QueryPipeline
+
+    # With --json, stdout carries only JSON lines; status goes to stderr
+    status = Console(stderr=True) if json_lines else console
     config = get_config()
     if not config.validate():
         raise typer.Exit(1)
@@ -185,89 +648,449 @@ def query(
     threshold = threshold or config.default_similarity_threshold
     max_results = max_results or config.default_max_results
     chat_model = chat_model or config.chat_model
+    mode = mode or config.default_search_mode
+    if mode not in SEARCH_MODES:
+        status.print(f"[red]Unknown search mode: {mode}[/red]")
+        raise typer.Exit(1)
+    filters = _search_filter(status, source_glob, doc_ids, meta)
+    rerank_options = _rerank_options(status, config, rerank, rerank_top_n, mmr_lambda)
 
+    pipeline = None
     try:
-        processor = DocumentProcessor()
-        db = DatabaseConnection.from_env()
-
-        if not db.connect():
+        pipeline = QueryPipeline.from_config(
+            config, use_cache=not no_cache, collection=collection
+        )
+        if not pipeline.connect():
             raise typer.Exit(1)
 
-        # Generate embedding for the question
-        console.print("[blue]🔍 Searching for relevant content...[/blue]")
-        question_embedding = processor.generate_single_embedding(question)
+        # Embed the question and search for similar content
+        status.print("[blue]🔍 Searching for relevant content...[/blue]")
+        if filters:
+            status.print(f"[dim]Filter: {filters.describe()}[/dim]")
+        if rerank_options:
+            status.print(f"[dim]Re-ranking: {rerank_options.describe()}[/dim]")
+        result = pipeline.retrieve(
+            question,
+            threshold,
+            max_results,
+            ef_search or config.default_ef_search,
+            probes or config.default_ivfflat_probes,
+            mode,
+            config.rrf_k,
+            filters,
+            rerank_options,
+        )
 
-        # Search for similar content
-        results = db.similarity_search(question_embedding, threshold, max_results)
+        if json_lines:
+            _emit_json(
+                {
+                    "type": "results",
+                    "question": result.question,
+                    "results": [_hit_record(hit) for hit in result.results],
+                }
+            )
 
-        if not results:
-            console.print(
+        if not result.results:
+            status.print(
                 "[yellow]No relevant content found. Try lowering the threshold.[/yellow]"
             )
+            if json_lines:
+                _emit_json(_query_summary(result))
             raise typer.Exit(0)
 
+        if json_lines:
+            if stream:
+                for text in pipeline.stream_answer(result, chat_model, context_tokens):
+                    _emit_json({"type": "token", "text": text})
+            else:
+                pipeline.answer(result, chat_model, context_tokens)
+            _emit_json(_query_summary(result))
+            return
+
         # Display search results
-        console.print(f"[green]Found {len(results)} relevant chunks:[/green]")
+        if result.candidates is not None:
+            status.print(
+                f"[green]Kept {len(result.results)} of {result.candidates} "
+                "relevant chunks after re-ranking:[/green]"
+            )
+        else:
+            status.print(f"[green]Found {len(result.results)} relevant chunks:[/green]")
 
-        context_chunks = []
-        for i, result in enumerate(results, 1):
-            similarity = result["similarity"]
+        for i, hit in enumerate(result.results, 1):
             content = (
-                result["content"][:200] + "..."
-                if len(result["content"]) > 200
-                else result["content"]
+                hit["content"][:200] + "..."
+                if len(hit["content"]) > 200
+                else hit["content"]
             )
 
-            console.print(f"\n[cyan]Result {i} (similarity: {similarity:.3f}):[/cyan]")
-            console.print(f"[dim]{content}[/dim]")
-
-            context_chunks.append(result["content"])
+            status.print(f"\n[cyan]Result {i} ({_format_scores(hit)}):[/cyan]")
+            status.print(f"[dim]{content}[/dim]")
 
         # Generate answer using Google Gemini
-        console.print(f"\n[blue]🤖 Generating answer using {chat_model}...[/blue]")
-
-        context = "\n\n".join(context_chunks)
-        prompt = f"""Based on the following context, please answer the question.
+        status.print(f"\n[blue]🤖 Generating answer using {chat_model}...[/blue]")
+        if stream and status.is_terminal:
+            # Redraw the answer panel as text arrives
+            text = ""
+            with Live(
+                _answer_panel(text), console=status, refresh_per_second=12
+            ) as live:
+                for delta in pipeline.stream_answer(result, chat_model, context_tokens):
+                    text += delta
+                    live.update(_answer_panel(text))
+                live.update(_answer_panel(result.answer, result.cache_hits))
+        else:
+            pipeline.answer(result, chat_model, context_tokens)
+            status.print(_answer_panel(result.answer, result.cache_hits))
+        if result.context:
+            status.print(f"[dim]Context: {result.context.summary()}[/dim]")
+        status.print(f"[dim]Latency: {result.format_timings()}[/dim]")
+
+    except typer.Exit:
+        raise
+    except Exception as e:
+        status.print(f"[red]Error during query: {e}[/red]")
+        raise typer.Exit(1)
+    finally:
+        if pipeline:
+            pipeline.close()
 
-Context:
-{context}
 
-Question: {question}
+def _search_filter(
+    status: Console,
+    source_glob: Optional[str],
+    doc_ids: Optional[List[int]],
+    meta: Optional[List[str]],
+) -> Optional[SearchFilter]:
+    """Build the search filter from CLI options, exiting if they are invalid."""
+    try:
+        return make_filter(source_glob, doc_ids, meta)
+    except ValueError as e:
+        status.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
 
-Answer:"""
 
-        from langchain_google_genai import ChatGoogleGenerativeAI
+def _rerank_options(
+    status: Console,
+    config,
+    method: Optional[str],
+    top_n: Optional[int],
+    mmr_lambda: Optional[float],
+) -> "RerankOptions":
+    """Build re-rank options from CLI options and config, exiting if invalid."""
+    from .rerank import RerankOptions
 
-        chat = ChatGoogleGenerativeAI(
-            model=chat_model,
-            google_api_key=config.gemini_api_key,
-            temperature=0.7,
-            max_output_tokens=500,
+    try:
+        return RerankOptions(
+            method or config.rerank_method,
+            top_n or config.rerank_top_n,
+            config.mmr_lambda if mmr_lambda is None else mmr_lambda,
         )
+    except ValueError as e:
+        status.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+
+def _hit_record(hit: dict) -> dict:
+    """A search hit for JSON output, without its chunk metadata."""
+    return {key: value for key, value in hit.items() if key != "metadata"}
+
+
+def _answer_panel(text: str, cache_hits: Optional[List[str]] = None) -> Panel:
+    title = "🤖 Answer (cached)" if "generate" in (cache_hits or []) else "🤖 Answer"
+    return Panel(text, title=title, border_style="green")
+
+
+def _emit_json(event: dict):
+    """Write one JSON-lines event to stdout."""
+    sys.stdout.write(json.dumps(event, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def _query_summary(result) -> dict:
+    """The final JSON-lines event of a query: answer, cache hits and timings."""
+    return {
+        "type": "done",
+        "answer": result.answer,
+        "cached": result.cache_hits,
+        "timings_ms": result.timings_ms(),
+        "first_token_ms": (
+            None if result.first_token is None else round(result.first_token * 1000, 2)
+        ),
+        "context_tokens": result.context.tokens if result.context else None,
+        "candidates": result.candidates,
+    }
+
+
+def _format_scores(hit: dict) -> str:
+    """Describe a search hit's scores for the mode that produced it."""
+    scores = []
+    if hit.get("score") is not None:
+        scores.append(f"rrf: {hit['score']:.4f}")
+    if hit.get("similarity") is not None:
+        scores.append(f"similarity: {hit['similarity']:.3f}")
+    if hit.get("lexical_score") is not None:
+        scores.append(f"text rank: {hit['lexical_score']:.3f}")
+    if hit.get("rerank_score") is not None:
+        scores.append(f"re-rank: {hit['rerank_score']:.3f}")
+    return ", ".join(scores)
+
+
+@app.command("query-batch")
+def query_batch(
+    questions_file: str = typer.Argument(
+        ..., help='JSON lines of {"question": ...} (other fields are copied through)'
+    ),
+    output: Optional[str] = typer.Option(
+        None, "--output", "-o", help="Write JSON-lines results here (default: stdout)"
+    ),
+    threshold: Optional[float] = typer.Option(
+        None, "--threshold", "-t", help="Similarity threshold"
+    ),
+    max_results: Optional[int] = typer.Option(
+        None, "--max-results", "-n", help="Maximum results per question"
+    ),
+    chat_model: Optional[str] = typer.Option(
+        None, "--model", "-m", help="Chat model to use"
+    ),
+    concurrency: int = typer.Option(
+        8, "--concurrency", "-c", min=1, help="Searches and answers in flight at once"
+    ),
+    no_generate: bool = typer.Option(
+        False, "--no-generate", help="Only retrieve chunks; skip the chat model"
+    ),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Bypass the query embedding and answer caches"
+    ),
+    ef_search: Optional[int] = typer.Option(
+        None, "--ef-search", help="HNSW candidate list size (higher = better recall)"
+    ),
+    probes: Optional[int] = typer.Option(
+        None, "--probes", help="ivfflat lists to scan (higher = better recall)"
+    ),
+    mode: Optional[str] = typer.Option(
+        None,
+        "--mode",
+        help="Retrieval: vector, hybrid (vector + full-text) or lexical",
+    ),
+    context_tokens: Optional[int] = typer.Option(
+        None,
+        "--context-tokens",
+        min=1,
+        help="Token budget for each answer's context (default: CONTEXT_TOKEN_BUDGET)",
+    ),
+    source_glob: Optional[str] = typer.Option(
+        None,
+        "--source-glob",
+        help="Only search documents whose source matches this glob (* and ?)",
+    ),
+    doc_ids: Optional[List[int]] = typer.Option(
+        None, "--doc-id", help="Only search this document ID (repeatable)"
+    ),
+    meta: Optional[List[str]] = typer.Option(
+        None,
+        "--meta",
+        help="Only search documents whose metadata has key=value (repeatable)",
+    ),
+    rerank: Optional[str] = typer.Option(
+        None,
+        "--rerank",
+        help="Re-rank results before answering: none, mmr or cross-encoder "
+        "(default: RERANK_METHOD)",
+    ),
+    rerank_top_n: Optional[int] = typer.Option(
+        None,
+        "--rerank-top-n",
+        min=1,
+        help="Chunks kept after re-ranking (default: RERANK_TOP_N)",
+    ),
+    mmr_lambda: Optional[float] = typer.Option(
+        None,
+        "--mmr-lambda",
+        min=0,
+        max=1,
+        help="MMR trade-off: 1 = relevance only, 0 = diversity only",
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Answer a file of questions concurrently, writing JSON-lines results.
+
+    Questions are embedded in batched calls, searched over the connection pool
+    and answered up to --concurrency at a time.
+    """
+    import asyncio
+    import time
+
+    from .query_pipeline import LatencyStats, QueryPipeline
 
-        response = chat.invoke(prompt)
-        answer = response.content
+    # With results on stdout, status goes to stderr
+    status = console if output else Console(stderr=True)
+    config = get_config()
+    if not config.validate():
+        raise typer.Exit(1)
+    mode = mode or config.default_search_mode
+    if mode not in SEARCH_MODES:
+        status.print(f"[red]Unknown search mode: {mode}[/red]")
+        raise typer.Exit(1)
+    filters = _search_filter(status, source_glob, doc_ids, meta)
+    rerank_options = _rerank_options(status, config, rerank, rerank_top_n, mmr_lambda)
+
+    try:
+        with open(questions_file, encoding="utf-8") as f:
+            inputs = [json.loads(line) for line in f if line.strip()]
+        questions = [
+            item["question"] if isinstance(item, dict) else str(item) for item in inputs
+        ]
+    except (OSError, ValueError, KeyError) as e:
+        status.print(f"[red]Could not read questions from {questions_file}: {e}[/red]")
+        raise typer.Exit(1)
+    if not questions:
+        status.print(f"[yellow]No questions in {questions_file}[/yellow]")
+        raise typer.Exit(0)
 
-        # Display answer in a panel
-        console.print(Panel(answer, title="🤖 Answer", border_style="green"))
+    pipeline = None
+    out = None
+    try:
+        pipeline = QueryPipeline.from_config(
+            config, use_cache=not no_cache, collection=collection
+        )
+        if not pipeline.connect():
+            raise typer.Exit(1)
+        out = open(output, "w", encoding="utf-8") if output else sys.stdout
+        latency = LatencyStats(window=len(questions))
+        failed = 0
+
+        def write_result(index: int, result):
+            nonlocal failed
+            record = {
+                "index": index,
+                "question": result.question,
+                "answer": result.answer,
+                "error": result.error,
+                "results": [_hit_record(hit) for hit in result.results],
+                "candidates": result.candidates,
+                "cached": result.cache_hits,
+                "timings_ms": result.timings_ms(),
+                "context_tokens": result.context.tokens if result.context else None,
+            }
+            if isinstance(inputs[index], dict):
+                extra = {k: v for k, v in inputs[index].items() if k != "question"}
+                if extra:
+                    record["input"] = extra
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            latency.record(result)
+            failed += result.error is not None
+
+        status.print(
+            f"[blue]🔍 Answering {len(questions)} questions "
+            f"({concurrency} at a time)...[/blue]"
+        )
+        started = time.perf_counter()
+        asyncio.run(
+            pipeline.aquery_many(
+                questions,
+                config.default_similarity_threshold if threshold is None else threshold,
+                max_results or config.default_max_results,
+                chat_model or config.chat_model,
+                not no_generate,
+                ef_search or config.default_ef_search,
+                probes or config.default_ivfflat_probes,
+                mode,
+                config.rrf_k,
+                context_tokens,
+                concurrency,
+                on_result=write_result,
+                filters=filters,
+                rerank=rerank_options,
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+        stats = latency.summary()["stages"]
+        table = Table(title="Per-question latency (ms)")
+        for column in ("Stage", "Mean", "p50", "p95", "Max"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        for stage, values in stats.items():
+            table.add_row(
+                stage,
+                *(
+                    f"{values[key]:,.0f}"
+                    for key in ("mean_ms", "p50_ms", "p95_ms", "max_ms")
+                ),
+            )
+        status.print(table)
+        sequential = stats["total"]["mean_ms"] * stats["total"]["count"] / 1000
+        status.print(
+            f"[green]✓ Answered {len(questions)} questions in {elapsed:.2f}s "
+            f"(sum of per-question latency {sequential:.2f}s)[/green]"
+        )
+        if failed:
+            status.print(f'[red]{failed} questions failed; see their "error"[/red]')
+            raise typer.Exit(1)
 
+    except typer.Exit:
+        raise
     except Exception as e:
-        console.print(f"[red]Error during query: {e}[/red]")
+        status.print(f"[red]Error during batch query: {e}[/red]")
         raise typer.Exit(1)
     finally:
-        if "db" in locals():
-            db.disconnect()
+        if out is not None and out is not sys.stdout:
+            out.close()
+        if pipeline:
+            pipeline.close()
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Interface to bind"),
+    port: int = typer.Option(8000, "--port", "-p", help="Port to listen on"),
+):
+    """Run a query server that keeps model clients and the DB pool warm."""
+    config = get_config()
+    if not config.validate():
+        raise typer.Exit(1)
+
+    from .query_pipeline import QueryPipeline
+
+    try:
+        import uvicorn
+
+        from .server import create_app
+    except ImportError:
+        console.print(
+            "[red]The query server needs the 'server' extra: "
+            "pip install 'rag-magic[server]'[/red]"
+        )
+        raise typer.Exit(1)
+
+    try:
+        pipeline = QueryPipeline.from_config(config)
+    except Exception as e:
+        console.print(f"[red]Failed to initialize query pipeline: {e}[/red]")
+        raise typer.Exit(1)
+
+    console.print(
+        f"[blue]🚀 Serving queries on http://{host}:{port} "
+        "(POST /query, GET /stats, GET /health)[/blue]"
+    )
+    uvicorn.run(create_app(pipeline, config), host=host, port=port)
 
 
 @app.command()
-def list_documents():
-    """List all vectorized documents in the database."""
+def list_documents(
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """List all vectorized documents in the collection."""
     config = get_config()
     if not config.validate():
         raise typer.Exit(1)
 
     try:
-        db = DatabaseConnection.from_env()
+        db = storage_from_env(collection=collection)
         if not db.connect():
             raise typer.Exit(1)
 
@@ -291,6 +1114,9 @@ def list_documents():
 @app.command()
 def delete(
     source: str = typer.Argument(..., help="Source path of the document to delete"),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
 ):
     """Delete a document and its embeddings from the database."""
     config = get_config()
@@ -298,7 +1124,7 @@ def delete(
         raise typer.Exit(1)
 
     try:
-        db = DatabaseConnection.from_env()
+        db = storage_from_env(collection=collection)
         if not db.connect():
             raise typer.Exit(1)
 
@@ -329,6 +1155,19 @@ def delete(
             db.disconnect()
 
 
+@app.command()
+def migrate():
+    """Apply pending schema migrations to an existing database."""
+    db = storage_from_env()
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        if not db.apply_migrations():
+            raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
 @app.command()
 def config():
     """Display current configuration."""
@@ -347,6 +1186,1000 @@ def init():
         console.print("4. Ingest a document: rag-magic ingest path/to/file.txt")
 
 
+def _open_caches_or_exit():
+    """Open the configured embedding and query caches, exiting if both are disabled."""
+    from .cache import open_cache, open_query_cache
+
+    config = get_config()
+    cache = open_cache(config)
+    query_cache = open_query_cache(config)
+    if cache is None and query_cache is None:
+        console.print("[yellow]Embedding and query caches are disabled[/yellow]")
+        raise typer.Exit(0)
+    return cache, query_cache
+
+
+@cache_app.command("stats")
+def cache_stats():
+    """Show cache sizes and hit/miss counters."""
+    cache, query_cache = _open_caches_or_exit()
+
+    if cache:
+        stats = cache.stats()
+        cache.close()
+        console.print(f"[blue]Embedding cache: {stats['path']}[/blue]")
+        console.print(f"  Entries: {stats['entries']:,} / {stats['max_entries']:,}")
+        console.print(f"  Size on disk: {stats['size_bytes'] / 1024 / 1024:.1f} MB")
+        console.print(
+            f"  Hits: {stats['hits']:,}  Misses: {stats['misses']:,}  "
+            f"Hit rate: {stats['hit_rate']:.1%}"
+        )
+        if stats["models"]:
+            table = Table(title="Cached Embeddings by Model")
+            table.add_column("Model", style="magenta")
+            table.add_column("Entries", style="blue", justify="right")
+            for model, count in stats["models"].items():
+                table.add_row(model, f"{count:,}")
+            console.print(table)
+
+    if query_cache:
+        stats = query_cache.stats()
+        query_cache.close()
+        console.print(
+            f"[blue]Query cache (TTL {stats['ttl_seconds'] / 3600:g}h, "
+            f"answer distance <= {stats['max_distance']}):[/blue]"
+        )
+        for label, layer in (
+            ("Question embeddings", stats["embeddings"]),
+            ("Answers", stats["answers"]),
+        ):
+            console.print(
+                f"  {label}: {layer['entries']:,} / {stats['max_entries']:,} entries, "
+                f"hits {layer['hits']:,}, misses {layer['misses']:,}, "
+                f"hit rate {layer['hit_rate']:.1%}"
+            )
+
+
+@cache_app.command("prune")
+def cache_prune(
+    max_entries: Optional[int] = typer.Option(
+        None, "--max-entries", help="Keep only the N most recently used entries"
+    ),
+    older_than_days: Optional[float] = typer.Option(
+        None, "--older-than-days", help="Remove entries unused for this many days"
+    ),
+    model: Optional[str] = typer.Option(
+        None, "--model", help="Remove all chunk embeddings for this model key"
+    ),
+):
+    """Evict cache entries by size, age or model."""
+    if max_entries is None and older_than_days is None and model is None:
+        console.print(
+            "[red]Specify --max-entries, --older-than-days and/or --model[/red]"
+        )
+        raise typer.Exit(1)
+
+    cache, query_cache = _open_caches_or_exit()
+    removed = 0
+    if cache:
+        removed += cache.prune(max_entries, older_than_days, model)
+        cache.close()
+    if query_cache:
+        removed += query_cache.prune(max_entries, older_than_days)
+        query_cache.close()
+    console.print(f"[green]✓ Removed {removed:,} cache entries[/green]")
+
+
+@cache_app.command("clear")
+def cache_clear():
+    """Remove every entry from the embedding and query caches."""
+    if not typer.confirm("Clear the embedding and query caches?"):
+        console.print("Cancelled.")
+        raise typer.Exit(0)
+
+    cache, query_cache = _open_caches_or_exit()
+    removed = 0
+    if query_cache:
+        removed += query_cache.clear()
+        query_cache.close()
+    if cache:
+        removed += cache.clear()
+        cache.close()
+    console.print(f"[green]✓ Cleared {removed:,} cache entries[/green]")
+
+
+@bench_app.command("embeddings")
+def bench_embeddings(
+    texts: int = typer.Option(2000, "--texts", help="Number of synthetic texts"),
+    batch_size: int = typer.Option(100, "--batch-size", help="Texts per request"),
+    concurrency: List[int] = typer.Option(
+        [1, 2, 4, 8], "--concurrency", help="Concurrency levels to compare"
+    ),
+    latency: float = typer.Option(
+        0.05, "--latency", help="Simulated seconds per embedding request"
+    ),
+    failure_rate: float = typer.Option(
+        0.0, "--failure-rate", help="Fraction of requests failing with a 429"
+    ),
+    requests_per_second: Optional[float] = typer.Option(
+        None, "--rps", help="Rate limit in requests/sec (default: unlimited)"
+    ),
+):
+    """Benchmark the embedding engine against the offline fake embedder."""
+    from .benchmarks import benchmark_embedding_engine
+
+    results = benchmark_embedding_engine(
+        num_texts=texts,
+        batch_size=batch_size,
+        concurrency_levels=concurrency,
+        latency=latency,
+        failure_rate=failure_rate,
+        requests_per_second=requests_per_second,
+    )
+
+    table = Table(title=f"Embedding Engine ({texts} texts, batch size {batch_size})")
+    table.add_column("Concurrency", justify="right", style="cyan")
+    table.add_column("Batches", justify="right")
+    table.add_column("Retries", justify="right", style="yellow")
+    table.add_column("Elapsed (s)", justify="right")
+    table.add_column("Chunks/sec", justify="right", style="green")
+    for row in results:
+        table.add_row(
+            str(row["concurrency"]),
+            str(row["batches"]),
+            str(row["retries"]),
+            f"{row['elapsed']:.2f}",
+            f"{row['texts_per_second']:,.0f}",
+        )
+    console.print(table)
+
+
+@bench_app.command("recall")
+def bench_recall(
+    queries: int = typer.Option(50, "--queries", help="Stored embeddings to query"),
+    k: int = typer.Option(10, "--k", help="Neighbours per query (recall@k)"),
+    ef_search: List[int] = typer.Option(
+        [10, 20, 40, 80, 160], "--ef-search", help="HNSW ef_search values to compare"
+    ),
+    probes: List[int] = typer.Option(
+        [1, 2, 4, 8, 16, 32], "--probes", help="ivfflat probes values to compare"
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Benchmark ANN recall and latency against exact search on the live index."""
+    from .benchmarks import benchmark_ann_recall
+    from .indexing import get_index_status, sample_embeddings
+
+    db = storage_from_env(collection=collection)
+    if not db.connect():
+        raise typer.Exit(1)
+
+    try:
+        status = get_index_status(db)
+        if status is None:
+            raise typer.Exit(1)
+        methods = {index["method"] for index in status["indexes"]}
+        if not methods:
+            console.print(
+                "[yellow]No vector index found; "
+                "run 'rag-magic index build' first[/yellow]"
+            )
+            raise typer.Exit(1)
+
+        samples = sample_embeddings(db, queries)
+        if not samples:
+            console.print("[yellow]No embeddings to query[/yellow]")
+            raise typer.Exit(1)
+
+        settings = []
+        if "hnsw" in methods:
+            settings += [{"ef_search": value} for value in ef_search]
+        if "ivfflat" in methods:
+            settings += [{"probes": value} for value in probes]
+
+        console.print(
+            f"[blue]Querying {len(samples)} stored embeddings against "
+            f"{status['rows']:,} rows ({', '.join(sorted(methods))})...[/blue]"
+        )
+        results = benchmark_ann_recall(db, samples, settings, k)
+    finally:
+        db.disconnect()
+
+    table = Table(title=f"ANN Recall@{k} vs Latency")
+    table.add_column("Setting", style="cyan")
+    table.add_column("Recall", justify="right", style="green")
+    table.add_column("Mean (ms)", justify="right")
+    table.add_column("p50 (ms)", justify="right")
+    table.add_column("p95 (ms)", justify="right", style="yellow")
+    for row in results:
+        table.add_row(
+            row["setting"],
+            f"{row['recall']:.3f}",
+            f"{row['mean_ms']:.2f}",
+            f"{row['p50_ms']:.2f}",
+            f"{row['p95_ms']:.2f}",
+        )
+    console.print(table)
+
+
+@bench_app.command("quantization")
+def bench_quantization(
+    sample: int = typer.Option(
+        10_000, "--sample", help="Stored embeddings to search over"
+    ),
+    queries: int = typer.Option(50, "--queries", help="Stored embeddings to query"),
+    k: int = typer.Option(10, "--k", help="Neighbours per query (recall@k)"),
+    mode: Optional[List[str]] = typer.Option(
+        None, "--mode", help="Quantization modes to compare (default: all)"
+    ),
+    indexes: bool = typer.Option(
+        False,
+        "--indexes",
+        help="PostgreSQL: also build a temporary HNSW index per mode",
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Compare memory, index size, recall@k and latency of each quantization mode."""
+    from .benchmarks import benchmark_quantization, benchmark_quantized_indexes
+    from .indexing import get_index_status, sample_embeddings
+    from .quantization import (
+        POSTGRES_QUANTIZATION_MODES,
+        QUANTIZATION_MODES,
+        check_mode,
+    )
+
+    mode = mode or list(QUANTIZATION_MODES)
+    try:
+        for name in mode:
+            check_mode(name)
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+    db = storage_from_env(collection=collection)
+    if not db.connect():
+        raise typer.Exit(1)
+
+    index_results = []
+    try:
+        status = get_index_status(db)
+        corpus = sample_embeddings(db, sample)
+        if status is None or not corpus:
+            console.print("[yellow]No embeddings to benchmark[/yellow]")
+            raise typer.Exit(1)
+        query_vectors = corpus[:queries]
+
+        console.print(
+            f"[blue]Searching {len(corpus):,} sampled embeddings with "
+            f"{len(query_vectors)} queries...[/blue]"
+        )
+        results = benchmark_quantization(
+            corpus, query_vectors, mode, k, db.rerank_factor, status["rows"]
+        )
+        if indexes and db.backend == "postgres":
+            index_modes = [name for name in mode if name in POSTGRES_QUANTIZATION_MODES]
+            console.print(
+                f"[blue]Building temporary HNSW indexes over {status['rows']:,} "
+                f"rows ({', '.join(index_modes)})...[/blue]"
+            )
+            index_results = benchmark_quantized_indexes(
+                db, query_vectors, index_modes, k
+            )
+        elif indexes:
+            console.print(
+                "[yellow]--indexes needs the postgres backend; the local store "
+                "scans the codes measured above[/yellow]"
+            )
+    finally:
+        db.disconnect()
+
+    table = Table(
+        title=f"Quantization: Recall@{k}, Memory and Latency ({status['rows']:,} rows)"
+    )
+    table.add_column("Mode", style="cyan")
+    table.add_column("Bytes/vec", justify="right")
+    table.add_column("Memory", justify="right", style="blue")
+    table.add_column("Raw recall", justify="right")
+    table.add_column("Recall", justify="right", style="green")
+    table.add_column("Mean (ms)", justify="right")
+    table.add_column("p95 (ms)", justify="right", style="yellow")
+    for row in results:
+        table.add_row(
+            row["mode"],
+            str(row["bytes_per_vector"]),
+            f"{row['memory_bytes'] / 1024 / 1024:.1f} MB",
+            f"{row['raw_recall']:.3f}",
+            f"{row['recall']:.3f}",
+            f"{row['mean_ms']:.2f}",
+            f"{row['p95_ms']:.2f}",
+        )
+    console.print(table)
+
+    if index_results:
+        table = Table(title=f"Quantized HNSW Indexes: Recall@{k} and Latency")
+        table.add_column("Mode", style="cyan")
+        table.add_column("Index size", justify="right", style="blue")
+        table.add_column("Build (s)", justify="right")
+        table.add_column("Recall", justify="right", style="green")
+        table.add_column("Mean (ms)", justify="right")
+        table.add_column("p95 (ms)", justify="right", style="yellow")
+        for row in index_results:
+            table.add_row(
+                row["mode"],
+                f"{row['index_bytes'] / 1024 / 1024:.1f} MB",
+                f"{row['build_seconds']:.1f}",
+                f"{row['recall']:.3f}",
+                f"{row['mean_ms']:.2f}",
+                f"{row['p95_ms']:.2f}",
+            )
+        console.print(table)
+
+
+@bench_app.command("chunking")
+def bench_chunking(
+    directory: str = typer.Argument(..., help="Corpus directory, e.g. word_puzzles"),
+    glob: List[str] = typer.Option(
+        ["**/*"], "--glob", "-g", help="Glob pattern(s) relative to the directory"
+    ),
+    strategy: List[str] = typer.Option(
+        list(CHUNKING_STRATEGIES), "--strategy", "-s", help="Strategies to compare"
+    ),
+    chunk_size: Optional[int] = typer.Option(
+        None, "--chunk-size", help="Token budget (default: DEFAULT_CHUNK_TOKENS)"
+    ),
+    chunk_overlap: Optional[int] = typer.Option(
+        None,
+        "--chunk-overlap",
+        help="Overlap in tokens (default: DEFAULT_CHUNK_OVERLAP_TOKENS)",
+    ),
+    queries_file: Optional[str] = typer.Option(
+        None,
+        "--queries",
+        help=(
+            'JSON lines of {"question": ..., "answer": ...} '
+            "(default: sampled sentences)"
+        ),
+    ),
+    per_document: int = typer.Option(
+        5, "--per-document", help="Sentences sampled per document as queries"
+    ),
+    k: int = typer.Option(3, "--k", help="Chunks retrieved per query"),
+    no_cache: bool = typer.Option(
+        False, "--no-cache", help="Bypass the embedding cache"
+    ),
+):
+    """Compare chunk counts, tokens per chunk and retrieval hit rate per strategy.
+
+    Character windows use DEFAULT_CHUNK_SIZE/DEFAULT_CHUNK_OVERLAP.
+    """
+    from .benchmarks import benchmark_chunking, sentence_queries
+    from .embeddings import DocumentProcessor, read_text_file
+    from .ingest_pipeline import discover_files
+
+    config = get_config()
+    if not config.validate():
+        raise typer.Exit(1)
+    for name in strategy:
+        try:
+            resolve_strategy(name)
+        except ValueError as e:
+            console.print(f"[red]{e}[/red]")
+            raise typer.Exit(1)
+
+    sources = discover_files(directory, glob, is_supported_file)
+    if not sources:
+        console.print(f"[red]No supported files found in {directory}[/red]")
+        raise typer.Exit(1)
+    documents = {source: read_text_file(source)[0] for source in sources}
+
+    if queries_file:
+        with open(queries_file, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = sentence_queries(documents, per_document)
+
+    tokens = (
+        chunk_size or config.default_chunk_tokens,
+        config.default_chunk_overlap_tokens if chunk_overlap is None else chunk_overlap,
+    )
+    settings = {
+        name: (
+            (config.default_chunk_size, config.default_chunk_overlap)
+            if name == "characters"
+            else tokens
+        )
+        for name in strategy
+    }
+    tokenizer = get_tokenizer(config.tokenizer)
+    processor = DocumentProcessor(model=config.embedding_model, use_cache=not no_cache)
+    console.print(
+        f"[blue]Chunking {len(documents)} documents, {len(queries)} queries, "
+        f"tokenizer {tokenizer.name}...[/blue]"
+    )
+    try:
+        results = benchmark_chunking(
+            documents,
+            settings,
+            lambda texts: processor.generate_embeddings(texts, show_progress=False),
+            queries,
+            tokenizer,
+            k,
+        )
+    except Exception as e:
+        console.print(f"[red]Chunking benchmark failed: {e}[/red]")
+        raise typer.Exit(1)
+
+    table = Table(
+        title=f"Chunking Strategies ({tokens[0]} tokens, overlap {tokens[1]}; "
+        f"characters {config.default_chunk_size}/{config.default_chunk_overlap})"
+    )
+    table.add_column("Strategy", style="cyan")
+    table.add_column("Chunks", justify="right", style="blue")
+    table.add_column("Tokens", justify="right")
+    table.add_column("Tokens/chunk", justify="right", style="magenta")
+    table.add_column("Min-Max", justify="right")
+    table.add_column("Over budget", justify="right")
+    table.add_column(f"Hit rate@{k}", justify="right", style="green")
+    for row in results:
+        table.add_row(
+            row["strategy"],
+            str(row["chunks"]),
+            f"{row['tokens']:,}",
+            f"{row['mean_tokens']:.0f} ± {row['stdev_tokens']:.0f}",
+            f"{row['min_tokens']}-{row['max_tokens']}",
+            "-" if row["over_budget"] is None else str(row["over_budget"]),
+            f"{row['hit_rate']:.2f}",
+        )
+    console.print(table)
+
+
+@bench_app.command("startup")
+def bench_startup(
+    runs: int = typer.Option(
+        3, "--runs", min=1, help="Runs per command (best is kept)"
+    ),
+    scale: float = typer.Option(
+        1.0, "--scale", help="Multiply every budget, e.g. 2 on slow machines"
+    ),
+):
+    """Check each command's import time and lazily loaded modules against a budget.
+
+    Commands run for real with their output discarded; they only read.
+    Exits with status 1 if any command is over budget.
+    """
+    from .benchmarks import benchmark_startup
+
+    console.print("[blue]Measuring CLI import time with python -X importtime...[/blue]")
+    results = benchmark_startup(runs=runs, scale=scale)
+
+    table = Table(title=f"CLI startup (best of {runs})")
+    table.add_column("Command")
+    table.add_column("Imports (ms)", justify="right")
+    table.add_column("Budget (ms)", justify="right")
+    table.add_column("Heavy modules loaded")
+    table.add_column("")
+    for row in results:
+        table.add_row(
+            row["command"],
+            f"{row['import_ms']:.1f}",
+            f"{row['budget_ms']:.0f}",
+            ", ".join(row["loaded"]) or "-",
+            "[green]✓[/green]" if row["ok"] else "[red]✗[/red]",
+        )
+    console.print(table)
+
+    failed = [row["command"] for row in results if not row["ok"]]
+    if failed:
+        console.print(f"[red]Over budget: {', '.join(failed)}[/red]")
+        raise typer.Exit(1)
+    console.print("[green]✓ All commands within their startup budget[/green]")
+
+
+def _format_metric(value: float) -> str:
+    """Counts and byte sizes as whole numbers, rates and latencies to 3 places."""
+    return f"{value:,.0f}" if abs(value) >= 1000 else f"{value:.3f}"
+
+
+@bench_app.command("suite")
+def bench_suite(
+    documents: int = typer.Option(
+        2000, "--documents", min=1, help="Synthetic documents to ingest"
+    ),
+    words: int = typer.Option(300, "--words", min=1, help="Words per document"),
+    queries: int = typer.Option(
+        200, "--queries", min=1, help="Synthetic questions to search with"
+    ),
+    k: int = typer.Option(10, "--k", min=1, help="Results per search (recall@k)"),
+    dimension: int = typer.Option(
+        256, "--dimension", min=8, help="Fake embedding dimension"
+    ),
+    seed: int = typer.Option(0, "--seed", help="Seed for the synthetic corpus"),
+    storage: str = typer.Option(
+        "local",
+        "--storage",
+        help="local (temporary store) or postgres (temporary bench_suite collection)",
+    ),
+    puzzles: Optional[str] = typer.Option(
+        None,
+        "--puzzles",
+        help="word_puzzles directory for the labelled set (default: the checkout's)",
+    ),
+    history: Optional[str] = typer.Option(
+        None,
+        "--history",
+        help=(
+            "JSON lines history file "
+            "(default: ~/.cache/rag_magic/bench_history.jsonl)"
+        ),
+    ),
+    no_history: bool = typer.Option(
+        False, "--no-history", help="Do not record this run in the history"
+    ),
+    max_regression: Optional[float] = typer.Option(
+        None,
+        "--max-regression",
+        min=0,
+        help="Exit with status 1 if a tracked metric got worse by more than "
+        "this fraction since the last comparable run, e.g. 0.2",
+    ),
+):
+    """Benchmark ingest, search latency, recall and memory end to end, offline.
+
+    A deterministic synthetic corpus and the word_puzzles files are embedded
+    with the fake embedder into a throwaway store. Each run is appended to
+    the history file and compared with the last run of the same parameters.
+    """
+    from .benchmarks import (
+        DEFAULT_HISTORY_PATH,
+        DEFAULT_PUZZLES_DIR,
+        append_history,
+        compare_runs,
+        puzzle_set,
+        read_history,
+        run_metadata,
+        run_suite,
+        suite_store,
+        synthetic_corpus,
+        synthetic_questions,
+    )
+
+    if storage not in STORAGE_BACKENDS:
+        console.print(
+            f"[red]Unknown storage backend: {storage} "
+            f"(use {' or '.join(STORAGE_BACKENDS)})[/red]"
+        )
+        raise typer.Exit(1)
+
+    puzzle_dir = Path(puzzles) if puzzles else DEFAULT_PUZZLES_DIR
+    labelled = None
+    if puzzle_dir.is_dir():
+        labelled = puzzle_set(str(puzzle_dir))
+    if not labelled or not labelled[1]:
+        console.print(
+            f"[yellow]No puzzle files in {puzzle_dir}; skipping the labelled "
+            "set[/yellow]"
+        )
+        labelled = None
+
+    parameters = {
+        "documents": documents,
+        "words": words,
+        "queries": queries,
+        "k": k,
+        "dimension": dimension,
+        "seed": seed,
+        "storage": storage,
+        "puzzles": len(labelled[1]) if labelled else 0,
+    }
+    corpus = synthetic_corpus(documents, words, seed)
+    questions = synthetic_questions(corpus, queries, seed=seed)
+    try:
+        with suite_store(storage, dimension) as db:
+            metrics = run_suite(db, corpus, questions, labelled, k, dimension)
+    except Exception as e:
+        console.print(f"[red]Benchmark suite failed: {e}[/red]")
+        raise typer.Exit(1)
+    record = {**run_metadata(), "parameters": parameters, **metrics}
+
+    ingest = metrics["ingest"]
+    table = Table(title=f"Ingest ({ingest['documents']:,} documents)")
+    table.add_column("Chunks", justify="right", style="blue")
+    table.add_column("Chunk (s)", justify="right")
+    table.add_column("Embed (s)", justify="right")
+    table.add_column("Write (s)", justify="right")
+    table.add_column("Docs/sec", justify="right", style="green")
+    table.add_column("Chunks/sec", justify="right", style="green")
+    table.add_row(
+        f"{ingest['chunks']:,}",
+        f"{ingest['chunk_seconds']:.2f}",
+        f"{ingest['embed_seconds']:.2f}",
+        f"{ingest['write_seconds']:.2f}",
+        f"{ingest['documents_per_second']:,.0f}",
+        f"{ingest['chunks_per_second']:,.0f}",
+    )
+    console.print(table)
+
+    index = metrics["index"]
+    table = Table(title=f"Search Latency ({queries} questions, k={k})")
+    table.add_column("Mode", style="cyan")
+    table.add_column("Mean (ms)", justify="right")
+    table.add_column("p50 (ms)", justify="right")
+    table.add_column("p95 (ms)", justify="right", style="yellow")
+    table.add_column("p99 (ms)", justify="right", style="red")
+    for mode, row in metrics["search"].items():
+        table.add_row(
+            mode,
+            f"{row['mean_ms']:.2f}",
+            f"{row['p50_ms']:.2f}",
+            f"{row['p95_ms']:.2f}",
+            f"{row['p99_ms']:.2f}",
+        )
+    console.print(table)
+    console.print(
+        f"[blue]{index['method']} index built in {index['seconds']:.2f}s; "
+        f"recall@{k} vs exact search: {index['recall']:.3f} "
+        f"(p95 {index['p95_ms']:.2f} ms vs {index['exact_p95_ms']:.2f} ms exact)[/blue]"
+    )
+
+    if metrics["puzzles"]:
+        table = Table(title=f"Word Puzzles ({parameters['puzzles']} labelled queries)")
+        table.add_column("Mode", style="cyan")
+        table.add_column(f"Hit rate@{k}", justify="right", style="green")
+        table.add_column("MRR", justify="right")
+        for mode, row in metrics["puzzles"].items():
+            table.add_row(mode, f"{row['hit_rate']:.2f}", f"{row['mrr']:.3f}")
+        console.print(table)
+
+    memory = metrics["memory"]
+    if memory["peak_rss_bytes"] is not None:
+        console.print(
+            "[blue]Peak memory: "
+            f"{memory['peak_rss_bytes'] / 1024 / 1024:,.1f} MB[/blue]"
+        )
+    if memory["store_bytes"] is not None:
+        console.print(
+            f"[blue]Store size: {memory['store_bytes'] / 1024 / 1024:,.1f} MB[/blue]"
+        )
+
+    history = history or DEFAULT_HISTORY_PATH
+    previous = [
+        run for run in read_history(history) if run.get("parameters") == parameters
+    ]
+    regressions = []
+    if previous:
+        last = previous[-1]
+        table = Table(
+            title=f"Change since {last.get('timestamp')} "
+            f"(version {last.get('version')}, commit {last.get('commit') or '-'})"
+        )
+        table.add_column("Metric", style="cyan")
+        table.add_column("Previous", justify="right")
+        table.add_column("Current", justify="right")
+        table.add_column("Change (+ is better)", justify="right")
+        for row in compare_runs(record, last):
+            change = row["change"]
+            regressed = max_regression is not None and change < -max_regression
+            if regressed:
+                regressions.append(row["metric"])
+            style = "red" if change < 0 else "green"
+            table.add_row(
+                row["metric"],
+                _format_metric(row["previous"]),
+                _format_metric(row["current"]),
+                f"[{style}]{change:+.1%}[/{style}]",
+            )
+        console.print(table)
+    else:
+        console.print("[dim]No earlier run with these parameters to compare[/dim]")
+
+    if not no_history:
+        append_history(history, record)
+        console.print(f"[green]✓ Recorded this run in {history}[/green]")
+    if regressions:
+        console.print(
+            f"[red]Regressed by more than {max_regression:.0%}: "
+            f"{', '.join(regressions)}[/red]"
+        )
+        raise typer.Exit(1)
+
+
+@index_app.command("status")
+def index_status(
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Show the vector indexes, row count and recommended ivfflat lists."""
+    from .indexing import get_index_status, recommended_lists, recommended_probes
+
+    db = storage_from_env(collection=collection)
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        status = get_index_status(db)
+    finally:
+        db.disconnect()
+    if status is None:
+        raise typer.Exit(1)
+
+    lists = recommended_lists(status["rows"])
+    console.print(f"[blue]Embeddings ({db.collection}): {status['rows']:,} rows[/blue]")
+    console.print(f"  Quantization: {status['quantization']}")
+    if status.get("partitions"):
+        console.print(
+            f"  Partitions: {len(status['partitions'])} (hash on document_id, "
+            "one index each)"
+        )
+    console.print(
+        f"  Recommended ivfflat lists: {lists} (probes ≈ {recommended_probes(lists)})"
+    )
+    if not status["indexes"]:
+        console.print("[yellow]No vector index: searches scan every row[/yellow]")
+        return
+
+    table = Table(title="Vector Indexes")
+    table.add_column("Name", style="cyan")
+    table.add_column("Method", style="magenta")
+    table.add_column("Size", justify="right", style="blue")
+    table.add_column("Definition", style="dim")
+    for index in status["indexes"]:
+        table.add_row(
+            index["name"],
+            index["method"],
+            f"{index['size_bytes'] / 1024 / 1024:.1f} MB",
+            index["definition"],
+        )
+    console.print(table)
+
+
+@index_app.command("explain")
+def index_explain(
+    k: int = typer.Option(10, "--k", help="Top-k to plan for"),
+    ef_search: Optional[int] = typer.Option(None, "--ef-search", help="HNSW ef_search"),
+    probes: Optional[int] = typer.Option(None, "--probes", help="ivfflat probes"),
+    force_index: bool = typer.Option(
+        False, "--force-index", help="Disable sequential scans while planning"
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Check with EXPLAIN that similarity search is served by the ANN index."""
+    from .indexing import explain_search, format_plan, sample_embeddings
+
+    db = storage_from_env(collection=collection)
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        # A stored embedding gives realistic costs; any vector works for planning
+        samples = sample_embeddings(db, 1)
+        dimension = db.dimension or DEFAULT_DIMENSION
+        embedding = samples[0] if samples else [1.0] + [0.0] * (dimension - 1)
+        result = explain_search(db, embedding, k, ef_search, probes, force_index)
+    finally:
+        db.disconnect()
+    if result is None:
+        raise typer.Exit(1)
+
+    console.print("[blue]Top-k similarity search plan:[/blue]")
+    for line in format_plan(result["plan"]):
+        console.print(f"  {line}")
+    if "rows_scanned" in result:
+        console.print(f"  Rows scanned: {result['rows_scanned']:,}")
+    else:
+        console.print(f"  Estimated cost: {result['total_cost']}")
+
+    if result["index"]:
+        console.print(f"[green]✓ Served by ANN index {result['index']}[/green]")
+    elif "rows_scanned" in result:
+        console.print(
+            "[yellow]Exact search: the local store has no IVF partitioning yet "
+            "(see LOCAL_IVF_MIN_ROWS or 'rag-magic index build --method ivfflat')"
+            "[/yellow]"
+        )
+    else:
+        console.print("[red]✗ Sequential scan: the ANN index is not used[/red]")
+        if not force_index:
+            console.print(
+                "[yellow]On small tables the planner may prefer a scan; "
+                "re-run with --force-index to confirm the index is usable[/yellow]"
+            )
+        raise typer.Exit(1)
+
+
+@index_app.command("build")
+def index_build(
+    method: Optional[str] = typer.Option(
+        None,
+        "--method",
+        help="Index type: hnsw or ivfflat (default: hnsw; ivfflat for the local store)",
+    ),
+    m: int = typer.Option(16, "--m", help="HNSW: connections per node"),
+    ef_construction: int = typer.Option(
+        64, "--ef-construction", help="HNSW: candidate list size while building"
+    ),
+    lists: Optional[int] = typer.Option(
+        None, "--lists", help="ivfflat: number of lists (default: from row count)"
+    ),
+    maintenance_work_mem: Optional[str] = typer.Option(
+        None, "--maintenance-work-mem", help="Memory for the build, e.g. 1GB"
+    ),
+    quantization: Optional[str] = typer.Option(
+        None,
+        "--quantization",
+        help="none, halfvec, int8 (local only) or binary (default: keep current)",
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Drop and rebuild the embedding index as HNSW or ivfflat.
+
+    With --quantization the index (and the local store's codes) switch to
+    that mode; full-precision vectors are kept for re-ranking.
+    """
+    from .indexing import IndexSpec, build_index
+
+    db = storage_from_env(collection=collection)
+    method = method or db.index_methods[0]
+    try:
+        spec = IndexSpec(
+            method,
+            m=m,
+            ef_construction=ef_construction,
+            lists=lists,
+            quantization=quantization,
+        )
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        console.print(f"[blue]🔧 Building {method} index...[/blue]")
+        if not build_index(db, spec, maintenance_work_mem):
+            raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
+@index_app.command("partition")
+def index_partition(
+    partitions: int = typer.Option(
+        ..., "--partitions", "-p", min=2, help="Number of hash partitions"
+    ),
+    batch_size: int = typer.Option(
+        10_000, "--batch-size", min=1, help="Rows copied per transaction"
+    ),
+    keep_old: bool = typer.Option(
+        False, "--keep-old", help="Keep the previous table as <table>_old"
+    ),
+    maintenance_work_mem: Optional[str] = typer.Option(
+        None, "--maintenance-work-mem", help="Memory for the index builds, e.g. 1GB"
+    ),
+    collection: Optional[str] = typer.Option(
+        None, "--collection", help="Collection to use (default: RAG_COLLECTION)"
+    ),
+):
+    """Hash-partition the embeddings table on document_id, online.
+
+    Rows are copied in batches while searches and ingestion continue, every
+    partition gets its own ANN index, and the tables are swapped at the end.
+    """
+    db = storage_from_env(collection=collection)
+    try:
+        console.print(
+            f"[blue]🔧 Partitioning {db.collection} embeddings into "
+            f"{partitions} partitions...[/blue]"
+        )
+        if not db.partition_embeddings(
+            partitions, batch_size, keep_old, maintenance_work_mem
+        ):
+            raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
+@collection_app.command("create")
+def collection_create(
+    name: str = typer.Argument(..., help="Collection name (lower-case identifier)"),
+    model: Optional[str] = typer.Option(
+        None, "--model", "-m", help="Embedding model (default: EMBEDDING_MODEL)"
+    ),
+    dimension: Optional[int] = typer.Option(
+        None,
+        "--dimension",
+        "-d",
+        help="Embedding dimension (default: the model's; smaller truncates)",
+    ),
+    normalize: Optional[bool] = typer.Option(
+        None,
+        "--normalize/--no-normalize",
+        help="L2-normalize embeddings (default: only when truncated)",
+    ),
+):
+    """Create a collection with its own embedding model, dimension and index."""
+    config = get_config()
+    try:
+        spec = make_collection(
+            name, model or config.embedding_model, dimension, normalize
+        )
+    except ValueError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+
+    db = storage_from_env()
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        if not db.create_collection(spec):
+            raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
+@collection_app.command("list")
+def collection_list():
+    """List collections with their embedding model and dimension."""
+    db = storage_from_env()
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        collections = db.list_collections()
+    finally:
+        db.disconnect()
+
+    table = Table(title="Collections")
+    table.add_column("Name", style="cyan")
+    table.add_column("Model", style="magenta")
+    table.add_column("Dimension", justify="right", style="blue")
+    table.add_column("Normalize", style="green")
+    table.add_column("Created", style="dim")
+    for spec in collections:
+        native = EMBEDDING_MODELS.get(spec.model)
+        dimension = str(spec.dimension)
+        if spec.truncated:
+            dimension += f" / {native.dimension}"
+        table.add_row(
+            spec.name,
+            spec.model,
+            dimension,
+            "yes" if spec.normalize else "no",
+            str(spec.created_at or "")[:19],
+        )
+    console.print(table)
+
+
+@collection_app.command("drop")
+def collection_drop(
+    name: str = typer.Argument(..., help="Collection to delete"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="Skip the confirmation"),
+):
+    """Delete a collection with all of its documents and embeddings."""
+    db = storage_from_env()
+    if not db.connect():
+        raise typer.Exit(1)
+    try:
+        if db.get_collection(name) is None:
+            console.print(f"[yellow]No collection named {name}[/yellow]")
+            raise typer.Exit(0)
+        console.print(
+            f"[yellow]Delete collection {name} and all of its documents?[/yellow]"
+        )
+        if not yes and not typer.confirm("Are you sure?"):
+            console.print("Deletion cancelled.")
+            raise typer.Exit(0)
+        if not db.drop_collection(name):
+            raise typer.Exit(1)
+    finally:
+        db.disconnect()
+
+
 def main():
     """Main entry point for the CLI."""
     try:
@@ -0,0 +1,169 @@
+"""Schema migrations for existing RAG Magic databases.
+
+New databases get the full schema from ``postgres/init/01-init-rag-schema.sql``.
+Databases created from an older init script are brought up to date by
+applying these migrations in order. Every migration is idempotent, so
+running one against a database that already has the change is harmless.
+Applied versions are recorded in ``rag.schema_migrations``.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional
+
+import psycopg2
+from rich.console import Console
+
+if TYPE_CHECKING:
+    from .database import DatabaseConnection
+
+console = Console()
+
+
+@dataclass(frozen=True)
+class Migration:
+    """One forward-only schema change."""
+
+    version: int
+    name: str
+    sql: str
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "index_friendly_similarity_search",
+        """
+        CREATE OR REPLACE FUNCTION rag.similarity_search(
+            query_embedding vector(768),
+            similarity_threshold float DEFAULT 0.7,
+            match_count int DEFAULT 10
+        )
+        RETURNS TABLE (
+            id int,
+            document_id int,
+            content text,
+            similarity float,
+            metadata jsonb
+        ) AS $$
+        BEGIN
+            RETURN QUERY
+            SELECT top_k.id, top_k.document_id, top_k.content,
+                   1 - top_k.distance, top_k.metadata
+            FROM (
+                SELECT
+                    e.id,
+                    e.document_id,
+                    e.content,
+                    e.metadata,
+                    e.embedding <=> query_embedding AS distance
+                FROM rag.embeddings e
+                ORDER BY e.embedding <=> query_embedding
+                LIMIT match_count
+            ) AS top_k
+            WHERE 1 - top_k.distance > similarity_threshold
+            ORDER BY top_k.distance;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ),
+    Migration(
+        2,
+        "content_tsvector",
+        """
+        ALTER TABLE rag.embeddings
+            ADD COLUMN IF NOT EXISTS content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+        CREATE INDEX IF NOT EXISTS embeddings_content_tsv_idx
+            ON rag.embeddings USING gin (content_tsv);
+        """,
+    ),
+    Migration(
+        3,
+        "collections",
+        """
+        CREATE TABLE IF NOT EXISTS rag.collections (
+            name TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            dimension INTEGER NOT NULL,
+            normalize BOOLEAN NOT NULL DEFAULT false,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO rag.collections (name, model, dimension)
+            VALUES ('default', 'models/text-embedding-004', 768)
+            ON CONFLICT (name) DO NOTHING;
+        ALTER TABLE rag.documents
+            ADD COLUMN IF NOT EXISTS collection TEXT NOT NULL DEFAULT 'default'
+            REFERENCES rag.collections(name) ON DELETE CASCADE;
+        CREATE INDEX IF NOT EXISTS documents_collection_source_idx
+            ON rag.documents(collection, source);
+        """,
+    ),
+    Migration(
+        4,
+        "document_filter_indexes",
+        """
+        CREATE INDEX IF NOT EXISTS documents_collection_source_pattern_idx
+            ON rag.documents(collection, source varchar_pattern_ops);
+        CREATE INDEX IF NOT EXISTS documents_metadata_idx
+            ON rag.documents USING gin (metadata jsonb_path_ops);
+        """,
+    ),
+]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rag.schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def pending_migrations(db: "DatabaseConnection") -> Optional[List[Migration]]:
+    """Return migrations not yet applied, or None if the check failed."""
+    try:
+        with db.connection() as conn, conn.cursor() as cursor:
+            _ensure_migrations_table(cursor)
+            cursor.execute("SELECT version FROM rag.schema_migrations")
+            applied = {row["version"] for row in cursor.fetchall()}
+            conn.commit()
+        return [m for m in MIGRATIONS if m.version not in applied]
+
+    except psycopg2.Error as e:
+        console.print(f"[red]Failed to check migrations: {e}[/red]")
+        return None
+
+
+def apply_migrations(db: "DatabaseConnection") -> bool:
+    """Apply pending migrations in order, each in its own transaction."""
+    pending = pending_migrations(db)
+    if pending is None:
+        return False
+    if not pending:
+        console.print("[green]✓ Schema is up to date[/green]")
+        return True
+
+    for migration in pending:
+        try:
+            with db.connection() as conn, conn.cursor() as cursor:
+                # Migrations may rewrite large tables
+                cursor.execute("SELECT set_config('statement_timeout', '0', true)")
+                cursor.execute(migration.sql)
+                cursor.execute(
+                    "INSERT INTO rag.schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name),
+                )
+                conn.commit()
+            console.print(
+                f"[green]✓ Applied migration {migration.version}: "
+                f"{migration.name}[/green]"
+            )
+        except psycopg2.Error as e:
+            console.print(
+                f"[red]Migration {migration.version} ({migration.name}) "
+                f"failed: {e}[/red]"
+            )
+            return False
+    return True
@@ -0,0 +1,439 @@
+"""Hash partitioning of embeddings tables for RAG Magic.
+
+Collections already split the corpus by embedding model and tenant: each
+has its own embeddings table and ANN index (see :mod:`rag_magic.registry`).
+A single large collection can additionally be hash-partitioned on
+``document_id``. Every partition then has its own, smaller ANN index:
+builds need memory for one partition at a time, and searches restricted to
+some documents (see :mod:`rag_magic.filters`) only visit the partitions
+holding them. Unrestricted searches scan each partition's index and merge
+the results.
+
+:func:`partition_embeddings` converts a collection's table while it stays
+in use:
+
+1. A partitioned copy of the table is created, and a trigger on the
+   current table appends the ID of every row written from then on to a
+   change log.
+2. Existing rows are copied in batches, each in its own short transaction.
+3. The ANN, document and full-text indexes are built on the copy.
+4. Rows logged by the trigger are re-copied until few remain.
+5. In one transaction, writes are blocked, the last recorded rows are
+   re-copied and the tables are swapped by renaming.
+
+Searches and ingestion keep working throughout; writes wait only for the
+final step, and reads only for the renames. The same procedure changes the
+partition count of an already partitioned table.
+"""
+
+import re
+import time
+from typing import Optional
+
+import psycopg2
+from rich.console import Console
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn
+
+from .database import DatabaseConnection, create_index_sql
+from .indexing import IndexSpec, recommended_lists
+from .registry import DEFAULT_COLLECTION
+
+console = Console()
+
+DEFAULT_BATCH_ROWS = 10_000
+
+# Re-copy recorded rows before the swap until at most this many are left
+_CATCH_UP_ROWS = 1_000
+_SWAP_ATTEMPTS = 3
+# Give up on a swap rather than queue readers behind a long wait for locks
+_SWAP_LOCK_TIMEOUT = "10s"
+# SQLSTATE of lock_timeout expiring (lock_not_available)
+_LOCK_NOT_AVAILABLE = "55P03"
+
+# Indexes renamed with their table during the swap
+_INDEX_SUFFIXES = ("pkey", "embedding_idx", "document_id_idx", "content_tsv_idx")
+
+# Columns copied between the tables (content_tsv is generated)
+_COLUMNS = "id, document_id, chunk_index, content, embedding, metadata, created_at"
+
+# Formatted with the qualified {table} and unqualified {name} of the new
+# table, the id {sequence} and the vector {dimension}. The primary key must
+# include the partition key.
+PARTITIONED_TABLE_SQL = """
+    CREATE TABLE {table} (
+        id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+        document_id INTEGER NOT NULL REFERENCES rag.documents(id) ON DELETE CASCADE,
+        chunk_index INTEGER DEFAULT 0,
+        content TEXT NOT NULL,
+        embedding vector({dimension}),
+        metadata JSONB DEFAULT '{{}}',
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED,
+        CONSTRAINT {name}_pkey PRIMARY KEY (id, document_id)
+    ) PARTITION BY HASH (document_id);
+"""
+
+# Logs the ID of every row inserted, updated or deleted in {source}. The log
+# is append-only: every write adds an entry, committed with the write, so a
+# sync never consumes the entry of a write it cannot see yet
+CAPTURE_SQL = """
+    CREATE TABLE {changes} (seq BIGSERIAL PRIMARY KEY, id INTEGER NOT NULL);
+    CREATE FUNCTION {function}() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {changes} (id)
+        VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {source}
+        FOR EACH ROW EXECUTE FUNCTION {function}();
+"""
+
+# The view over the default collection is bound to the table, not its name
+DOCUMENT_EMBEDDINGS_VIEW_SQL = """
+    CREATE OR REPLACE VIEW rag.document_embeddings AS
+    SELECT
+        d.id as document_id,
+        d.title,
+        d.source,
+        d.metadata as document_metadata,
+        e.id as embedding_id,
+        e.chunk_index,
+        e.content as chunk_content,
+        e.embedding,
+        e.metadata as chunk_metadata,
+        e.created_at as embedding_created_at
+    FROM rag.documents d
+    LEFT JOIN rag.embeddings e ON d.id = e.document_id
+"""
+
+
+def partition_name(table: str, partitions: int, remainder: int) -> str:
+    """Unqualified name of partition ``remainder`` of ``partitions``."""
+    return f"{table}_h{partitions}_{remainder}"
+
+
+class _Migration:
+    """Names of everything a conversion of one table creates."""
+
+    def __init__(self, table: str, partitions: int):
+        self.table = table
+        self.partitions = partitions
+        self.source = f"rag.{table}"
+        self.new_name = f"{table}_new"
+        self.new = f"rag.{self.new_name}"
+        self.old_name = f"{table}_old"
+        self.changes = f"rag.{table}_partition_changes"
+        self.function = f"rag.{table}_capture_changes"
+        self.trigger = f"{table}_capture_changes"
+
+
+def _current_index_spec(db, cursor) -> Optional[IndexSpec]:
+    """The spec of the collection's ANN index, or None if it has none."""
+    quantization = db.index_quantization(cursor, refresh=True)
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = 'rag' AND indexname = %s",
+        (db.index_name,),
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    definition = row["indexdef"]
+    method = re.search(r"USING (\w+)", definition).group(1)
+    params = {
+        key: int(value)
+        for key, value in re.findall(r"(\w+)='?(\d+)'?", definition.split("WITH")[-1])
+    }
+    return IndexSpec(
+        method,
+        m=params.get("m", 16),
+        ef_construction=params.get("ef_construction", 64),
+        quantization=quantization,
+    )
+
+
+def _sync(cursor, migration: _Migration) -> int:
+    """Re-copy the rows logged since the last sync; returns how many.
+
+    Only the log entries of committed writes are consumed. Entries of
+    writes still in progress become visible when they commit and are
+    consumed by a later sync, which then copies the committed row.
+    """
+    cursor.execute(f"DELETE FROM {migration.changes} RETURNING id")
+    ids = sorted({row["id"] for row in cursor.fetchall()})
+    if ids:
+        cursor.execute(f"DELETE FROM {migration.new} WHERE id = ANY(%s)", (ids,))
+        cursor.execute(
+            f"""
+            INSERT INTO {migration.new} ({_COLUMNS})
+            SELECT {_COLUMNS} FROM {migration.source}
+            WHERE id = ANY(%s) AND document_id IS NOT NULL
+        """,
+            (ids,),
+        )
+    return len(ids)
+
+
+def _drop_capture(cursor, migration: _Migration):
+    cursor.execute(f"DROP TRIGGER IF EXISTS {migration.trigger} ON {migration.source}")
+    cursor.execute(f"DROP FUNCTION IF EXISTS {migration.function}()")
+    cursor.execute(f"DROP TABLE IF EXISTS {migration.changes}")
+
+
+def _abandon(db, migration: _Migration):
+    """Remove the partitioned copy and change capture after a failure."""
+    try:
+        with db.connection() as conn, conn.cursor() as cursor:
+            _drop_capture(cursor, migration)
+            cursor.execute(f"DROP TABLE IF EXISTS {migration.new}")
+            conn.commit()
+    except psycopg2.Error as e:
+        console.print(f"[red]Failed to clean up {migration.new}: {e}[/red]")
+
+
+def _prepare(db, migration: _Migration) -> Optional[IndexSpec]:
+    """Create the partitioned table and start recording changes.
+
+    Returns the ANN index spec to rebuild on it (None if there is no index),
+    or raises ValueError when the conversion cannot start.
+    """
+    with db.connection() as conn, conn.cursor() as cursor:
+        for name in (migration.new_name, migration.old_name):
+            cursor.execute("SELECT to_regclass(%s) AS oid", (f"rag.{name}",))
+            if cursor.fetchone()["oid"]:
+                raise ValueError(
+                    f"rag.{name} exists; drop it (or finish the conversion that "
+                    "created it) first"
+                )
+        if len(db.partitions(cursor)) == migration.partitions:
+            raise ValueError(
+                f"{migration.source} already has {migration.partitions} partitions"
+            )
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id') AS sequence", (migration.source,)
+        )
+        sequence = cursor.fetchone()["sequence"]
+        if not sequence:
+            raise ValueError(f"{migration.source}.id is not backed by a sequence")
+        spec = _current_index_spec(db, cursor)
+
+        cursor.execute(
+            PARTITIONED_TABLE_SQL.format(
+                table=migration.new,
+                name=migration.new_name,
+                sequence=sequence,
+                dimension=db.dimension,
+            )
+        )
+        for remainder in range(migration.partitions):
+            partition = partition_name(migration.table, migration.partitions, remainder)
+            cursor.execute(f"""
+                CREATE TABLE rag.{partition}
+                PARTITION OF {migration.new}
+                FOR VALUES WITH (MODULUS {migration.partitions}, REMAINDER {remainder})
+            """)
+        cursor.execute(
+            CAPTURE_SQL.format(
+                changes=migration.changes,
+                function=migration.function,
+                trigger=migration.trigger,
+                source=migration.source,
+            )
+        )
+        conn.commit()
+    return spec
+
+
+def _copy_rows(db, migration: _Migration, batch_size: int) -> int:
+    """Copy the rows present when capture started, in batches by ID."""
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT min(id) AS first, max(id) AS last FROM {migration.source}"
+        )
+        bounds = cursor.fetchone()
+        conn.commit()
+    if bounds["first"] is None:
+        return 0
+
+    copied = 0
+    progress = Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        console=console,
+    )
+    span = bounds["last"] - bounds["first"] + 1
+    with progress:
+        task = progress.add_task("Copying rows (by ID)", total=span)
+        start = bounds["first"]
+        while start <= bounds["last"]:
+            end = min(start + batch_size, bounds["last"] + 1)
+            with db.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {migration.new} ({_COLUMNS})
+                    SELECT {_COLUMNS} FROM {migration.source}
+                    WHERE id >= %s AND id < %s AND document_id IS NOT NULL
+                """,
+                    (start, end),
+                )
+                copied += cursor.rowcount
+                conn.commit()
+            progress.update(task, advance=end - start)
+            start = end
+    return copied
+
+
+def _build_indexes(
+    db,
+    migration: _Migration,
+    spec: Optional[IndexSpec],
+    rows: int,
+    maintenance_work_mem: Optional[str],
+):
+    """Build the new table's indexes; the ANN index is built per partition."""
+    with db.connection() as conn, conn.cursor() as cursor:
+        if maintenance_work_mem:
+            cursor.execute(
+                "SELECT set_config('maintenance_work_mem', %s, true)",
+                (maintenance_work_mem,),
+            )
+        cursor.execute("SELECT set_config('statement_timeout', '0', true)")
+        name = migration.new_name
+        cursor.execute(
+            f"CREATE INDEX {name}_document_id_idx ON {migration.new}(document_id)"
+        )
+        cursor.execute(
+            f"CREATE INDEX {name}_content_tsv_idx ON {migration.new} "
+            "USING gin (content_tsv)"
+        )
+        if spec is not None:
+            if spec.method == "ivfflat":
+                spec.lists = recommended_lists(rows // migration.partitions)
+            cursor.execute(
+                create_index_sql(
+                    spec, f"{name}_embedding_idx", migration.new, db.dimension
+                )
+            )
+        cursor.execute(f"ANALYZE {migration.new}")
+        conn.commit()
+
+
+def _catch_up(db, migration: _Migration) -> int:
+    """Re-copy recorded rows until few are left; returns how many were copied."""
+    total = 0
+    while True:
+        with db.connection() as conn, conn.cursor() as cursor:
+            synced = _sync(cursor, migration)
+            conn.commit()
+        total += synced
+        if synced <= _CATCH_UP_ROWS:
+            return total
+
+
+def _swap(db, migration: _Migration) -> int:
+    """Block writes, apply the last changes and swap the tables by renaming.
+
+    Returns how many recorded rows were re-copied under the lock.
+    """
+    table = migration.table
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('lock_timeout', %s, true)", (_SWAP_LOCK_TIMEOUT,)
+        )
+        # Readers continue; writers wait until the swap commits
+        cursor.execute(f"LOCK TABLE {migration.source} IN EXCLUSIVE MODE")
+        synced = _sync(cursor, migration)
+        _drop_capture(cursor, migration)
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id') AS sequence", (migration.source,)
+        )
+        sequence = cursor.fetchone()["sequence"]
+
+        cursor.execute(f"ALTER TABLE {migration.source} RENAME TO {migration.old_name}")
+        for suffix in _INDEX_SUFFIXES:
+            cursor.execute(
+                f"ALTER INDEX IF EXISTS rag.{table}_{suffix} "
+                f"RENAME TO {migration.old_name}_{suffix}"
+            )
+        cursor.execute(f"ALTER TABLE {migration.new} RENAME TO {table}")
+        for suffix in _INDEX_SUFFIXES:
+            cursor.execute(
+                f"ALTER INDEX IF EXISTS rag.{migration.new_name}_{suffix} "
+                f"RENAME TO {table}_{suffix}"
+            )
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {migration.source}.id")
+        if db.collection == DEFAULT_COLLECTION:
+            cursor.execute(DOCUMENT_EMBEDDINGS_VIEW_SQL)
+        conn.commit()
+        db.index_quantization(cursor, refresh=True)
+    return synced
+
+
+def partition_embeddings(
+    db: DatabaseConnection,
+    partitions: int,
+    batch_size: int = DEFAULT_BATCH_ROWS,
+    keep_old: bool = False,
+    maintenance_work_mem: Optional[str] = None,
+) -> bool:
+    """Hash-partition the collection's embeddings table on ``document_id``.
+
+    Converts the table online (see the module docstring), rebuilding its
+    ANN index with the same settings on every partition; ivfflat lists are
+    derived from the rows per partition. The old table is dropped, or kept
+    as ``<table>_old`` with ``keep_old``. Rows without a document are not
+    copied. Everything created is removed again if the conversion fails
+    before the swap.
+    """
+    if partitions < 2:
+        console.print("[red]Use at least 2 partitions[/red]")
+        return False
+    if not db.connect():
+        return False
+
+    migration = _Migration(db.table_name, partitions)
+    started = time.perf_counter()
+    try:
+        spec = _prepare(db, migration)
+    except (ValueError, psycopg2.Error) as e:
+        console.print(f"[red]Cannot partition {migration.source}: {e}[/red]")
+        return False
+
+    try:
+        rows = _copy_rows(db, migration, batch_size)
+        console.print(f"[green]✓ Copied {rows:,} rows[/green]")
+        console.print(f"[blue]🔧 Building indexes on {partitions} partitions...[/blue]")
+        _build_indexes(db, migration, spec, rows, maintenance_work_mem)
+        caught_up = _catch_up(db, migration)
+        for attempt in range(1, _SWAP_ATTEMPTS + 1):
+            try:
+                caught_up += _swap(db, migration)
+                break
+            except psycopg2.Error as e:
+                if e.pgcode != _LOCK_NOT_AVAILABLE or attempt == _SWAP_ATTEMPTS:
+                    raise
+                console.print("[yellow]Tables busy; retrying the swap...[/yellow]")
+                caught_up += _catch_up(db, migration)
+    except psycopg2.Error as e:
+        console.print(f"[red]Failed to partition {migration.source}: {e}[/red]")
+        _abandon(db, migration)
+        return False
+
+    console.print(
+        f"[green]✓ Partitioned {migration.source} into {partitions} hash partitions "
+        f"in {time.perf_counter() - started:.1f}s "
+        f"({caught_up:,} rows written meanwhile were re-copied)[/green]"
+    )
+    old = f"rag.{migration.old_name}"
+    if keep_old:
+        console.print(f"[yellow]The previous table is kept as {old}[/yellow]")
+        return True
+    try:
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {old}")
+            conn.commit()
+    except psycopg2.Error as e:
+        console.print(f"[red]Failed to drop {old}; drop it by hand: {e}[/red]")
+    return True
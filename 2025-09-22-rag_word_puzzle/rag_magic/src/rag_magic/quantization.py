@@ -0,0 +1,127 @@
+"""Vector quantization for RAG Magic.
+
+Quantized vectors are smaller and cheaper to scan, at some cost in
+accuracy. Searches use them to pick ``rerank_factor`` x k candidates and
+then re-rank those by exact cosine similarity on the full-precision
+vectors, which are always kept.
+
+Modes:
+
+- ``none``: float32, 4 bytes per dimension.
+- ``halfvec``: float16, 2 bytes per dimension (pgvector ``halfvec``).
+- ``int8``: scalar quantization with a per-dimension scale, 1 byte per
+  dimension. pgvector has no int8 vector type, so this mode is only
+  available with the local storage backend.
+- ``binary``: the sign of each dimension, 1 bit per dimension, compared by
+  Hamming distance (pgvector ``binary_quantize``).
+"""
+
+from typing import Optional
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "halfvec", "int8", "binary")
+POSTGRES_QUANTIZATION_MODES = ("none", "halfvec", "binary")
+
+DEFAULT_RERANK_FACTOR = 4
+
+_CODE_DTYPES = {
+    "none": np.float32,
+    "halfvec": np.float16,
+    "int8": np.int8,
+    "binary": np.uint8,
+}
+
+# Set bits per byte value, for Hamming distance without np.bitwise_count
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# Rows converted to float32 per step while scoring, bounding scratch memory
+_SCORE_BATCH = 65_536
+
+
+def check_mode(mode: str, modes=QUANTIZATION_MODES) -> str:
+    """Return ``mode`` if it is one of ``modes``, else raise ValueError."""
+    if mode not in modes:
+        raise ValueError(f"Unknown quantization mode: {mode} (use {', '.join(modes)})")
+    return mode
+
+
+def code_dtype(mode: str) -> np.dtype:
+    return np.dtype(_CODE_DTYPES[mode])
+
+
+def code_width(mode: str, dimensions: int) -> int:
+    """Number of code elements stored per vector."""
+    return (dimensions + 7) // 8 if mode == "binary" else dimensions
+
+
+def bytes_per_vector(mode: str, dimensions: int) -> int:
+    """Storage for one quantized vector, excluding any per-row overhead."""
+    return code_width(mode, dimensions) * code_dtype(mode).itemsize
+
+
+def int8_scales(sample: np.ndarray) -> np.ndarray:
+    """Per-dimension scales mapping the sample's range onto [-127, 127].
+
+    The 99.9th percentile of each dimension's magnitude is used so a few
+    outliers do not waste the range; larger values are clipped.
+    """
+    scales = np.percentile(np.abs(sample), 99.9, axis=0) / 127
+    return np.where(scales > 0, scales, 1.0).astype(np.float32)
+
+
+def encode(
+    mode: str, vectors: np.ndarray, scales: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Quantize float32 ``vectors`` (one per row) into codes for ``mode``."""
+    if mode == "none":
+        return vectors.astype(np.float32, copy=False)
+    if mode == "halfvec":
+        return vectors.astype(np.float16)
+    if mode == "int8":
+        return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    if mode == "binary":
+        return np.packbits(vectors > 0, axis=-1)
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest finite ``scores``, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return top[np.isfinite(scores[top])]
+
+
+def _hamming(codes: np.ndarray, query_codes: np.ndarray) -> np.ndarray:
+    differing = np.bitwise_xor(codes, query_codes)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(differing).sum(axis=-1, dtype=np.int32)
+    return _POPCOUNT[differing].sum(axis=-1, dtype=np.int32)
+
+
+def scores(
+    mode: str,
+    codes: np.ndarray,
+    query: np.ndarray,
+    scales: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Approximate similarity of each row of ``codes`` to ``query``; higher is closer.
+
+    ``query`` is the normalized float32 query vector. For ``binary`` the
+    score is the negated Hamming distance.
+    """
+    if mode == "binary":
+        return -_hamming(codes, encode("binary", query)).astype(np.float32)
+
+    # De-quantizing int8 is folded into the query: (c * s) . q == c . (s * q)
+    weights = query * scales if mode == "int8" else query
+    if mode == "none":
+        return np.asarray(codes @ weights)
+    result = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), _SCORE_BATCH):
+        batch = np.asarray(codes[start : start + _SCORE_BATCH], dtype=np.float32)
+        result[start : start + len(batch)] = batch @ weights
+    return result
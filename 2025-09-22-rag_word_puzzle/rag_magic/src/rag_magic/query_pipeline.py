@@ -0,0 +1,714 @@
+"""Retrieval and answer generation pipeline for RAG Magic.
+
+A QueryPipeline owns warm clients (embedding engine, database pool and chat
+models) so repeated queries only pay for the model calls themselves. Every
+stage is timed, which lets the CLI and the query server report per-stage
+latency.
+"""
+
+import asyncio
+import re
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from . import tracing
+from .cache import QueryCache, normalize_question, open_query_cache
+from .context import DEFAULT_DEDUP_THRESHOLD, PackedContext, assemble_context
+from .embeddings import DocumentProcessor
+from .filters import SearchFilter
+from .registry import unknown_collection_message
+from .rerank import Reranker, RerankOptions
+from .storage import (
+    SEARCH_MODES,
+    AsyncDatabaseConnection,
+    StorageBackend,
+    storage_from_env,
+)
+
+STAGES = ("embed", "search", "rerank", "generate")
+
+
+def build_prompt(question: str, context_chunks: List[str]) -> str:
+    """Build the answer-generation prompt from retrieved chunks."""
+    context = "\n\n".join(context_chunks)
+    return f"""Based on the following context, please answer the question.
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+
+class ChatClient:
+    """Chat model clients kept warm between queries.
+
+    One client is created per model name on first use and reused afterwards.
+    The "fake" backend answers offline without calling a model, for tests
+    and benchmarks.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        default_model: str = "gemini-1.5-flash",
+        backend: str = "google",
+        temperature: float = 0.7,
+        max_output_tokens: int = 500,
+    ):
+        if backend not in ("google", "fake"):
+            raise ValueError(f"Unknown chat backend: {backend}")
+        self.api_key = api_key
+        self.default_model = default_model
+        self.backend = backend
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+        self._clients: Dict[str, Any] = {}
+
+    @classmethod
+    def from_config(cls, config) -> "ChatClient":
+        """Create a chat client using the model settings from a Config."""
+        return cls(
+            api_key=config.gemini_api_key,
+            default_model=config.chat_model,
+            backend=config.chat_backend,
+        )
+
+    def client(self, model: Optional[str] = None):
+        """Return the (cached) LangChain chat client for ``model``."""
+        model = model or self.default_model
+        if model not in self._clients:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            self._clients[model] = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=self.api_key,
+                temperature=self.temperature,
+                max_output_tokens=self.max_output_tokens,
+            )
+        return self._clients[model]
+
+    @staticmethod
+    def _fake_answer(prompt: str) -> str:
+        return f"(fake answer generated from a {len(prompt)}-character prompt)"
+
+    async def agenerate(self, prompt: str, model: Optional[str] = None) -> str:
+        """Generate an answer for ``prompt``."""
+        if self.backend == "fake":
+            return self._fake_answer(prompt)
+        response = await self.client(model).ainvoke(prompt)
+        return response.content
+
+    def generate(self, prompt: str, model: Optional[str] = None) -> str:
+        """Synchronous variant of :meth:`agenerate`."""
+        if self.backend == "fake":
+            return self._fake_answer(prompt)
+        return self.client(model).invoke(prompt).content
+
+    def stream(self, prompt: str, model: Optional[str] = None) -> Iterator[str]:
+        """Generate an answer for ``prompt``, yielding text as it arrives."""
+        if self.backend == "fake":
+            yield from re.findall(r"\S+\s*", self._fake_answer(prompt))
+            return
+        for chunk in self.client(model).stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+
+@dataclass
+class QueryResult:
+    """Retrieved chunks, the generated answer and per-stage latency (seconds)."""
+
+    question: str
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    answer: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    embedding: Optional[List[float]] = None
+    # Context the answer prompt was built from (None if served from the cache)
+    context: Optional[PackedContext] = None
+    # Stages served from the query cache ("embed" and/or "generate")
+    cache_hits: List[str] = field(default_factory=list)
+    # Seconds from the start of generation to the first streamed text
+    first_token: Optional[float] = None
+    # Why answering failed, for batch runs that carry on past failures
+    error: Optional[str] = None
+    # Chunks the search returned, when a re-ranker then kept some of them
+    candidates: Optional[int] = None
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.timings.values())
+
+    def timings_ms(self) -> Dict[str, float]:
+        """Stage timings in milliseconds, including the total."""
+        timings = {
+            stage: round(seconds * 1000, 2) for stage, seconds in self.timings.items()
+        }
+        timings["total"] = round(self.total_time * 1000, 2)
+        return timings
+
+    def format_timings(self) -> str:
+        """One-line human-readable latency breakdown."""
+        parts = [
+            f"{stage} {ms:.0f} ms" + (" (cached)" if stage in self.cache_hits else "")
+            for stage, ms in self.timings_ms().items()
+        ]
+        if self.first_token is not None:
+            parts.append(f"first token {self.first_token * 1000:.0f} ms")
+        return ", ".join(parts)
+
+
+class LatencyStats:
+    """Rolling per-stage latency samples for the most recent requests."""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self._samples: Dict[str, Deque[float]] = {
+            stage: deque(maxlen=window) for stage in (*STAGES, "total")
+        }
+
+    def record(self, result: QueryResult):
+        self.requests += 1
+        for stage, ms in result.timings_ms().items():
+            self._samples[stage].append(ms)
+
+    def summary(self) -> Dict[str, Any]:
+        stages = {}
+        for stage, samples in self._samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": len(ordered),
+                "mean_ms": round(statistics.fmean(ordered), 2),
+                "p50_ms": round(ordered[len(ordered) // 2], 2),
+                "p95_ms": round(
+                    ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2
+                ),
+                "max_ms": round(ordered[-1], 2),
+            }
+        return {"requests": self.requests, "stages": stages}
+
+
+class QueryPipeline:
+    """Embed a question, search for similar chunks and generate an answer.
+
+    With a QueryCache, repeated questions skip the embedding call and
+    semantically equivalent questions that retrieve the same chunks skip
+    the chat model. Search results are re-ranked as ``rerank`` says unless
+    a query says otherwise (see :mod:`rag_magic.rerank`). The prompt's
+    context is assembled from the retrieved chunks within ``context_tokens``
+    (see :mod:`rag_magic.context`).
+    """
+
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        db: StorageBackend,
+        chat: ChatClient,
+        query_cache: Optional[QueryCache] = None,
+        context_tokens: Optional[int] = None,
+        dedup_threshold: float = DEFAULT_DEDUP_THRESHOLD,
+        rerank: Optional[RerankOptions] = None,
+        reranker: Optional[Reranker] = None,
+    ):
+        self.processor = processor
+        self.db = db
+        self.adb = AsyncDatabaseConnection(db)
+        self.chat = chat
+        self.query_cache = query_cache
+        self.context_tokens = context_tokens
+        self.dedup_threshold = dedup_threshold
+        self.rerank = rerank or RerankOptions()
+        self.reranker = reranker or Reranker()
+
+    @classmethod
+    def from_config(
+        cls, config, use_cache: bool = True, collection: Optional[str] = None
+    ) -> "QueryPipeline":
+        """Create a pipeline with clients built from a Config.
+
+        Questions are embedded with the model and dimension of
+        ``collection`` (default: ``config.collection``). Raises ValueError
+        if the collection does not exist.
+        """
+        db = storage_from_env(config.storage_backend, collection or config.collection)
+        spec = db.get_collection()
+        if spec is None:
+            raise ValueError(unknown_collection_message(db.collection))
+        return cls(
+            DocumentProcessor.for_collection(spec, use_cache=use_cache),
+            db,
+            ChatClient.from_config(config),
+            open_query_cache(config) if use_cache else None,
+            config.context_token_budget,
+            config.context_dedup_threshold,
+            RerankOptions(config.rerank_method, config.rerank_top_n, config.mmr_lambda),
+            Reranker(config.rerank_model),
+        )
+
+    def connect(self) -> bool:
+        """Open the storage backend (the database pool for PostgreSQL)."""
+        return self.db.connect()
+
+    def close(self):
+        """Close the storage backend and the query cache."""
+        self.db.disconnect()
+        if self.query_cache:
+            self.query_cache.close()
+
+    def _answer_model_key(
+        self, model: Optional[str], context_tokens: Optional[int] = None
+    ) -> str:
+        key = f"{self.chat.backend}:{model or self.chat.default_model}"
+        # The same chunks packed into a different budget give a different prompt
+        return f"{key}:context={context_tokens}" if context_tokens else key
+
+    def build_prompt(
+        self, result: QueryResult, context_tokens: Optional[int] = None
+    ) -> str:
+        """Assemble the result's context and build the answer prompt.
+
+        ``context_tokens`` overrides the pipeline's budget for this query.
+        """
+        with tracing.span("query.context") as span:
+            result.context = assemble_context(
+                result.results,
+                context_tokens or self.context_tokens,
+                self.dedup_threshold,
+            )
+            span.set(chunks=len(result.context.texts), tokens=result.context.tokens)
+        tracing.count("context_tokens", result.context.tokens)
+        return build_prompt(result.question, result.context.texts)
+
+    def _cached_answer(
+        self,
+        result: QueryResult,
+        model: Optional[str],
+        corpus_version: Optional[str],
+        context_tokens: Optional[int] = None,
+    ) -> Optional[str]:
+        if not (self.query_cache and corpus_version and result.embedding):
+            return None
+        return self.query_cache.get_answer(
+            self._answer_model_key(model, context_tokens or self.context_tokens),
+            [hit["id"] for hit in result.results],
+            corpus_version,
+            result.embedding,
+        )
+
+    def _store_answer(
+        self,
+        result: QueryResult,
+        model: Optional[str],
+        corpus_version: Optional[str],
+        context_tokens: Optional[int] = None,
+    ):
+        if not (self.query_cache and corpus_version and result.embedding):
+            return
+        # Answers generated against an older version of this collection can
+        # never match again; other collections' answers are left alone
+        self.query_cache.invalidate(self.db.collection, corpus_version)
+        self.query_cache.put_answer(
+            self._answer_model_key(model, context_tokens or self.context_tokens),
+            [hit["id"] for hit in result.results],
+            corpus_version,
+            result.question,
+            result.embedding,
+            result.answer,
+            self.db.collection,
+        )
+
+    async def aretrieve(
+        self,
+        question: str,
+        threshold: float = 0.7,
+        max_results: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: str = "vector",
+        rrf_k: int = 60,
+        filters: Optional[SearchFilter] = None,
+        rerank: Optional[RerankOptions] = None,
+    ) -> QueryResult:
+        """Find the chunks most relevant to ``question``.
+
+        ``mode`` is "vector" (cosine similarity above ``threshold``),
+        "hybrid" (vector and full-text rankings fused with reciprocal rank
+        fusion) or "lexical" (full-text only, no embedding call).
+        ``ef_search``/``probes`` tune the HNSW/ivfflat index for this query
+        and ``filters`` restricts it to matching documents. The
+        ``max_results`` found are then re-ranked with ``rerank`` (default:
+        the pipeline's options).
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        result = QueryResult(normalize_question(question))
+
+        if mode != "lexical":
+            started = time.perf_counter()
+            with tracing.span("query.embed"):
+                result.embedding = await self._aembed_question(result)
+            result.timings["embed"] = time.perf_counter() - started
+
+        await self._asearch(
+            result, threshold, max_results, ef_search, probes, mode, rrf_k, filters
+        )
+        await self._arerank(result, rerank or self.rerank)
+        return result
+
+    async def aretrieve_many(
+        self,
+        questions: List[str],
+        threshold: float = 0.7,
+        max_results: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: str = "vector",
+        rrf_k: int = 60,
+        concurrency: int = 8,
+        filters: Optional[SearchFilter] = None,
+        rerank: Optional[RerankOptions] = None,
+    ) -> List[QueryResult]:
+        """Variant of :meth:`aretrieve` for many questions at once.
+
+        Questions not in the query cache are embedded in batched calls, then
+        up to ``concurrency`` searches run at once over the connection pool.
+        Each result's "embed" timing is the time taken by the whole batch.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        results = [QueryResult(normalize_question(question)) for question in questions]
+
+        if mode != "lexical":
+            started = time.perf_counter()
+            with tracing.span("query.embed", questions=len(results)):
+                await self._aembed_questions(results)
+            elapsed = time.perf_counter() - started
+            for result in results:
+                result.timings["embed"] = elapsed
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def search(result: QueryResult):
+            async with semaphore:
+                await self._asearch(
+                    result,
+                    threshold,
+                    max_results,
+                    ef_search,
+                    probes,
+                    mode,
+                    rrf_k,
+                    filters,
+                )
+                await self._arerank(result, rerank or self.rerank)
+
+        await asyncio.gather(*(search(result) for result in results))
+        return results
+
+    async def _asearch(
+        self,
+        result: QueryResult,
+        threshold: float,
+        max_results: int,
+        ef_search: Optional[int],
+        probes: Optional[int],
+        mode: str,
+        rrf_k: int,
+        filters: Optional[SearchFilter] = None,
+    ):
+        started = time.perf_counter()
+        with tracing.span("query.search", mode=mode) as span:
+            if mode == "vector":
+                result.results = await self.adb.similarity_search(
+                    result.embedding,
+                    threshold,
+                    max_results,
+                    ef_search,
+                    probes,
+                    filters=filters,
+                )
+            elif mode == "hybrid":
+                result.results = await self.adb.hybrid_search(
+                    result.question,
+                    result.embedding,
+                    max_results,
+                    rrf_k,
+                    ef_search=ef_search,
+                    probes=probes,
+                    filters=filters,
+                )
+            else:
+                result.results = await self.adb.lexical_search(
+                    result.question, max_results, filters=filters
+                )
+            span.set(results=len(result.results))
+        tracing.observe("search_results", len(result.results))
+        result.timings["search"] = time.perf_counter() - started
+
+    async def _arerank(self, result: QueryResult, options: RerankOptions):
+        """Re-rank the result's chunks, keeping the best ``options.top_n``."""
+        if not options or not result.results:
+            return
+        started = time.perf_counter()
+        with tracing.span("query.rerank", method=options.method):
+            embeddings = (
+                await self.adb.get_embeddings([hit["id"] for hit in result.results])
+                if options.method == "mmr"
+                else None
+            )
+            result.candidates = len(result.results)
+            # Scoring is CPU-bound (a model, for the cross-encoder), so it runs
+            # in a worker thread like the storage calls
+            result.results = await asyncio.to_thread(
+                self.reranker.rerank,
+                result.question,
+                result.results,
+                options,
+                result.embedding,
+                embeddings,
+            )
+        result.timings["rerank"] = time.perf_counter() - started
+
+    async def _aembed_question(self, result: QueryResult) -> List[float]:
+        """Embed the question, through the query cache when enabled.
+
+        The cache holds the model's full output, fitted to the collection's
+        dimension afterwards.
+        """
+        key = self.processor.cache_key
+        if self.query_cache:
+            embedding = self.query_cache.get_embedding(key, result.question)
+            if embedding is not None:
+                result.cache_hits.append("embed")
+                return self.processor.prepare(embedding)
+        embedding = await self.processor.engine.aembed_query(result.question)
+        if self.query_cache:
+            self.query_cache.put_embedding(key, result.question, embedding)
+        return self.processor.prepare(embedding)
+
+    async def _aembed_questions(self, results: List[QueryResult]):
+        """Embed every result's question, in batches for cache misses."""
+        key = self.processor.cache_key
+        pending: List[QueryResult] = []
+        for result in results:
+            embedding = (
+                self.query_cache.get_embedding(key, result.question)
+                if self.query_cache
+                else None
+            )
+            if embedding is None:
+                pending.append(result)
+            else:
+                result.cache_hits.append("embed")
+                result.embedding = self.processor.prepare(embedding)
+
+        # Repeated questions are embedded once
+        unique = list(dict.fromkeys(result.question for result in pending))
+        embeddings = dict(
+            zip(unique, await self.processor.engine.aembed(unique, queries=True))
+        )
+        for question, embedding in embeddings.items():
+            if self.query_cache:
+                self.query_cache.put_embedding(key, question, embedding)
+        for result in pending:
+            result.embedding = self.processor.prepare(embeddings[result.question])
+
+    async def aanswer(
+        self,
+        result: QueryResult,
+        model: Optional[str] = None,
+        context_tokens: Optional[int] = None,
+    ) -> QueryResult:
+        """Generate an answer from a retrieval result's chunks."""
+        started = time.perf_counter()
+        with tracing.span("query.generate"):
+            corpus_version = (
+                await self.adb.run(self.db.get_corpus_version)
+                if self.query_cache
+                else None
+            )
+            result.answer = self._cached_answer(
+                result, model, corpus_version, context_tokens
+            )
+            if result.answer is None:
+                prompt = self.build_prompt(result, context_tokens)
+                with tracing.span("chat"):
+                    result.answer = await self.chat.agenerate(prompt, model)
+                self._store_answer(result, model, corpus_version, context_tokens)
+            else:
+                result.cache_hits.append("generate")
+        result.timings["generate"] = time.perf_counter() - started
+        return result
+
+    async def aquery(
+        self,
+        question: str,
+        threshold: float = 0.7,
+        max_results: int = 10,
+        model: Optional[str] = None,
+        generate: bool = True,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: str = "vector",
+        rrf_k: int = 60,
+        context_tokens: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+        rerank: Optional[RerankOptions] = None,
+    ) -> QueryResult:
+        """Retrieve chunks and, if any were found, generate an answer."""
+        result = await self.aretrieve(
+            question,
+            threshold,
+            max_results,
+            ef_search,
+            probes,
+            mode,
+            rrf_k,
+            filters,
+            rerank,
+        )
+        if generate and result.results:
+            await self.aanswer(result, model, context_tokens)
+        return result
+
+    async def aquery_many(
+        self,
+        questions: List[str],
+        threshold: float = 0.7,
+        max_results: int = 10,
+        model: Optional[str] = None,
+        generate: bool = True,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: str = "vector",
+        rrf_k: int = 60,
+        context_tokens: Optional[int] = None,
+        concurrency: int = 8,
+        on_result: Optional[Callable[[int, QueryResult], None]] = None,
+        filters: Optional[SearchFilter] = None,
+        rerank: Optional[RerankOptions] = None,
+    ) -> List[QueryResult]:
+        """Answer many questions concurrently.
+
+        Retrieval runs as in :meth:`aretrieve_many`; then up to
+        ``concurrency`` answers are generated at once. A failed answer is
+        recorded in the result's ``error`` instead of stopping the batch.
+        ``on_result(index, result)`` is called as each question finishes.
+        """
+        results = await self.aretrieve_many(
+            questions,
+            threshold,
+            max_results,
+            ef_search,
+            probes,
+            mode,
+            rrf_k,
+            concurrency,
+            filters,
+            rerank,
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(index: int, result: QueryResult):
+            if generate and result.results:
+                async with semaphore:
+                    try:
+                        await self.aanswer(result, model, context_tokens)
+                    except Exception as e:
+                        result.error = str(e)
+            if on_result:
+                on_result(index, result)
+
+        await asyncio.gather(*(answer(i, result) for i, result in enumerate(results)))
+        return results
+
+    def retrieve(
+        self,
+        question: str,
+        threshold: float = 0.7,
+        max_results: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: str = "vector",
+        rrf_k: int = 60,
+        filters: Optional[SearchFilter] = None,
+        rerank: Optional[RerankOptions] = None,
+    ) -> QueryResult:
+        """Synchronous wrapper around :meth:`aretrieve`."""
+        return asyncio.run(
+            self.aretrieve(
+                question,
+                threshold,
+                max_results,
+                ef_search,
+                probes,
+                mode,
+                rrf_k,
+                filters,
+                rerank,
+            )
+        )
+
+    def answer(
+        self,
+        result: QueryResult,
+        model: Optional[str] = None,
+        context_tokens: Optional[int] = None,
+    ) -> QueryResult:
+        """Synchronous variant of :meth:`aanswer`."""
+        started = time.perf_counter()
+        with tracing.span("query.generate"):
+            corpus_version = self.db.get_corpus_version() if self.query_cache else None
+            result.answer = self._cached_answer(
+                result, model, corpus_version, context_tokens
+            )
+            if result.answer is None:
+                prompt = self.build_prompt(result, context_tokens)
+                with tracing.span("chat"):
+                    result.answer = self.chat.generate(prompt, model)
+                self._store_answer(result, model, corpus_version, context_tokens)
+            else:
+                result.cache_hits.append("generate")
+        result.timings["generate"] = time.perf_counter() - started
+        return result
+
+    def stream_answer(
+        self,
+        result: QueryResult,
+        model: Optional[str] = None,
+        context_tokens: Optional[int] = None,
+    ) -> Iterator[str]:
+        """Variant of :meth:`answer` that yields the answer text as it arrives.
+
+        ``result.first_token`` records the time to the first text and
+        ``result.timings["generate"]`` the time until the stream is
+        exhausted. A cached answer is yielded in one piece.
+        """
+        started = time.perf_counter()
+        with tracing.span("query.generate") as span:
+            corpus_version = self.db.get_corpus_version() if self.query_cache else None
+            result.answer = self._cached_answer(
+                result, model, corpus_version, context_tokens
+            )
+            if result.answer is not None:
+                result.cache_hits.append("generate")
+                result.first_token = time.perf_counter() - started
+                yield result.answer
+            else:
+                prompt = self.build_prompt(result, context_tokens)
+                parts: List[str] = []
+                for text in self.chat.stream(prompt, model):
+                    if not parts:
+                        result.first_token = time.perf_counter() - started
+                    parts.append(text)
+                    yield text
+                result.answer = "".join(parts)
+                self._store_answer(result, model, corpus_version, context_tokens)
+            span.set(first_token_ms=(result.first_token or 0) * 1000)
+        result.timings["generate"] = time.perf_counter() - started
@@ -0,0 +1,146 @@
+"""Embedding model registry and collections for RAG Magic.
+
+A collection is a named corpus embedded with one model at one dimension.
+Each collection has its own embeddings table (PostgreSQL) or store
+directory (local backend) and therefore its own vector index, so a
+collection using a smaller model, or a Matryoshka-truncated one, is
+searched over smaller vectors.
+
+The ``default`` collection is ``rag.embeddings``, embedded with the
+configured ``EMBEDDING_MODEL`` at 768 dimensions.
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_COLLECTION = "default"
+DEFAULT_DIMENSION = 768
+
+# Lower-case identifiers, so the name can be used in table and index names
+_NAME_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,39}$")
+
+
+@dataclass(frozen=True)
+class EmbeddingModel:
+    """An embedding model's native output size.
+
+    Models trained with Matryoshka representation learning keep most of
+    their quality when vectors are truncated to a prefix and re-normalized.
+    """
+
+    name: str
+    dimension: int
+    matryoshka: bool = False
+
+
+EMBEDDING_MODELS: Dict[str, EmbeddingModel] = {
+    model.name: model
+    for model in (
+        EmbeddingModel("models/text-embedding-004", 768, matryoshka=True),
+        EmbeddingModel("models/gemini-embedding-001", 3072, matryoshka=True),
+        EmbeddingModel("models/embedding-001", 768),
+    )
+}
+
+
+@dataclass
+class Collection:
+    """A corpus embedded with one model at one dimension."""
+
+    name: str
+    model: str
+    dimension: int = DEFAULT_DIMENSION
+    # L2-normalize vectors after truncation (needed for truncated dimensions)
+    normalize: bool = False
+    created_at: Optional[datetime] = None
+
+    @property
+    def table_name(self) -> str:
+        """Unqualified name of the collection's embeddings table."""
+        return collection_table(self.name)
+
+    @property
+    def truncated(self) -> bool:
+        """Whether vectors are a prefix of the model's native output."""
+        model = EMBEDDING_MODELS.get(self.model)
+        return model is not None and self.dimension < model.dimension
+
+
+def collection_table(name: str) -> str:
+    """Unqualified embeddings table name for the collection ``name``."""
+    return "embeddings" if name == DEFAULT_COLLECTION else f"embeddings_{name}"
+
+
+def check_collection_name(name: str) -> str:
+    """Return ``name`` if it is a valid collection name, else raise ValueError."""
+    if not _NAME_PATTERN.match(name):
+        raise ValueError(
+            f"Invalid collection name: {name!r} (use lower-case letters, digits "
+            "and underscores, starting with a letter, at most 40 characters)"
+        )
+    return name
+
+
+def unknown_collection_message(name: str) -> str:
+    """Explain how to fix a reference to a collection that is not registered."""
+    if name == DEFAULT_COLLECTION:
+        return (
+            f"Unknown collection: {name} (run 'rag-magic migrate' on databases "
+            "created before collections)"
+        )
+    return (
+        f"Unknown collection: {name} "
+        f"(create it with 'rag-magic collection create {name}')"
+    )
+
+
+def make_collection(
+    name: str,
+    model: str,
+    dimension: Optional[int] = None,
+    normalize: Optional[bool] = None,
+) -> Collection:
+    """Validate and build a collection definition.
+
+    ``dimension`` defaults to the model's native size; smaller values are
+    only allowed for Matryoshka models and imply ``normalize``. Models not
+    in :data:`EMBEDDING_MODELS` need an explicit dimension.
+    """
+    check_collection_name(name)
+    known = EMBEDDING_MODELS.get(model)
+    if known is None:
+        if not dimension:
+            raise ValueError(
+                f"Unknown embedding model: {model}; pass its dimension explicitly"
+            )
+    else:
+        dimension = dimension or known.dimension
+        if dimension > known.dimension:
+            raise ValueError(
+                f"{model} produces {known.dimension}-dimensional embeddings, "
+                f"not {dimension}"
+            )
+        if dimension < known.dimension and not known.matryoshka:
+            raise ValueError(
+                f"{model} does not support truncated (Matryoshka) embeddings"
+            )
+    if dimension <= 0:
+        raise ValueError(f"Invalid dimension: {dimension}")
+
+    collection = Collection(name, model, dimension)
+    collection.normalize = collection.truncated if normalize is None else normalize
+    return collection
+
+
+def prepare_embedding(
+    vector: Sequence[float], dimension: int, normalize: bool = False
+) -> List[float]:
+    """Truncate ``vector`` to ``dimension`` and optionally L2-normalize it."""
+    vector = list(vector[:dimension])
+    if normalize:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        vector = [value / norm for value in vector]
+    return vector
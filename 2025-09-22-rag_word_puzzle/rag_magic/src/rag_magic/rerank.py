@@ -0,0 +1,185 @@
+"""Re-ranking of retrieved chunks for RAG Magic answer prompts.
+
+A search returns the chunks most similar to the question. When chunks
+overlap, many of them say the same thing and crowd out other passages. A
+re-ranker reorders the search results and keeps the best ``top_n`` of them
+for the answer prompt:
+
+- ``mmr`` (Maximal Marginal Relevance): chunks are picked one at a time.
+  Each pick is the chunk maximising
+  ``λ · relevance − (1 − λ) · max similarity to the chunks already picked``,
+  computed over the chunks' stored embeddings.
+- ``cross-encoder``: a local cross-encoder model reads the question and each
+  chunk together and scores how well the chunk answers it. This needs the
+  ``rerank`` extra (sentence-transformers).
+- ``none``: search order is kept and nothing is dropped.
+
+Re-ranked results carry a ``rerank_score``: the MMR score or the
+cross-encoder's relevance score.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .storage import RERANK_METHODS
+
+DEFAULT_RERANK_TOP_N = 5
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+@dataclass
+class RerankOptions:
+    """How one query's search results are re-ranked."""
+
+    method: str = "none"
+    # Chunks kept for the answer; None keeps them all (reordered)
+    top_n: Optional[int] = DEFAULT_RERANK_TOP_N
+    # MMR trade-off: 1 ranks by relevance alone, 0 by diversity alone
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA
+
+    def __post_init__(self):
+        if self.method not in RERANK_METHODS:
+            raise ValueError(
+                f"Unknown re-rank method: {self.method} "
+                f"(use {', '.join(RERANK_METHODS)})"
+            )
+        if self.top_n is not None and self.top_n < 1:
+            raise ValueError("The re-rank top-n must be at least 1")
+        if not 0 <= self.mmr_lambda <= 1:
+            raise ValueError("The MMR lambda must be in [0, 1]")
+
+    def __bool__(self) -> bool:
+        return self.method != "none"
+
+    def describe(self) -> str:
+        """One-line description for the CLI."""
+        kept = f"top {self.top_n}" if self.top_n else "all"
+        if self.method == "mmr":
+            return f"mmr (lambda {self.mmr_lambda:g}), {kept}"
+        return f"{self.method}, {kept}"
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def mmr(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    top_n: int,
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+) -> List[Tuple[int, float]]:
+    """Pick ``top_n`` rows by Maximal Marginal Relevance.
+
+    ``relevance`` holds each row's relevance to the question and
+    ``embeddings`` the row vectors, compared by cosine similarity. Returns
+    (row, MMR score) pairs in pick order. The pairwise similarities are
+    computed once as a matrix; each pick then updates every row's
+    redundancy with one vector operation.
+    """
+    count = len(relevance)
+    top_n = min(top_n, count)
+    if top_n <= 0:
+        return []
+    vectors = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+    similarity = vectors @ vectors.T
+    # Highest similarity of each row to the rows picked so far; dissimilar
+    # rows (negative cosine) count as not redundant rather than as a bonus
+    redundancy = np.zeros(count, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    picked: List[Tuple[int, float]] = []
+    for _ in range(top_n):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores = np.where(available, scores, -np.inf)
+        row = int(np.argmax(scores))
+        picked.append((row, float(scores[row])))
+        available[row] = False
+        redundancy = np.maximum(redundancy, similarity[row])
+    return picked
+
+
+def _relevance(
+    hits: Sequence[Dict[str, Any]],
+    embeddings: np.ndarray,
+    query_embedding: Optional[Sequence[float]],
+) -> np.ndarray:
+    """Cosine similarity to the question, or normalized text rank without one."""
+    if query_embedding is not None:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        return _unit_rows(np.asarray(embeddings, dtype=np.float32)) @ query
+    # Lexical results have no question embedding; full-text ranks are
+    # scaled to [0, 1] so they weigh against cosine redundancy
+    scores = np.array([hit.get("lexical_score") or 0.0 for hit in hits])
+    top = scores.max() if len(scores) else 0.0
+    return (scores / top if top > 0 else np.ones(len(hits))).astype(np.float32)
+
+
+class Reranker:
+    """Re-ranks search results, keeping cross-encoder models warm.
+
+    A cross-encoder is loaded on first use and reused by later queries.
+    """
+
+    def __init__(self, cross_encoder_model: str = DEFAULT_CROSS_ENCODER):
+        self.cross_encoder_model = cross_encoder_model
+        self._models: Dict[str, Any] = {}
+
+    def cross_encoder(self, model: Optional[str] = None):
+        """Return the (cached) sentence-transformers CrossEncoder for ``model``.
+
+        Raises ValueError if sentence-transformers is not installed.
+        """
+        model = model or self.cross_encoder_model
+        if model not in self._models:
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError:
+                raise ValueError(
+                    "Cross-encoder re-ranking needs the 'rerank' extra: "
+                    "pip install 'rag-magic[rerank]'"
+                )
+            self._models[model] = CrossEncoder(model)
+        return self._models[model]
+
+    def rerank(
+        self,
+        question: str,
+        hits: List[Dict[str, Any]],
+        options: RerankOptions,
+        query_embedding: Optional[Sequence[float]] = None,
+        embeddings: Optional[Dict[int, List[float]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Reorder ``hits`` (best first) and keep the best ``options.top_n``.
+
+        MMR needs the ``embeddings`` of the hits, keyed by chunk ID; hits
+        without one are left out, and with none the search order is kept.
+        ``query_embedding`` is the question's embedding, if the search used
+        one.
+        """
+        if not options or not hits:
+            return hits
+        top_n = options.top_n or len(hits)
+        if options.method == "mmr":
+            embeddings = embeddings or {}
+            if not any(hit["id"] in embeddings for hit in hits):
+                return hits[:top_n]
+            hits = [hit for hit in hits if hit["id"] in embeddings]
+            matrix = np.array([embeddings[hit["id"]] for hit in hits], np.float32)
+            ranked = mmr(
+                _relevance(hits, matrix, query_embedding),
+                matrix,
+                top_n,
+                options.mmr_lambda,
+            )
+        else:
+            scores = self.cross_encoder().predict(
+                [(question, hit["content"]) for hit in hits]
+            )
+            order = np.argsort(-np.asarray(scores), kind="stable")[:top_n]
+            ranked = [(int(row), float(scores[row])) for row in order]
+        return [{**hits[row], "rerank_score": score} for row, score in ranked]
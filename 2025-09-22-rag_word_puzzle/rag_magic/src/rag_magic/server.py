@@ -0,0 +1,165 @@
+"""Long-running HTTP/JSON query server for RAG Magic.
+
+The server builds one QueryPipeline at startup, so the embedding client,
+chat clients and database pool stay warm across requests. Requests are
+handled concurrently on the event loop. Each response reports its
+per-stage latency, and ``/stats`` aggregates it. Requests are traced (see
+:mod:`rag_magic.tracing`) and ``/metrics`` serves the counters and span
+histograms in Prometheus text format. Requires the optional ``server``
+extra (FastAPI and uvicorn).
+"""
+
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from . import tracing
+from .filters import SearchFilter
+from .query_pipeline import LatencyStats, QueryPipeline
+from .rerank import RerankOptions
+
+
+class QueryRequest(BaseModel):
+    """A natural-language question to answer from the vectorized documents."""
+
+    question: str = Field(..., min_length=1)
+    threshold: Optional[float] = Field(None, ge=0, le=1)
+    max_results: Optional[int] = Field(None, ge=1, le=100)
+    model: Optional[str] = None
+    generate: bool = True
+    mode: Optional[Literal["vector", "hybrid", "lexical"]] = None
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+    # Token budget for the answer's context (default: CONTEXT_TOKEN_BUDGET)
+    context_tokens: Optional[int] = Field(None, ge=1)
+    # Only search documents matching all of these (see rag_magic.filters)
+    source_glob: Optional[str] = None
+    document_ids: List[int] = Field(default_factory=list)
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    # Re-ranking before answering (defaults: RERANK_METHOD, RERANK_TOP_N, MMR_LAMBDA)
+    rerank: Optional[Literal["none", "mmr", "cross-encoder"]] = None
+    rerank_top_n: Optional[int] = Field(None, ge=1, le=100)
+    mmr_lambda: Optional[float] = Field(None, ge=0, le=1)
+
+    def search_filter(self) -> Optional[SearchFilter]:
+        filters = SearchFilter(self.source_glob, self.document_ids, self.metadata)
+        return filters or None
+
+    def rerank_options(self, default: RerankOptions) -> RerankOptions:
+        return RerankOptions(
+            self.rerank or default.method,
+            self.rerank_top_n or default.top_n,
+            default.mmr_lambda if self.mmr_lambda is None else self.mmr_lambda,
+        )
+
+
+class SearchHit(BaseModel):
+    """A retrieved chunk."""
+
+    id: int
+    document_id: int
+    chunk_index: Optional[int] = None
+    content: str
+    similarity: Optional[float] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    lexical_score: Optional[float] = None
+    score: Optional[float] = None
+    rerank_score: Optional[float] = None
+
+
+class QueryResponse(BaseModel):
+    """Retrieved chunks, the answer and per-stage latency in milliseconds."""
+
+    question: str
+    results: List[SearchHit]
+    answer: Optional[str] = None
+    timings_ms: Dict[str, float]
+    cached: List[str] = Field(default_factory=list)
+    # Tokens of context the answer prompt was built from
+    context_tokens: Optional[int] = None
+    # Chunks found before re-ranking kept ``results``
+    candidates: Optional[int] = None
+
+
+def create_app(pipeline: QueryPipeline, config) -> FastAPI:
+    """Create the FastAPI app serving queries through a warm ``pipeline``."""
+    latency = LatencyStats()
+    started_at = time.time()
+    tracing.tracer.enable()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if not pipeline.connect():
+            raise RuntimeError("Could not connect to the database")
+        yield
+        pipeline.close()
+
+    app = FastAPI(
+        title="RAG Magic Query Server",
+        description=(
+            "Query vectorized documents with warm embedding, chat and database "
+            "clients"
+        ),
+        lifespan=lifespan,
+    )
+
+    @app.get("/health")
+    async def health_check():
+        """Health check endpoint."""
+        return {"status": "healthy", "uptime_s": round(time.time() - started_at, 1)}
+
+    @app.get("/stats")
+    async def stats():
+        """Per-stage latency over recent requests."""
+        return latency.summary()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        """Counters and span histograms in Prometheus text format."""
+        return PlainTextResponse(
+            tracing.tracer.prometheus_text(),
+            media_type="text/plain; version=0.0.4",
+        )
+
+    @app.post("/query", response_model=QueryResponse)
+    async def query(request: QueryRequest):
+        """Embed the question, search for similar chunks and generate an answer."""
+        try:
+            with tracing.span("http.query"):
+                result = await pipeline.aquery(
+                    request.question,
+                    threshold=(
+                        config.default_similarity_threshold
+                        if request.threshold is None
+                        else request.threshold
+                    ),
+                    max_results=request.max_results or config.default_max_results,
+                    model=request.model,
+                    generate=request.generate,
+                    ef_search=request.ef_search or config.default_ef_search,
+                    probes=request.probes or config.default_ivfflat_probes,
+                    mode=request.mode or config.default_search_mode,
+                    rrf_k=config.rrf_k,
+                    context_tokens=request.context_tokens,
+                    filters=request.search_filter(),
+                    rerank=request.rerank_options(pipeline.rerank),
+                )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+        latency.record(result)
+        return QueryResponse(
+            question=result.question,
+            results=[SearchHit(**hit) for hit in result.results],
+            answer=result.answer,
+            timings_ms=result.timings_ms(),
+            cached=result.cache_hits,
+            context_tokens=result.context.tokens if result.context else None,
+            candidates=result.candidates,
+        )
+
+    return app
@@ -0,0 +1,465 @@
+"""Storage backend interface for RAG Magic.
+
+Every CLI command, the query pipeline and the query server talk to a
+StorageBackend. Two implementations exist:
+
+- ``postgres`` (:class:`~rag_magic.database.DatabaseConnection`): PostgreSQL
+  with pgvector, the default.
+- ``local`` (:class:`~rag_magic.local_store.LocalVectorStore`): an
+  in-process store on the local filesystem for laptops and CI, needing no
+  database server.
+
+The backend is chosen with the ``STORAGE_BACKEND`` environment variable.
+A backend instance works on one collection (see :mod:`rag_magic.registry`),
+chosen with ``RAG_COLLECTION``.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from rich.console import Console
+from rich.table import Table
+
+from .filters import SearchFilter
+from .registry import DEFAULT_COLLECTION, Collection
+
+if TYPE_CHECKING:
+    from .indexing import IndexSpec
+
+console = Console()
+
+# A chunk row for bulk ingestion: (content, embedding, chunk metadata)
+EmbeddingRow = Tuple[str, Sequence[float], Optional[Dict[str, Any]]]
+
+# A chunk row with an explicit position: (chunk_index, content, embedding, metadata)
+IndexedEmbeddingRow = Tuple[int, str, Sequence[float], Optional[Dict[str, Any]]]
+
+DEFAULT_PAGE_SIZE = 500
+
+STORAGE_BACKENDS = ("postgres", "local")
+
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+
+# How search results are re-ranked before answering (see rag_magic.rerank)
+RERANK_METHODS = ("none", "mmr", "cross-encoder")
+
+
+@dataclass
+class NewDocument:
+    """A document and its chunk rows, ready for bulk insertion."""
+
+    title: str
+    content: str
+    source: str
+    rows: Iterable[EmbeddingRow]
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class StorageBackend(ABC):
+    """Documents, chunk embeddings and the searches over them.
+
+    Methods report failures on the console and return an empty result
+    (None, False, 0 or an empty collection) rather than raising. Search
+    results are dicts with ``id``, ``document_id``, ``chunk_index``,
+    ``content``, ``metadata`` and ``similarity``; lexical and hybrid results also carry
+    ``lexical_score`` and hybrid results the fused ``score``.
+
+    Documents, embeddings and searches are scoped to the backend's
+    ``collection``; the collection registry methods see every collection.
+    """
+
+    #: Name used by ``STORAGE_BACKEND`` and for backend-specific commands
+    backend: str = ""
+
+    #: Collection that documents, embeddings and searches belong to
+    collection: str = DEFAULT_COLLECTION
+
+    #: ANN index methods :meth:`build_index` accepts; the first is the default
+    index_methods: Tuple[str, ...] = ("hnsw", "ivfflat")
+
+    #: Width of the collection's vectors; None until the local store has any
+    dimension: Optional[int] = None
+
+    #: Candidates fetched per result for full-precision re-ranking of
+    #: quantized searches
+    rerank_factor: int
+
+    @classmethod
+    @abstractmethod
+    def from_env(cls, collection: Optional[str] = None) -> "StorageBackend":
+        """Create the backend from environment variables."""
+
+    @abstractmethod
+    def connect(self) -> bool:
+        """Open the backend (a no-op if it is already open)."""
+
+    @abstractmethod
+    def disconnect(self):
+        """Release everything opened by :meth:`connect`."""
+
+    @abstractmethod
+    def test_connection(self) -> bool:
+        """Check the backend is reachable and ready, reporting each check."""
+
+    @abstractmethod
+    def insert_documents_with_embeddings(
+        self,
+        documents: Iterable[NewDocument],
+        page_size: int = DEFAULT_PAGE_SIZE,
+        report: bool = True,
+    ) -> Optional[List[int]]:
+        """Insert several documents and their embeddings atomically.
+
+        Returns the new document IDs in input order, or None on failure.
+        """
+
+    def insert_document_with_embeddings(
+        self,
+        title: str,
+        content: str,
+        source: str,
+        rows: Iterable[EmbeddingRow],
+        metadata: Optional[Dict[str, Any]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Optional[int]:
+        """Insert a document and all of its chunk embeddings atomically.
+
+        Either the document and every embedding row are stored, or nothing
+        is. Returns the new document ID, or None on failure.
+        """
+        document_ids = self.insert_documents_with_embeddings(
+            [NewDocument(title, content, source, rows, metadata)], page_size
+        )
+        return document_ids[0] if document_ids else None
+
+    @abstractmethod
+    def get_existing_sources(self, sources: List[str]) -> Set[str]:
+        """Return which of ``sources`` already have a document."""
+
+    @abstractmethod
+    def get_chunk_hashes(self, document_id: int) -> List[Dict[str, Any]]:
+        """Get id, chunk_index and sha256 content hash of a document's chunks."""
+
+    @abstractmethod
+    def apply_chunk_diff(
+        self,
+        document_id: int,
+        content: str,
+        metadata: Dict[str, Any],
+        moved: List[Tuple[int, int]],
+        deleted: List[int],
+        inserted: Iterable[IndexedEmbeddingRow],
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> bool:
+        """Apply an incremental chunk diff to a document atomically."""
+
+    @abstractmethod
+    def similarity_search(
+        self,
+        query_embedding: List[float],
+        threshold: float = 0.7,
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        max_rounds: int = 4,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` chunks with cosine similarity above ``threshold``.
+
+        ``filters`` restricts the search to chunks of matching documents.
+        """
+
+    @abstractmethod
+    def lexical_search(
+        self,
+        query_text: str,
+        limit: int = 10,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Full-text search over chunk content; no embedding is needed."""
+
+    @abstractmethod
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        rrf_k: int = 60,
+        candidates: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and lexical rankings with reciprocal rank fusion."""
+
+    @abstractmethod
+    def nearest_neighbours(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        exact: bool = False,
+    ) -> List[int]:
+        """Return the IDs of the ``limit`` nearest chunks by cosine distance."""
+
+    @abstractmethod
+    def get_embeddings(self, ids: List[int]) -> Dict[int, List[float]]:
+        """Return the stored embeddings of the chunks ``ids``, keyed by ID."""
+
+    @abstractmethod
+    def list_collections(self) -> List[Collection]:
+        """Return every registered collection."""
+
+    @abstractmethod
+    def get_collection(self, name: Optional[str] = None) -> Optional[Collection]:
+        """Return the collection ``name`` (default: this backend's), or None."""
+
+    @abstractmethod
+    def create_collection(self, collection: Collection) -> bool:
+        """Register a collection and create its embeddings table and index."""
+
+    @abstractmethod
+    def drop_collection(self, name: str) -> bool:
+        """Delete a collection with its documents and embeddings."""
+
+    @abstractmethod
+    def get_corpus_version(self) -> Optional[str]:
+        """Return a fingerprint that changes whenever documents change."""
+
+    @abstractmethod
+    def get_documents(self) -> List[Dict[str, Any]]:
+        """Get all documents with basic statistics."""
+
+    @abstractmethod
+    def get_document_by_source(self, source: str) -> Optional[Dict[str, Any]]:
+        """Get a document by its source."""
+
+    @abstractmethod
+    def delete_document_by_source(self, source: str) -> bool:
+        """Delete a document and its embeddings by source."""
+
+    # Index management and maintenance, see rag_magic.indexing
+
+    @abstractmethod
+    def index_status(self) -> Optional[Dict[str, Any]]:
+        """Return the ``rows``, vector ``indexes`` and ``quantization`` in use."""
+
+    @abstractmethod
+    def build_index(
+        self, spec: "IndexSpec", maintenance_work_mem: Optional[str] = None
+    ) -> Optional["IndexSpec"]:
+        """Rebuild the ANN index as ``spec``; returns the spec that was built.
+
+        Unset ``lists`` and ``quantization`` are filled in from the row count
+        and the current index.
+        """
+
+    @abstractmethod
+    def sample_embeddings(self, count: int) -> List[List[float]]:
+        """Return up to ``count`` randomly chosen stored embeddings."""
+
+    @abstractmethod
+    def explain_search(
+        self,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        force_index: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Plan a top-k similarity search and report the vector ``index`` used."""
+
+    @abstractmethod
+    def storage_bytes(self) -> Optional[int]:
+        """Bytes the collection's embeddings and indexes take on disk."""
+
+    @abstractmethod
+    def apply_migrations(self) -> bool:
+        """Bring the backend's schema up to date."""
+
+    @abstractmethod
+    def partition_embeddings(
+        self,
+        partitions: int,
+        batch_size: int = 10_000,
+        keep_old: bool = False,
+        maintenance_work_mem: Optional[str] = None,
+    ) -> bool:
+        """Hash-partition the collection's embeddings on ``document_id``."""
+
+
+def report_throughput(rows: int, elapsed: float):
+    """Print how many rows were written and at what rate."""
+    rate = rows / elapsed if elapsed > 0 else float(rows)
+    console.print(
+        f"[green]✓ Inserted {rows} embeddings in {elapsed:.2f}s "
+        f"({rate:,.0f} rows/sec)[/green]"
+    )
+
+
+def storage_from_env(
+    backend: Optional[str] = None, collection: Optional[str] = None
+) -> StorageBackend:
+    """Create the storage backend named by ``backend`` or ``STORAGE_BACKEND``.
+
+    It works on ``collection``, by default ``RAG_COLLECTION`` or "default".
+    """
+    backend = backend or os.getenv("STORAGE_BACKEND", "postgres")
+    collection = collection or os.getenv("RAG_COLLECTION") or DEFAULT_COLLECTION
+    if backend == "postgres":
+        from .database import DatabaseConnection
+
+        return DatabaseConnection.from_env(collection)
+    if backend == "local":
+        from .local_store import LocalVectorStore
+
+        return LocalVectorStore.from_env(collection)
+    raise ValueError(
+        f"Unknown storage backend: {backend} (use {' or '.join(STORAGE_BACKENDS)})"
+    )
+
+
+class AsyncDatabaseConnection:
+    """Asyncio front end to a storage backend.
+
+    Each call runs the blocking operation in a worker thread. With
+    PostgreSQL every call gets its own pooled connection, so concurrent
+    awaits (e.g. from a query server) run queries in parallel up to the
+    pool's max size instead of connecting per request.
+    """
+
+    def __init__(self, db: StorageBackend):
+        self.db = db
+
+    @classmethod
+    def from_env(cls, collection: Optional[str] = None) -> "AsyncDatabaseConnection":
+        """Create an async connection to the configured storage backend."""
+        return cls(storage_from_env(collection=collection))
+
+    async def connect(self) -> bool:
+        """Open the underlying connection pool."""
+        return await self.run(self.db.connect)
+
+    async def disconnect(self):
+        """Close the underlying connection pool."""
+        await self.run(self.db.disconnect)
+
+    async def __aenter__(self) -> "AsyncDatabaseConnection":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    async def run(self, operation, *args, **kwargs):
+        """Run any blocking storage backend method in a worker thread."""
+        # Imported here, where an event loop already has it loaded, so that
+        # importing this module does not cost CLI commands the asyncio import
+        import asyncio
+
+        return await asyncio.to_thread(operation, *args, **kwargs)
+
+    async def similarity_search(
+        self,
+        query_embedding: List[float],
+        threshold: float = 0.7,
+        limit: int = 10,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Perform similarity search on embeddings."""
+        return await self.run(
+            self.db.similarity_search,
+            query_embedding,
+            threshold,
+            limit,
+            ef_search,
+            probes,
+            filters=filters,
+        )
+
+    async def lexical_search(
+        self,
+        query_text: str,
+        limit: int = 10,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Full-text search over chunk content."""
+        return await self.run(
+            self.db.lexical_search, query_text, limit, filters=filters
+        )
+
+    async def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        limit: int = 10,
+        rrf_k: int = 60,
+        candidates: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+    ) -> List[Dict[str, Any]]:
+        """Fuse vector and lexical rankings with reciprocal rank fusion."""
+        return await self.run(
+            self.db.hybrid_search,
+            query_text,
+            query_embedding,
+            limit,
+            rrf_k,
+            candidates,
+            ef_search,
+            probes,
+            filters=filters,
+        )
+
+    async def get_embeddings(self, ids: List[int]) -> Dict[int, List[float]]:
+        """Return the stored embeddings of the chunks ``ids``, keyed by ID."""
+        return await self.run(self.db.get_embeddings, ids)
+
+    async def get_documents(self) -> List[Dict[str, Any]]:
+        """Get all documents with basic statistics."""
+        return await self.run(self.db.get_documents)
+
+    async def get_document_by_source(self, source: str) -> Optional[Dict[str, Any]]:
+        """Get a document by its source."""
+        return await self.run(self.db.get_document_by_source, source)
+
+
+def display_documents_table(documents: List[Dict[str, Any]]):
+    """Display documents in a formatted table."""
+    if not documents:
+        console.print("[yellow]No documents found.[/yellow]")
+        return
+
+    table = Table(title="Vectorized Documents")
+    table.add_column("ID", style="cyan", no_wrap=True)
+    table.add_column("Title", style="magenta")
+    table.add_column("Source", style="green")
+    table.add_column("Chunks", style="blue", justify="right")
+    table.add_column("Created", style="yellow")
+
+    for doc in documents:
+        table.add_row(
+            str(doc["id"]),
+            doc["title"][:50] + "..." if len(doc["title"]) > 50 else doc["title"],
+            doc["source"],
+            str(doc["chunk_count"]),
+            doc["created_at"].strftime("%Y-%m-%d %H:%M"),
+        )
+
+    console.print(table)
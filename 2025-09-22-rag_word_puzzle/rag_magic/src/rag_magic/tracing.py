@@ -0,0 +1,435 @@
+"""Lightweight tracing and metrics for RAG Magic.
+
+Spans time the stages of a command: reading and chunking files, embedding
+batches, cache lookups, SQL queries and answer generation. Spans nest, so
+the time of a stage can be broken down into the stages it ran. Counters
+add up the work done (chunks, tokens, rows read and written) and
+histograms record the distribution of span durations.
+
+Tracing is off by default, and then spans and metrics cost next to
+nothing. The CLI turns it on with ``--profile`` (a per-stage breakdown),
+``--trace-json``, ``--metrics-file`` (Prometheus text format) and ``--otel``
+(an OTLP exporter, from the optional ``otel`` extra). The server traces
+every request and serves the metrics at ``/metrics``.
+
+Only the standard library is imported here, so instrumented modules and the
+CLI stay cheap to import.
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds of the histogram buckets for span durations, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# ... and for result and batch sizes
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Finished spans kept for the JSON and OpenTelemetry exports; the per-stage
+# totals and metrics cover every span
+DEFAULT_MAX_SPANS = 10_000
+
+METRIC_PREFIX = "rag_magic"
+
+
+@dataclass
+class Span:
+    """One timed operation and the attributes describing it."""
+
+    id: int
+    name: str
+    # Names of the enclosing spans and this one, outermost first
+    path: Tuple[str, ...]
+    parent_id: Optional[int] = None
+    # Wall-clock start (epoch seconds) and duration in seconds
+    start: float = 0.0
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Context variable token and perf_counter() start, while open
+    _token: Any = field(default=None, repr=False)
+    _started: float = field(default=0.0, repr=False)
+
+    def set(self, **attributes):
+        """Add attributes, e.g. the number of rows a query returned."""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration * 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """Stands in for a span while tracing is off."""
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Histogram:
+    """Counts of observations per bucket, Prometheus style."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        """Observations at or below each bucket bound."""
+        return list(itertools.accumulate(self.counts))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": list(self.buckets),
+            "counts": self.cumulative(),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+@dataclass
+class StageStats:
+    """Totals of the spans at one position in the span tree."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    errors: int = 0
+    first_start: float = 0.0
+
+
+class Tracer:
+    """Collects spans, counters and histograms for one process.
+
+    Safe to use from threads and asyncio tasks: the current span is a
+    context variable, so tasks and ``asyncio.to_thread`` calls nest under
+    the span that started them.
+    """
+
+    def __init__(self, max_spans: int = DEFAULT_MAX_SPANS):
+        self.enabled = False
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            "rag_magic_span", default=None
+        )
+        self.reset()
+
+    def reset(self):
+        """Forget all spans and metrics."""
+        with self._lock:
+            self.spans: deque = deque(maxlen=self.max_spans)
+            self.stages: Dict[Tuple[str, ...], StageStats] = {}
+            self.counters: Dict[str, float] = {}
+            self.histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    # Recording
+
+    def start(self, name: str, **attributes) -> Optional[Span]:
+        """Open a span as a child of the current one and make it current.
+
+        Returns None while tracing is off. Pair with :meth:`finish` in the
+        same context; :meth:`span` does both.
+        """
+        if not self.enabled:
+            return None
+        parent = self._current.get()
+        span = Span(
+            id=next(self._ids),
+            name=name,
+            path=(parent.path if parent else ()) + (name,),
+            parent_id=parent.id if parent else None,
+            start=time.time(),
+            attributes=attributes,
+        )
+        span._token = self._current.set(span)
+        span._started = time.perf_counter()
+        return span
+
+    def finish(self, span: Optional[Span], error: Optional[BaseException] = None):
+        """Close ``span``, restore its parent as current and record it."""
+        if span is None:
+            return
+        span.duration = time.perf_counter() - span._started
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        try:
+            self._current.reset(span._token)
+        except ValueError:
+            # Finished in another context than it started in
+            self._current.set(None)
+        with self._lock:
+            self.spans.append(span)
+            stage = self.stages.get(span.path)
+            if stage is None:
+                stage = self.stages[span.path] = StageStats(first_start=span.start)
+            stage.first_start = min(stage.first_start, span.start)
+            stage.calls += 1
+            stage.seconds += span.duration
+            stage.max_seconds = max(stage.max_seconds, span.duration)
+            stage.errors += span.error is not None
+            self._histogram(
+                "span_duration_seconds",
+                f'span="{_label_value(span.name)}"',
+                DURATION_BUCKETS,
+            ).observe(span.duration)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Any]:
+        """Time the block as a span named ``name``.
+
+        Yields the span (or a no-op stand-in while tracing is off), whose
+        ``set()`` adds attributes. Exceptions are recorded and re-raised.
+        """
+        span = self.start(name, **attributes)
+        if span is None:
+            yield NULL_SPAN
+            return
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        self.finish(span)
+
+    def traced(
+        self, name: str, count_rows: Optional[str] = None
+    ) -> Callable[[Callable], Callable]:
+        """Decorator timing each call of a function as a span named ``name``.
+
+        With ``count_rows`` a sized return value is recorded as the span's
+        ``rows`` attribute and added to that counter.
+        """
+
+        def decorate(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name) as span:
+                    result = function(*args, **kwargs)
+                    if count_rows and hasattr(result, "__len__"):
+                        span.set(rows=len(result))
+                        self.count(count_rows, len(result))
+                    return result
+
+            return wrapper
+
+        return decorate
+
+    def count(self, name: str, value: float = 1):
+        """Add ``value`` to the counter ``name``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = SIZE_BUCKETS):
+        """Record ``value`` in the histogram ``name``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(name, "", buckets).observe(value)
+
+    def _histogram(self, name: str, labels: str, buckets: Sequence[float]) -> Histogram:
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(buckets)
+        return histogram
+
+    # Reporting
+
+    def profile(self) -> List[Dict[str, Any]]:
+        """Per-stage breakdown: one row per span position, in tree order.
+
+        ``share`` is the stage's time as a fraction of its root span's.
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        roots = {
+            path[0]: stats.seconds for path, stats in stages.items() if len(path) == 1
+        }
+
+        def order(path: Tuple[str, ...]) -> List[Tuple[float, str]]:
+            # Siblings in order of first appearance, children after parents
+            return [
+                (stages[prefix].first_start if prefix in stages else 0.0, prefix[-1])
+                for prefix in (path[:depth] for depth in range(1, len(path) + 1))
+            ]
+
+        rows = []
+        for path in sorted(stages, key=order):
+            stats = stages[path]
+            root = roots.get(path[0])
+            rows.append(
+                {
+                    "stage": path[-1],
+                    "path": "/".join(path),
+                    "depth": len(path) - 1,
+                    "calls": stats.calls,
+                    "total_ms": stats.seconds * 1000,
+                    "mean_ms": stats.seconds * 1000 / stats.calls,
+                    "max_ms": stats.max_seconds * 1000,
+                    "errors": stats.errors,
+                    "share": stats.seconds / root if root else None,
+                }
+            )
+        return rows
+
+    def summary(self) -> Dict[str, Any]:
+        """Spans, per-stage totals, counters and histograms as plain data."""
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+            counters = dict(self.counters)
+            histograms = {
+                f"{name}{{{labels}}}" if labels else name: histogram.to_dict()
+                for (name, labels), histogram in self.histograms.items()
+            }
+        return {
+            "stages": self.profile(),
+            "counters": counters,
+            "histograms": histograms,
+            "spans": spans,
+        }
+
+    def write_json(self, path: str):
+        """Write :meth:`summary` to a JSON file."""
+        target = Path(path).expanduser()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(target, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+
+    def prometheus_text(self) -> str:
+        """Counters and histograms in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        lines = []
+        for name, value in counters:
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+        typed = set()
+        for (name, labels), histogram in histograms:
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            prefix = f"{labels}," if labels else ""
+            for bound, count in zip(histogram.buckets, histogram.cumulative()):
+                lines.append(f'{metric}_bucket{{{prefix}le="{bound:g}"}} {count}')
+            lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{metric}_sum{suffix} {histogram.sum:g}")
+            lines.append(f"{metric}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write :meth:`prometheus_text` to a file (e.g. for node_exporter's
+        textfile collector)."""
+        target = Path(path).expanduser()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(self.prometheus_text(), encoding="utf-8")
+
+    def export_otel(self, service_name: str = "rag-magic") -> int:
+        """Send the finished spans to an OTLP endpoint; returns how many.
+
+        The endpoint and headers come from the standard
+        ``OTEL_EXPORTER_OTLP_*`` environment variables. Raises ValueError if
+        the ``otel`` extra is not installed.
+        """
+        try:
+            from opentelemetry import trace
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                OTLPSpanExporter,
+            )
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError:
+            raise ValueError(
+                "OpenTelemetry export needs the 'otel' extra: "
+                "pip install 'rag-magic[otel]'"
+            )
+
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": service_name})
+        )
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        otel_tracer = provider.get_tracer("rag_magic")
+        exported = {}
+        # Parents start before their children, so they are created first
+        for span in spans:
+            parent = exported.get(span.parent_id)
+            exported[span.id] = otel_tracer.start_span(
+                span.name,
+                context=trace.set_span_in_context(parent) if parent else None,
+                start_time=int(span.start * 1e9),
+                attributes={
+                    key: (
+                        value
+                        if isinstance(value, (str, bool, int, float))
+                        else str(value)
+                    )
+                    for key, value in span.attributes.items()
+                },
+            )
+            if span.error:
+                exported[span.id].set_status(Status(StatusCode.ERROR, span.error))
+        for span in spans:
+            exported[span.id].end(end_time=int((span.start + span.duration) * 1e9))
+        provider.shutdown()
+        return len(spans)
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The process-wide tracer used by the instrumented modules
+tracer = Tracer()
+
+span = tracer.span
+traced = tracer.traced
+count = tracer.count
+observe = tracer.observe
@@ -0,0 +1,34 @@
+"""Shared fixtures; tests that need PostgreSQL are skipped without one.
+
+The database is configured with the usual POSTGRES_* variables.
+"""
+
+import uuid
+
+import pytest
+
+# Small enough to keep the test tables tiny
+DIMENSION = 8
+
+
+@pytest.fixture
+def pg_collection():
+    """A connection to a throwaway collection, dropped afterwards."""
+    pytest.importorskip("psycopg2")
+    from rag_magic.database import DatabaseConnection
+    from rag_magic.registry import Collection
+
+    admin = DatabaseConnection.from_env()
+    if not admin.connect():
+        pytest.skip("PostgreSQL is not available")
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    if not admin.create_collection(Collection(name, "test-model", DIMENSION)):
+        admin.disconnect()
+        pytest.skip("could not create a test collection")
+    db = DatabaseConnection.from_env(collection=name)
+    try:
+        yield db
+    finally:
+        db.disconnect()
+        admin.drop_collection(name)
+        admin.disconnect()
@@ -0,0 +1,21 @@
+"""Vector index inspection against PostgreSQL."""
+
+import random
+
+from rag_magic import indexing
+
+
+def random_vector(rng: random.Random, dimension: int = 8):
+    return [rng.uniform(-1, 1) for _ in range(dimension)]
+
+
+def test_explain_search_forced_index_uses_collection_index(pg_collection):
+    db = pg_collection
+    rng = random.Random(0)
+    rows = [(f"chunk {i}", random_vector(rng), None) for i in range(50)]
+    assert db.insert_document_with_embeddings("Doc", "", "doc.txt", rows)
+
+    result = indexing.explain_search(db, random_vector(rng), force_index=True)
+
+    assert result is not None
+    assert result["index"] == db.index_name
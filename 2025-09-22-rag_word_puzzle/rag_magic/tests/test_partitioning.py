@@ -0,0 +1,106 @@
+"""Online hash partitioning of an embeddings table against PostgreSQL."""
+
+import random
+import threading
+
+from rag_magic.database import DatabaseConnection, to_vector_literal
+
+
+def random_vector(rng: random.Random, dimension: int = 8):
+    return [rng.uniform(-1, 1) for _ in range(dimension)]
+
+
+class Writer(threading.Thread):
+    """Inserts, updates and deletes rows and records the expected table."""
+
+    def __init__(self, db: DatabaseConnection, document_ids, expected):
+        super().__init__(daemon=True)
+        self.db = db
+        self.document_ids = document_ids
+        self.expected = expected
+        self.rng = random.Random(1)
+        self.stop = threading.Event()
+        self.writes = 0
+        self.errors = []
+
+    def run(self):
+        table = self.db.embeddings_table
+        while not self.stop.is_set():
+            try:
+                with self.db.connection() as conn, conn.cursor() as cursor:
+                    operation = self.rng.random()
+                    row_id = self.rng.choice(list(self.expected))
+                    if operation < 0.5:
+                        document_id = self.rng.choice(self.document_ids)
+                        content = f"inserted {self.writes}"
+                        cursor.execute(
+                            f"INSERT INTO {table} (document_id, content, embedding) "
+                            "VALUES (%s, %s, %s::vector) RETURNING id",
+                            (
+                                document_id,
+                                content,
+                                to_vector_literal(random_vector(self.rng)),
+                            ),
+                        )
+                        row_id = cursor.fetchone()["id"]
+                        change = (row_id, (document_id, content))
+                    elif operation < 0.8:
+                        content = f"updated {self.writes}"
+                        cursor.execute(
+                            f"UPDATE {table} SET content = %s WHERE id = %s",
+                            (content, row_id),
+                        )
+                        change = (row_id, (self.expected[row_id][0], content))
+                    else:
+                        cursor.execute(f"DELETE FROM {table} WHERE id = %s", (row_id,))
+                        change = (row_id, None)
+                    conn.commit()
+            except Exception as e:
+                self.errors.append(e)
+                return
+            if change[1] is None:
+                del self.expected[change[0]]
+            else:
+                self.expected[change[0]] = change[1]
+            self.writes += 1
+
+
+def table_rows(db: DatabaseConnection):
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT id, document_id, content FROM {db.embeddings_table}")
+        rows = {row["id"]: (row["document_id"], row["content"]) for row in cursor}
+        partitions = db.partitions(cursor)
+        conn.commit()
+    return rows, partitions
+
+
+def test_partition_keeps_rows_written_during_conversion(pg_collection):
+    db = pg_collection
+    rng = random.Random(0)
+    document_ids = []
+    for doc in range(20):
+        rows = [(f"chunk {doc}-{i}", random_vector(rng), None) for i in range(100)]
+        document_ids.append(
+            db.insert_document_with_embeddings(f"Doc {doc}", "", f"{doc}.txt", rows)
+        )
+    expected, _ = table_rows(db)
+
+    writer_db = DatabaseConnection.from_env(collection=db.collection)
+    writer = Writer(writer_db, document_ids, expected)
+    writer.start()
+    try:
+        # Small batches stretch the copy over many transactions
+        assert db.partition_embeddings(2, batch_size=50)
+        writes_before_swap = writer.writes
+        while writer.writes < writes_before_swap + 20 and writer.is_alive():
+            writer.stop.wait(0.01)
+    finally:
+        writer.stop.set()
+        writer.join()
+        writer_db.disconnect()
+
+    assert not writer.errors
+    assert writes_before_swap > 0
+    rows, partitions = table_rows(db)
+    assert len(partitions) == 2
+    assert rows == expected
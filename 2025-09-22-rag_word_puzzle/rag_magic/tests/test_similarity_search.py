@@ -0,0 +1,139 @@
+"""The widening loop of DatabaseConnection.similarity_search."""
+
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from rag_magic.database import (  # noqa: E402
+    DEFAULT_EF_SEARCH,
+    DEFAULT_PROBES,
+    MAX_EF_SEARCH,
+    MAX_PROBES,
+    DatabaseConnection,
+)
+
+
+class FakeCursor:
+    """Returns one scripted result per query, repeating the last."""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+        self.executed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed += 1
+
+    def fetchall(self):
+        return self.rounds[min(self.executed, len(self.rounds)) - 1]
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def rows(*similarities):
+    return [
+        {"id": i, "document_id": 1, "content": f"chunk {i}", "similarity": s}
+        for i, s in enumerate(similarities)
+    ]
+
+
+@pytest.fixture
+def search(monkeypatch):
+    """Run similarity_search over scripted rounds of rows.
+
+    Returns the results and the (ef_search, probes) of each round.
+    """
+
+    def run(rounds, **kwargs):
+        db = DatabaseConnection()
+        cursor = FakeCursor(rounds)
+        settings = []
+
+        @contextmanager
+        def connection():
+            yield FakeConnection(cursor)
+
+        db._pool = object()
+        monkeypatch.setattr(db, "connection", connection)
+        monkeypatch.setattr(db, "index_quantization", lambda cursor: "none")
+        monkeypatch.setattr(
+            db,
+            "set_search_params",
+            lambda cursor, ef_search, probes: settings.append((ef_search, probes)),
+        )
+        results = db.similarity_search([0.0] * 3, **kwargs)
+        assert cursor.executed == len(settings)
+        return results, settings
+
+    return run
+
+
+def test_full_top_k_needs_one_round(search):
+    results, settings = search([rows(0.9, 0.8, 0.75)], threshold=0.7, limit=3)
+
+    assert [r["similarity"] for r in results] == [0.9, 0.8, 0.75]
+    assert settings == [(DEFAULT_EF_SEARCH, DEFAULT_PROBES)]
+
+
+def test_short_scan_widens_until_no_new_candidates(search):
+    rounds = [rows(0.9), rows(0.9, 0.85), rows(0.9, 0.85)]
+
+    results, settings = search(rounds, threshold=0.7, limit=5)
+
+    assert len(results) == 2
+    assert settings == [
+        (DEFAULT_EF_SEARCH, DEFAULT_PROBES),
+        (DEFAULT_EF_SEARCH * 2, DEFAULT_PROBES * 2),
+        (DEFAULT_EF_SEARCH * 4, DEFAULT_PROBES * 4),
+    ]
+
+
+def test_too_few_rows_pass_threshold_stops_widening(search):
+    # The farthest candidate already fails the threshold, so a wider scan
+    # could only add rows that fail it too
+    results, settings = search([rows(0.9, 0.8, 0.5)], threshold=0.7, limit=5)
+
+    assert [r["similarity"] for r in results] == [0.9, 0.8]
+    assert len(settings) == 1
+
+
+def test_no_rows_pass_threshold(search):
+    results, settings = search([rows(0.6, 0.5)], threshold=0.7, limit=5)
+
+    assert results == []
+    assert len(settings) == 1
+
+
+def test_widening_stops_after_max_rounds(search):
+    rounds = [rows(*[0.9] * n) for n in range(1, 10)]
+
+    results, settings = search(rounds, threshold=0.7, limit=20, max_rounds=3)
+
+    assert len(results) == 3
+    assert len(settings) == 3
+
+
+def test_widening_stops_at_the_search_limits(search):
+    results, settings = search(
+        [rows(0.9)],
+        threshold=0.7,
+        limit=5,
+        ef_search=MAX_EF_SEARCH,
+        probes=MAX_PROBES,
+    )
+
+    assert len(results) == 1
+    assert settings == [(MAX_EF_SEARCH, MAX_PROBES)]
@@ -0,0 +1,19 @@
+"""CLI startup: cheap commands must not import the heavy modules."""
+
+import pytest
+
+from rag_magic.benchmarks import STARTUP_CHECKS, measure_startup
+
+# Import time varies a lot between machines and under load; the budgets are
+# tracked by ``rag-magic bench startup``, this only catches gross regressions
+BUDGET_SCALE = 5
+
+
+@pytest.mark.parametrize(
+    "check", STARTUP_CHECKS, ids=[" ".join(check.args) for check in STARTUP_CHECKS]
+)
+def test_command_imports_stay_lazy(check):
+    import_ms, packages = measure_startup(check.args)
+
+    assert not [name for name in check.forbidden if name in packages]
+    assert import_ms <= check.budget_ms * BUDGET_SCALE